@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: serves the read-only recipe, tag and ingredient
+# endpoints natively and hands everything else to Django.
+from recipe.asgi import AsyncRecipeAPI  # noqa: E402
+
+application = AsyncRecipeAPI(fallback=django_application)
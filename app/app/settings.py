@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+from .database import cache_from_env, database_from_env, env_bool, \
+    env_int, replicas_from_env, shards_from_env, sqlite_pragmas_from_env
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,22 +80,156 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': 'db.sqlite3',
-    }
+    'default': database_from_env(default_sqlite_name='db.sqlite3'),
+    **replicas_from_env(),
+    **shards_from_env(),
 }
 
-# For docker
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.environ.get('DB_NAME'),
-#         'USER': os.environ.get('DB_USER'),
-#         'HOST': os.environ.get('DB_HOST'),
-#         'PASSWORD': os.environ.get('DB_PASSWORD'),
-#     }
-# }
+# Shared by the workers when CACHE_URL is set, see app/database.py
+CACHES = {'default': cache_from_env()}
+
+# Safe (GET/HEAD) requests read from a replica; writes and everything
+# outside a request go to the primary. After a user writes, their reads
+# stay on the primary for DB_REPLICA_STICKY_SECONDS to hide replica lag;
+# the pin is kept in the cache, so replicas need a shared CACHE_URL.
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES
+                     if alias.startswith('replica')]
+DATABASE_REPLICA_STICKY_SECONDS = env_int('DB_REPLICA_STICKY_SECONDS', 10)
+# Always read these apps from the primary; a token created by a login
+# must be visible to the very next request.
+DATABASE_PRIMARY_ONLY_APPS = ['authtoken']
+
+# With DATABASE_SHARD_URLS set, each user's cookbook (the models of
+# DATABASE_SHARDED_APPS but DATABASE_UNSHARDED_MODELS) lives on one of
+# DATABASE_SHARDS, see core/sharding.py. Which one is cached for
+# SHARD_MAP_CACHE_SECONDS, so moving a user waits that long twice. Shard
+# number n hands out ids from n * DATABASE_SHARD_ID_STRIDE; with 32-bit
+# ids the default leaves room for 20 shards besides default.
+DATABASE_SHARDS = [alias for alias in DATABASES
+                   if alias.startswith('shard')]
+DATABASE_SHARDS = ['default', *DATABASE_SHARDS] if DATABASE_SHARDS else []
+DATABASE_SHARDED_APPS = ['recipe']
+DATABASE_UNSHARDED_MODELS = ['recipe.term']
+SHARD_MAP_CACHE_SECONDS = env_int('SHARD_MAP_CACHE_SECONDS', 30)
+DATABASE_SHARD_ID_STRIDE = env_int('DATABASE_SHARD_ID_STRIDE', 100000000)
+
+# Ping persistent connections at the start of each request and drop them
+# if the server went away, instead of failing the request.
+DB_CONN_HEALTH_CHECKS = env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+# Applied per connection when the SQLite backend is used
+SQLITE_PRAGMAS = sqlite_pragmas_from_env()
+
+# Per-route request metrics served at /metrics. With several worker
+# processes set METRICS_DIR to a directory shared by all of them so the
+# endpoint reports totals instead of whichever worker answered. Scrapers
+# send "Authorization: Bearer <METRICS_TOKEN>"; without a token only
+# staff signed in to the admin may read it.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = env_int('METRICS_FLUSH_INTERVAL', 1)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Queries slower than SLOW_QUERY_THRESHOLD_MS are EXPLAINed in the
+# background and appended to SLOW_QUERY_LOG (disabled when unset).
+# Summarise with `manage.py slow_queries`.
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or None
+SLOW_QUERY_THRESHOLD_MS = env_int('SLOW_QUERY_THRESHOLD_MS', 200)
+SLOW_QUERY_LOG_MAX_BYTES = env_int('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024)
+SLOW_QUERY_LOG_BACKUPS = env_int('SLOW_QUERY_LOG_BACKUPS', 3)
+
+# Request profiles are written to PROFILING_DIR (disabled when unset) for
+# a PROFILING_SAMPLE_RATE share of requests, or on demand for staff who
+# send `X-Profile: 1`. Inspect them with `manage.py profiles`.
+PROFILING_DIR = os.environ.get('PROFILING_DIR') or None
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'sample')
+PROFILING_MAX_FILES = env_int('PROFILING_MAX_FILES', 200)
+
+# Thread pool behind the native ASGI recipe handlers (app/asgi.py):
+# concurrent ORM jobs, and how many more may queue before shedding 503s
+ASYNC_API_THREADS = env_int('ASYNC_API_THREADS', 8)
+ASYNC_API_MAX_PENDING = env_int('ASYNC_API_MAX_PENDING', 256)
+
+# Change feed (recipe/events.py): broker class, events kept per user for
+# Last-Event-ID resume, per-stream backlog before a slow client is cut
+# off, keepalive comment interval, the reconnect delay sent to clients and
+# how long an EventSource ticket can be used to open a stream
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER',
+                               'recipe.events.InProcessBroker')
+EVENTS_HISTORY = env_int('EVENTS_HISTORY', 200)
+EVENTS_QUEUE_SIZE = env_int('EVENTS_QUEUE_SIZE', 1000)
+EVENTS_HEARTBEAT = env_int('EVENTS_HEARTBEAT', 15)
+EVENTS_RETRY_MS = env_int('EVENTS_RETRY_MS', 3000)
+EVENTS_TICKET_SECONDS = env_int('EVENTS_TICKET_SECONDS', 300)
+
+# Most changes returned by one page of recipe/sync/
+SYNC_PAGE_SIZE = env_int('SYNC_PAGE_SIZE', 500)
+
+# Seconds recipe/stats/ stays cached per user. Writes invalidate it, but
+# only in the cache of the process that made them unless CACHES is shared
+STATS_CACHE_TIMEOUT = env_int('STATS_CACHE_TIMEOUT', 300)
+
+# Keep pre-rendered recipe documents (recipe/documents.py) and answer
+# unfiltered recipe list/detail reads from them. After switching it on,
+# build the missing ones with `manage.py check_recipe_documents --repair`.
+RECIPE_DOCUMENTS = env_bool('RECIPE_DOCUMENTS')
+
+# Background tasks (core/tasks.py, run by `manage.py worker`): attempts
+# before a task is left failed, first retry delay doubling up to the
+# maximum, seconds without a heartbeat after which a running task's worker
+# is presumed dead, and how often idle worker threads look for due tasks
+TASK_MAX_ATTEMPTS = env_int('TASK_MAX_ATTEMPTS', 5)
+TASK_RETRY_DELAY = env_int('TASK_RETRY_DELAY', 10)
+TASK_RETRY_MAX_DELAY = env_int('TASK_RETRY_MAX_DELAY', 3600)
+TASK_LOCK_TIMEOUT = env_int('TASK_LOCK_TIMEOUT', 600)
+TASK_POLL_INTERVAL = env_int('TASK_POLL_INTERVAL', 1)
+
+# Rows removed per background step when an account is deleted
+ACCOUNT_DELETION_BATCH = env_int('ACCOUNT_DELETION_BATCH', 500)
+
+# Who sends recipe images once the view has checked access: unset for
+# Django itself, x-accel-redirect (nginx, with an internal location at
+# MEDIA_ACCEL_PREFIX aliasing MEDIA_ROOT) or x-sendfile (Apache/lighttpd)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX',
+                                    '/protected-media/')
+
+# Tag/ingredient names whose shared Term id each process keeps in memory
+TERM_CACHE_SIZE = env_int('TERM_CACHE_SIZE', 10000)
+
+# How long responses to requests with an Idempotency-Key are replayed
+# to retries, how long a retry waits for the first request to finish, and
+# how long a request that died keeps its key: longer than any request
+# can run (the server's worker timeout) and than the wait
+IDEMPOTENCY_KEY_TTL = env_int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_LOCK_TIMEOUT = env_int('IDEMPOTENCY_LOCK_TIMEOUT', 30)
+IDEMPOTENCY_LOCK_TTL = env_int('IDEMPOTENCY_LOCK_TTL', 300)
+
+# Hasher for new passwords: pbkdf2, argon2 (needs argon2-cffi) or bcrypt
+# (needs bcrypt). Hashes made by the others still verify and are
+# re-hashed with this one on the next successful login.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(
+    {'pbkdf2': 0, 'argon2': 2, 'bcrypt': 3}[
+        os.environ.get('PASSWORD_HASHER', 'pbkdf2')]
+))
+
+# Process pool doing the hashing (core/hashing.py), 0 hashes inline, and
+# how many more hashes may wait before login/signup shed 503s
+PASSWORD_HASHING_WORKERS = env_int('PASSWORD_HASHING_WORKERS', 2)
+PASSWORD_HASHING_MAX_PENDING = env_int('PASSWORD_HASHING_MAX_PENDING', 16)
+
+# Turns errors from below the views, like a full hashing pool, into
+# responses
+REST_FRAMEWORK = {
+    'EXCEPTION_HANDLER': 'core.views.exception_handler',
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -15,11 +15,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
+from core.views import HealthView, metrics_view
 
 urlpatterns = [
-                  path('admin/', admin.site.urls),
-                  path('api/user/', include('core.urls')),
-                  path('api/recipe/', include('recipe.urls'))
-              ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('admin/', admin.site.urls),
+    path('healthz', HealthView.as_view(), name='healthz'),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/user/', include('core.urls')),
+    path('api/recipe/', include('recipe.urls'))
+]
@@ -0,0 +1,62 @@
+"""
+Account deletion in the background.
+
+Deleting a user in one go makes Django's collector load every recipe,
+tag and ingredient the user owns and delete them in a single long
+transaction. Instead the account is deactivated and its tokens revoked
+right away, and the ``core.delete_account`` task removes the data in
+batches of ``ACCOUNT_DELETION_BATCH`` rows, re-queueing itself until
+nothing is left and the user row itself can go. Apps holding per-user
+data connect to ``purge_user`` and delete one batch per call with raw
+bulk deletes. ``AccountDeletion`` keeps count, see
+``manage.py account_deletions``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from . import sharding
+from .models import AccountDeletion, ShardAssignment
+from .tasks import task
+
+# Sent with ``user_id`` and ``limit``; receivers delete at most ``limit``
+# rows of the user's data and return how many went, 0 once none is left
+purge_user = Signal(providing_args=['user_id', 'limit'])
+
+
+def schedule_deletion(user):
+    """Deactivate ``user`` now and delete its data in the background"""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        Token.objects.filter(user=user).delete()
+        AccountDeletion.objects.get_or_create(user_id=user.pk)
+        delete_account.delay(user.pk)
+
+
+@task(name='core.delete_account')
+def delete_account(user_id):
+    """Delete one batch of the user's data, or the user once it is empty"""
+    user = get_user_model().objects.filter(pk=user_id, is_active=False) \
+        .first()
+    if user is None:
+        return
+    with sharding.for_user(user_id):
+        responses = purge_user.send(sender=type(user), user_id=user_id,
+                                    limit=settings.ACCOUNT_DELETION_BATCH)
+    removed = sum(count for _, count in responses)
+    progress = AccountDeletion.objects.filter(user_id=user_id)
+
+    if removed:
+        progress.update(batches=F('batches') + 1,
+                        removed=F('removed') + removed)
+        delete_account.delay(user_id)
+        return
+    with sharding.for_user(user_id), transaction.atomic():
+        user.delete()
+        ShardAssignment.objects.filter(user_id=user_id).delete()
+        progress.update(batches=F('batches') + 1, finished=timezone.now())
+    sharding.forget(user_id)
@@ -1,5 +1,30 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.checks import register
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Registers the account deletion task in every process
+        from . import accounts  # noqa: F401
+        from .checks import check_idempotency_lock, check_shard_vendors, \
+            check_shared_cache
+        from .db import apply_sqlite_pragmas, close_unusable_connections
+        from .metrics import install_query_counter
+        from .sharding import assign_new_user, reserve_shard_ids
+        from .slow_queries import install_slow_query_detector
+
+        connection_created.connect(apply_sqlite_pragmas)
+        connection_created.connect(install_query_counter)
+        connection_created.connect(install_slow_query_detector)
+        request_started.connect(close_unusable_connections)
+        register(check_shared_cache)
+        register(check_idempotency_lock)
+        register(check_shard_vendors)
+        post_save.connect(assign_new_user, sender=settings.AUTH_USER_MODEL)
+        post_migrate.connect(reserve_shard_ids)
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+from rest_framework.authentication import TokenAuthentication
+
+
+class _TokenKeyParser(TokenAuthentication):
+    """Validate the Authorization header and return the key unchecked"""
+
+    def authenticate_credentials(self, key):
+        return key
+
+
+class AsyncTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication for native ASGI handlers: the header is parsed on
+    the event loop, the token lookup runs on a BoundedExecutor
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    async def authenticate_async(self, authorization):
+        """
+        Return ``(user, token)``, or None when no token was sent; raises
+        AuthenticationFailed exactly like TokenAuthentication
+        """
+        request = SimpleNamespace(META={'HTTP_AUTHORIZATION': authorization})
+        key = _TokenKeyParser().authenticate(request)
+        if key is None:
+            return None
+        return await self.executor.run(self.authenticate_credentials, key)
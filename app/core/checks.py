@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Error
+from django.db import connections
+
+# Backends whose entries only the process that wrote them can see
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Replicas need the read-your-writes pin to reach every worker"""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DATABASE_REPLICAS and backend in LOCAL_CACHES:
+        return [Error(
+            'DATABASE_REPLICAS needs a cache shared by all workers.',
+            hint='Set CACHE_URL, e.g. redis://host:6379/0 or '
+                 'db://cache_table after `manage.py createcachetable`.',
+            id='core.E001',
+        )]
+    return []
+
+
+def check_idempotency_lock(app_configs, **kwargs):
+    """A retry must not outwait the lock of the request it waits for"""
+    if settings.IDEMPOTENCY_LOCK_TTL <= settings.IDEMPOTENCY_LOCK_TIMEOUT:
+        return [Error(
+            'IDEMPOTENCY_LOCK_TTL must be longer than '
+            'IDEMPOTENCY_LOCK_TIMEOUT.',
+            hint='A retry that waits longer than the first request holds '
+                 'its key runs the view a second time.',
+            id='core.E002',
+        )]
+    return []
+
+
+def check_shard_vendors(app_configs, **kwargs):
+    """Migrating a shard gives it an id range in backend specific SQL"""
+    from .sharding import ID_RANGE_VENDORS
+
+    return [Error(
+        f'Shard {alias!r} is on {connections[alias].vendor}, which has no '
+        f'id ranges.',
+        hint=f'Put shards on one of: {", ".join(ID_RANGE_VENDORS)}.',
+        id='core.E003',
+    ) for alias in settings.DATABASE_SHARDS[1:]
+        if connections[alias].vendor not in ID_RANGE_VENDORS]
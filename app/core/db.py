@@ -0,0 +1,63 @@
+import time
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Tune every new SQLite connection with settings.SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def close_unusable_connections(**kwargs):
+    """
+    Health check persistent connections before a request reuses them,
+    so a restarted database costs one reconnect instead of a 500
+    """
+    if not getattr(settings, 'DB_CONN_HEALTH_CHECKS', False):
+        return
+
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def probe_database(alias=DEFAULT_DB_ALIAS):
+    """
+    Round-trip a ``SELECT 1`` through the database and return the elapsed
+    seconds; raises ``OperationalError`` when the database is unreachable
+    """
+    connection = connections[alias]
+    start = time.perf_counter()
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return time.perf_counter() - start
+
+
+def delete_in(model, field, values, using):
+    """
+    ``DELETE FROM <model> WHERE <field> IN (values)`` as one statement:
+    no rows are loaded and no signals or cascades run. Return how many
+    rows went
+    """
+    if not values:
+        return 0
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    opts = model._meta
+    column = opts.pk.column if field == 'pk' else opts.get_field(field).column
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(opts.db_table)} '
+                       f'WHERE {quote(column)} IN ({placeholders})',
+                       list(values))
+        return cursor.rowcount
@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.db import close_old_connections
+
+
+class BoundedExecutor:
+    """
+    Run blocking ORM and serialization work for native async handlers on a
+    dedicated thread pool.
+
+    At most ``max_workers`` jobs run at once and at most ``max_pending``
+    wait for a thread; beyond that ``Overloaded`` is raised immediately so
+    the caller can shed load instead of queueing without bound.
+    """
+
+    class Overloaded(Exception):
+        pass
+
+    def __init__(self, max_workers, max_pending, name='async-orm'):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix=name)
+        self.in_flight = 0
+
+    async def run(self, func, *args, **kwargs):
+        if self.in_flight >= self.max_workers + self.max_pending:
+            raise self.Overloaded()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, partial(self._call, func, *args, **kwargs)
+            )
+        finally:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _call(func, *args, **kwargs):
+        # Pool threads keep their connections between jobs, so apply the
+        # same CONN_MAX_AGE/health rules Django applies around requests
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
@@ -0,0 +1,143 @@
+"""
+Password hashing on a dedicated process pool.
+
+PBKDF2 and Argon2 burn tens of milliseconds of CPU per call; run inline
+they hold the request worker (and the GIL), so a burst of logins starves
+every other endpoint. ``User.set_password`` and ``User.check_password``
+send the work to a small process pool instead. Once
+``PASSWORD_HASHING_WORKERS + PASSWORD_HASHING_MAX_PENDING`` calls are in
+flight, further ones fail fast with ``HashingOverloaded`` rather than
+queueing; core.views.exception_handler answers it with a 503.
+``PASSWORD_HASHING_WORKERS = 0`` hashes inline.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+from . import metrics
+
+
+class HashingOverloaded(Exception):
+    """The pool and its queue are full"""
+
+
+def _init_worker():
+    # Spawned workers start from scratch; hashers read PASSWORD_HASHERS
+    if not apps.ready:
+        django.setup()
+
+
+def _encode(password):
+    return hashers.make_password(password)
+
+
+def _verify(password, encoded):
+    """``(valid, must_update)`` using Django's own upgrade rules"""
+    must_update = []
+    valid = hashers.check_password(password, encoded,
+                                   setter=lambda raw: must_update.append(1))
+    return valid, bool(must_update)
+
+
+def _timed(func, *args):
+    """Runs in the pool: ``(result, wall clock start, duration)``"""
+    started = time.time()
+    start = time.perf_counter()
+    result = func(*args)
+    return result, started, time.perf_counter() - start
+
+
+class HashingPool:
+    """Bounded process pool, created lazily once per (forked) process"""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.executor = None
+        self.pid = None
+
+    def run(self, operation, func, *args):
+        labels = (('operation', operation),)
+        if not self.workers:
+            result, _, duration = _timed(func, *args)
+            metrics.registry.observe('password_hash_duration_seconds',
+                                     labels, duration)
+            return result
+
+        with self.lock:
+            if self.in_flight >= self.workers + self.max_pending:
+                metrics.registry.inc('password_hash_rejected_total', labels)
+                raise HashingOverloaded()
+            self.in_flight += 1
+            executor = self._executor()
+        submitted = time.time()
+        try:
+            result, started, duration = \
+                executor.submit(_timed, func, *args).result()
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next call
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+        metrics.registry.observe('password_hash_queue_wait_seconds',
+                                 labels, max(0.0, started - submitted))
+        metrics.registry.observe('password_hash_duration_seconds', labels,
+                                 duration)
+        return result
+
+    def _executor(self):
+        # gunicorn forks workers after preloading; never reuse the
+        # master's pool (or its pipes) in a child
+        if self.executor is None or self.pid != os.getpid():
+            # spawn, not fork: the parent has request and metrics threads
+            # whose locks a forked child could inherit mid-use
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            self.pid = os.getpid()
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None and self.pid == os.getpid():
+            self.executor.shutdown()
+        self.executor = None
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = HashingPool(settings.PASSWORD_HASHING_WORKERS,
+                            settings.PASSWORD_HASHING_MAX_PENDING)
+    return _pool
+
+
+def make_password(password):
+    if password is None:
+        # Unusable password, nothing to hash
+        return hashers.make_password(None)
+    return get_pool().run('hash', _encode, password)
+
+
+def check_password(password, encoded):
+    """Return ``(valid, must_update)``"""
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    return get_pool().run('verify', _verify, password, encoded)
@@ -0,0 +1,128 @@
+"""
+Idempotency keys for retried writes.
+
+A client that times out doesn't know whether its POST went through, so it
+sends the request again. Sent with an ``Idempotency-Key`` header, the
+views wrapped with ``idempotent`` run once per user, method, path and key:
+the first response is kept in the ``IdempotencyKey`` table for
+``IDEMPOTENCY_KEY_TTL`` seconds and replayed to retries (with
+``Idempotent-Replayed: true``) instead of running the view again, by
+whichever process they reach. Server errors aren't kept, so those can be
+retried. Retries arriving while the first request is still running wait
+for its response for up to ``IDEMPOTENCY_LOCK_TIMEOUT`` seconds, then get
+a 409. A request that died without answering holds its key for
+``IDEMPOTENCY_LOCK_TTL`` seconds, which has to be longer than any request
+can run. ``manage.py purge_idempotency_keys`` removes expired keys.
+"""
+import functools
+import hashlib
+import json
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+METHODS = ('POST', 'PATCH')
+MAX_KEY_LENGTH = 255
+# Seconds between looks for the response of a request still running
+POLL_INTERVAL = 0.05
+# Response headers set by views worth replaying
+HEADERS = ('Location',)
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is in progress.'
+    default_code = 'idempotency_conflict'
+
+
+def _hash_key(request, key):
+    """Keys are only unique per client, and a key names one request"""
+    user = request.user.pk if request.user.is_authenticated else None
+    scope = f'{user}:{request.method}:{request.path}:{key}'
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _acquire(keys, key, token):
+    """
+    Take ``key`` for the request holding ``token``; False when another
+    request holds it or answered already
+    """
+    now = timezone.now()
+    lock = {
+        'token': token, 'status': None, 'data': '', 'headers': '',
+        'locked_until': now + timedelta(
+            seconds=settings.IDEMPOTENCY_LOCK_TTL),
+        'expires': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    # Expired keys and those of requests that died are up for grabs
+    if keys.filter(Q(expires__lt=now)
+                   | Q(status__isnull=True, locked_until__lt=now),
+                   key=key).update(**lock):
+        return True
+    try:
+        with transaction.atomic(using=keys.db):
+            keys.create(key=key, **lock)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _replay(stored):
+    response = Response(data=json.loads(stored.data), status=stored.status)
+    for name, value in json.loads(stored.headers).items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """Run a view method once per Idempotency-Key, replaying its response"""
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key or request.method not in METHODS:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError(
+                {'detail': f'Idempotency-Key is longer than '
+                           f'{MAX_KEY_LENGTH} characters.'})
+
+        keys = IdempotencyKey.objects.using(
+            router.db_for_write(IdempotencyKey))
+        key = _hash_key(request, key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        while not _acquire(keys, key, token):
+            stored = keys.filter(key=key, status__isnull=False).first()
+            if stored is not None:
+                return _replay(stored)
+            if time.monotonic() >= deadline:
+                raise RequestInProgress()
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code < 500:
+                headers = {name: response[name] for name in HEADERS
+                           if response.has_header(name)}
+                keys.filter(key=key, token=token).update(
+                    status=response.status_code, locked_until=None,
+                    data=json.dumps(response.data, cls=JSONEncoder),
+                    headers=json.dumps(headers))
+            return response
+        finally:
+            # Nothing kept: let a retry run it again
+            keys.filter(key=key, token=token, status__isnull=True).delete()
+
+    return wrapper
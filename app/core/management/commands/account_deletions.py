@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from core.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    """Report the progress of account deletions"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Include finished deletions')
+
+    def handle(self, *args, **options):
+        deletions = AccountDeletion.objects.order_by('requested')
+        if not options['all']:
+            deletions = deletions.filter(finished__isnull=True)
+
+        for deletion in deletions:
+            state = f'finished {deletion.finished:%Y-%m-%d %H:%M}' \
+                if deletion.finished else 'in progress'
+            self.stdout.write(
+                f'user {deletion.user_id}: {state}, requested '
+                f'{deletion.requested:%Y-%m-%d %H:%M}, '
+                f'{deletion.removed} rows in {deletion.batches} batches'
+            )
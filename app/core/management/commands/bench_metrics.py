@@ -0,0 +1,39 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+from core import metrics
+from core.middleware import MetricsMiddleware
+
+
+class Command(BaseCommand):
+    """Measure the per-request overhead of MetricsMiddleware"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        request = RequestFactory().get('/api/recipe/recipe/')
+        request.resolver_match = resolve('/api/recipe/recipe/')
+        response = HttpResponse(b'{}')
+
+        def view(request):
+            return response
+
+        middleware = MetricsMiddleware(view)
+        registry = metrics.registry
+        metrics.registry = metrics.Registry()
+        try:
+            bare = min(timeit.repeat(lambda: view(request),
+                                     number=number, repeat=3))
+            wrapped = min(timeit.repeat(lambda: middleware(request),
+                                        number=number, repeat=3))
+        finally:
+            metrics.registry = registry
+
+        self.stdout.write(
+            f'MetricsMiddleware overhead: '
+            f'{(wrapped - bare) / number * 1e6:.2f} us/request'
+        )
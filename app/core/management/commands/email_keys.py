@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Fill in User.email_key and report emails differing only in case"""
+    help = (
+        'Fill in the lower cased email logins are looked up by for users '
+        'saved before it existed, then list accounts whose emails differ '
+        'only in case. A unique index keeps each key to one account, so '
+        'only one of those has the key; the others keep none and '
+        'log in with their exact email only until their email changes. '
+        'Change one email of each listed pair and run this again until it '
+        'reports 0 colliding emails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        pending = User.objects.filter(email_key__isnull=True) \
+            .order_by('pk').only('pk', 'email')
+        filled, last, collisions = 0, 0, {}
+        while True:
+            users = list(pending.filter(pk__gt=last)
+                         [:options['batch_size']])
+            if not users:
+                break
+            last = users[-1].pk
+            keys = {user.pk: User.objects.email_key(user.email)
+                    for user in users}
+            taken = set(User.objects.filter(email_key__in=keys.values())
+                        .values_list('email_key', flat=True))
+            keyed = []
+            for user in users:
+                key = keys[user.pk]
+                if key in taken:
+                    collisions.setdefault(key, []).append(user)
+                    continue
+                taken.add(key)
+                user.email_key = key
+                keyed.append(user)
+            User.objects.bulk_update(keyed, ['email_key'])
+            filled += len(keyed)
+        self.stdout.write(f'Filled in {filled} email keys')
+
+        for key, users in sorted(collisions.items()):
+            holder = User.objects.get(email_key=key)
+            self.stdout.write(f'{key}: ' + ', '.join(
+                f'user {user.pk} ({user.email})'
+                for user in sorted([holder, *users],
+                                   key=lambda user: user.pk)))
+        self.stdout.write(f'{len(collisions)} colliding emails')
@@ -0,0 +1,67 @@
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+from core import sharding
+from core.models import ShardAssignment
+
+
+class Command(BaseCommand):
+    """Move a user's cookbook to another shard"""
+    help = (
+        'Copy a user\'s rows to another shard and switch the shard map to '
+        'it. Writes by the user fail with 503 while the rows are copied; '
+        'reads keep being served from the old shard until the switch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('alias', help='One of DATABASE_SHARDS')
+        parser.add_argument(
+            '--settle', type=float, default=None,
+            help='Seconds other processes need to see a change of the '
+                 'shard map, SHARD_MAP_CACHE_SECONDS by default')
+
+    def handle(self, *args, **options):
+        user_id, target = options['user_id'], options['alias']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f"'{target}' is not in DATABASE_SHARDS")
+        if not get_user_model().objects.filter(pk=user_id).exists():
+            raise CommandError(f'No user {user_id}')
+        settle = options['settle']
+        if settle is None:
+            settle = settings.SHARD_MAP_CACHE_SECONDS
+
+        assignment, _ = ShardAssignment.objects.get_or_create(
+            user_id=user_id, defaults={'alias': DEFAULT_DB_ALIAS})
+        source = assignment.alias
+        if source == target:
+            self.stdout.write(f'user {user_id} is on {target} already')
+            return
+
+        self.update(user_id, settle, locked=True)
+        try:
+            # Leftovers of an earlier move that failed
+            sharding.delete_user(user_id, target)
+            copied = sharding.copy_user(user_id, source, target)
+        except IntegrityError as error:
+            self.update(user_id, 0, locked=False)
+            raise CommandError(
+                f'Ids collide on {target}, user {user_id} stays on '
+                f'{source}: {error}')
+        except BaseException:
+            self.update(user_id, 0, locked=False)
+            raise
+        # Readers that still have the old shard cached finish there
+        self.update(user_id, settle, alias=target, locked=False)
+        removed = sharding.delete_user(user_id, source)
+        self.stdout.write(
+            f'user {user_id}: copied {copied} rows from {source} to '
+            f'{target}, removed {removed} from {source}')
+
+    @staticmethod
+    def update(user_id, settle, **fields):
+        ShardAssignment.objects.filter(user_id=user_id).update(**fields)
+        sharding.forget(user_id)
+        time.sleep(settle)
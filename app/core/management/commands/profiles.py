@@ -0,0 +1,89 @@
+import pstats
+from collections import Counter
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core import profiling
+
+
+class Command(BaseCommand):
+    """List recent request profiles per endpoint and merge them"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR,
+                            help='Defaults to settings.PROFILING_DIR')
+        parser.add_argument('--route', default=None,
+                            help='Route to merge, e.g. recipe:recipe-list')
+        parser.add_argument('--format', choices=profiling.EXTENSIONS,
+                            default='cprofile')
+        parser.add_argument('--last', type=int, default=20,
+                            help='Merge at most this many recent profiles')
+        parser.add_argument('--sort', default='cumulative',
+                            help='pstats sort key for cProfile output')
+        parser.add_argument('--limit', type=int, default=25,
+                            help='Rows of merged output to print')
+        parser.add_argument('--output', default=None,
+                            help='Write the merged profile to this file')
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError('No --dir given and PROFILING_DIR is not set')
+
+        profiles = profiling.list_profiles(options['dir'])
+        if options['route'] is None:
+            self._list(profiles)
+            return
+
+        extension = profiling.EXTENSIONS[options['format']]
+        slug = profiling.route_slug(options['route'])
+        paths = [
+            profile['path'] for profile in profiles
+            if profile['route'] == slug and profile['format'] == extension
+        ][-options['last']:]
+        if not paths:
+            raise CommandError(f"No {options['format']} profiles for "
+                               f"{options['route']}")
+
+        self.stdout.write(f'Merged {len(paths)} profiles of '
+                          f"{options['route']}")
+        if options['format'] == 'cprofile':
+            self._merge_cprofile(paths, options)
+        else:
+            self._merge_collapsed(paths, options)
+
+    def _list(self, profiles):
+        routes = {}
+        for profile in profiles:
+            routes.setdefault(profile['route'], []).append(profile)
+        if not routes:
+            self.stdout.write('No profiles recorded')
+        for route, entries in sorted(routes.items()):
+            latest = datetime.fromtimestamp(entries[-1]['created'])
+            formats = Counter(entry['format'] for entry in entries)
+            self.stdout.write(
+                f'{route}: {len(entries)} profiles, latest '
+                f'{latest:%Y-%m-%d %H:%M:%S} ('
+                + ', '.join(f'{count} {fmt}' for fmt, count
+                            in sorted(formats.items())) + ')'
+            )
+
+    def _merge_cprofile(self, paths, options):
+        stats = pstats.Stats(*paths, stream=self.stdout)
+        stats.sort_stats(options['sort']).print_stats(options['limit'])
+        if options['output']:
+            stats.dump_stats(options['output'])
+
+    def _merge_collapsed(self, paths, options):
+        stacks = Counter()
+        for path in paths:
+            with open(path) as fh:
+                for line in fh:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    stacks[stack] += int(count)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                for stack, count in stacks.items():
+                    fh.write(f'{stack} {count}\n')
+        for stack, count in stacks.most_common(options['limit']):
+            self.stdout.write(f"{count:6d} {stack.rsplit(';', 1)[-1]}")
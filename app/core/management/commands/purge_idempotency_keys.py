@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Remove expired Idempotency-Key responses"""
+    help = (
+        'Delete the responses kept for Idempotency-Key retries once they '
+        'are older than IDEMPOTENCY_KEY_TTL. Run it daily, e.g. from cron.'
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(
+            expires__lt=timezone.now()).delete()
+        self.stdout.write(f'Removed {deleted} expired idempotency keys')
@@ -0,0 +1,119 @@
+import gc
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from core import metrics
+
+WSGI_APP = 'app.wsgi:application'
+ASGI_APP = 'app.asgi:application'
+ASGI_WORKER = 'uvicorn.workers.UvicornWorker'
+
+
+def default_workers():
+    """Honour WEB_CONCURRENCY, otherwise 2 * usable cores + 1"""
+    if os.environ.get('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return cores * 2 + 1
+
+
+def pre_fork(server, worker):
+    """
+    Runs in the master before each fork: drop DB connections opened while
+    preloading so workers never share a socket, and move preloaded objects
+    out of the collector's reach so GC passes don't dirty shared pages
+    """
+    connections.close_all()
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    """Persist the worker's metrics before it is recycled"""
+    metrics.flush(force=True)
+
+
+class Command(BaseCommand):
+    """Run the app under a multi-worker gunicorn server"""
+    help = (
+        'Serve the project with gunicorn. Send HUP to the master for a '
+        'graceful reload of all workers, TERM for a graceful shutdown.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=os.environ.get(
+            'BIND', '0.0.0.0:8000'))
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Defaults to 2 * CPU cores + 1')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Threads per WSGI worker')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve app/asgi.py with uvicorn workers')
+        parser.add_argument('--max-requests', type=int, default=1000,
+                            help='Recycle a worker after this many requests '
+                                 '(0 disables recycling)')
+        parser.add_argument('--max-requests-jitter', type=int, default=100,
+                            help='Random spread so workers do not all '
+                                 'recycle at once')
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument('--graceful-timeout', type=int, default=30,
+                            help='Seconds workers get to finish in-flight '
+                                 'requests on restart')
+        parser.add_argument('--keep-alive', type=int, default=5)
+        parser.add_argument('--no-preload', action='store_false',
+                            dest='preload',
+                            help='Import the app in every worker instead '
+                                 'of once in the master')
+        parser.add_argument('--pid', default=None,
+                            help='Write the master pid to this file')
+
+    def handle(self, *args, **options):
+        try:
+            from gunicorn.app.base import BaseApplication
+            from gunicorn.util import import_app
+        except ImportError:
+            raise CommandError('gunicorn is required, pip install gunicorn')
+
+        app_uri = ASGI_APP if options['asgi'] else WSGI_APP
+        config = self.gunicorn_config(options)
+
+        class DjangoApplication(BaseApplication):
+
+            def load_config(self):
+                for key, value in config.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return import_app(app_uri)
+
+        self.stdout.write(
+            f"Serving {app_uri} on {config['bind']} with "
+            f"{config['workers']} workers"
+        )
+        DjangoApplication().run()
+
+    def gunicorn_config(self, options):
+        """Translate command options into gunicorn settings"""
+        config = {
+            'bind': options['bind'],
+            'workers': options['workers'] or default_workers(),
+            'threads': options['threads'],
+            'preload_app': options['preload'],
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests_jitter'],
+            'timeout': options['timeout'],
+            'graceful_timeout': options['graceful_timeout'],
+            'keepalive': options['keep_alive'],
+            'pre_fork': pre_fork,
+            'worker_exit': worker_exit,
+            'accesslog': '-',
+        }
+        if options['asgi']:
+            config['worker_class'] = ASGI_WORKER
+        elif options['threads'] > 1:
+            config['worker_class'] = 'gthread'
+        if options['pid']:
+            config['pidfile'] = options['pid']
+        return config
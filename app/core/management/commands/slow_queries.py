@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.slow_queries import read_log
+
+SORT_KEYS = ('total', 'max', 'count', 'mean')
+
+
+class Command(BaseCommand):
+    """Summarise the slow query log by statement"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SLOW_QUERY_LOG,
+                            help='Defaults to settings.SLOW_QUERY_LOG')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument('--route', default=None,
+                            help='Only queries issued by this route')
+
+    def handle(self, *args, **options):
+        if not options['log']:
+            raise CommandError('No log given and SLOW_QUERY_LOG is not set')
+
+        groups = {}
+        for record in read_log(options['log']):
+            if options['route'] and record['route'] != options['route']:
+                continue
+            group = groups.setdefault(record['fingerprint'], {
+                'sql': record['sql'], 'count': 0, 'total': 0.0, 'max': 0.0,
+                'routes': set(), 'plan': None, 'stack': record['stack'],
+            })
+            group['count'] += 1
+            group['total'] += record['duration_ms']
+            group['max'] = max(group['max'], record['duration_ms'])
+            group['routes'].add(record['route'] or '-')
+            if record.get('plan'):
+                group['plan'] = record['plan']
+
+        for group in groups.values():
+            group['mean'] = group['total'] / group['count']
+
+        ranked = sorted(groups.items(), key=lambda item: item[1][
+            options['sort']], reverse=True)[:options['top']]
+        if not ranked:
+            self.stdout.write('No slow queries recorded')
+
+        for digest, group in ranked:
+            self.stdout.write(self.style.WARNING(
+                f"[{digest}] {group['count']}x total {group['total']:.1f}ms "
+                f"max {group['max']:.1f}ms mean {group['mean']:.1f}ms "
+                f"routes {', '.join(sorted(group['routes']))}"
+            ))
+            self.stdout.write(f"  {group['sql']}")
+            for line in group['plan'] or []:
+                self.stdout.write(f'  plan: {line}')
+            for frame in group['stack'][-3:]:
+                self.stdout.write(f'  at {frame}')
@@ -1,19 +1,52 @@
+import random
 import time
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from core.db import probe_database
 
 
 class Command(BaseCommand):
     """Command for pause execution until the database is available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to wait for')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Give up after this many seconds')
+        parser.add_argument('--initial-delay', type=float, default=0.1,
+                            help='First retry delay in seconds')
+        parser.add_argument('--max-delay', type=float, default=5,
+                            help='Upper bound for the retry delay')
+
     def handle(self, *args, **options):
-        print("Waiting for database")
-        db_connection = None
-        while not db_connection:
+        self.stdout.write("Waiting for database")
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        attempt = 0
+
+        while True:
             try:
-                db_connection = connections['default']
+                latency = probe_database(options['database'])
+                break
             except OperationalError:
-                print(self.style.ERROR("Database not available"))
-                time.sleep(1)
-        print(self.style.SUCCESS("Database available"))
+                self.stdout.write(self.style.ERROR("Database not available"))
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandError(
+                    f"Database not available after {options['timeout']}s"
+                )
+            time.sleep(min(self._backoff(attempt, options), remaining))
+            attempt += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Database available after {time.monotonic() - start:.2f}s "
+            f"({attempt + 1} attempts, round trip {latency * 1000:.1f}ms)"
+        ))
+
+    def _backoff(self, attempt, options):
+        """Exponential backoff with equal jitter: half fixed, half random"""
+        ceiling = min(options['max_delay'],
+                      options['initial_delay'] * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
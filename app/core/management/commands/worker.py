@@ -0,0 +1,53 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+from core.tasks import Worker
+
+
+def _work(threads, burst):
+    worker = Worker(threads)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: worker.stop())
+    worker.run(burst=burst)
+
+
+class Command(BaseCommand):
+    """Run background tasks stored by core.tasks"""
+    help = (
+        'Run due background tasks on a pool of threads, in one or more '
+        'processes. TERM or INT lets running tasks finish, then exits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Tasks run concurrently per process')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes, for CPU bound tasks')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        # Every app's tasks module registers its tasks on import
+        autodiscover_modules('tasks')
+        threads, burst = options['threads'], options['burst']
+        if options['processes'] <= 1:
+            return _work(threads, burst)
+
+        # Children must not share the parent's database sockets
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=_work, args=(threads, burst))
+                    for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+
+        def stop(*args):
+            for child in children:
+                child.terminate()
+        signal.signal(signal.SIGTERM, stop)
+        # INT from a terminal reaches the children directly
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for child in children:
+            child.join()
@@ -0,0 +1,308 @@
+"""
+Minimal Prometheus style metrics registry.
+
+Every process aggregates into an in-memory ``Registry``. When
+``settings.METRICS_DIR`` is set, processes periodically write a snapshot
+to ``<METRICS_DIR>/metrics-<pid>-<start>.json`` (``start`` tells apart
+processes that got the same pid in turn) and the metrics endpoint merges
+all snapshots, so the numbers are totals across gunicorn workers.
+Snapshots left behind by workers that exited are folded into
+``archive.json`` so recycled workers don't leak files or lose counts.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Any other verb a client sends is counted as "other", so junk requests
+# can't add label values without bound
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE',
+                          'OPTIONS', 'TRACE', 'CONNECT'))
+
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests served', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency', LATENCY_BUCKETS),
+    'http_response_render_seconds': (
+        'histogram', 'Time spent rendering (serializing) the response',
+        LATENCY_BUCKETS),
+    'http_response_size_bytes': (
+        'histogram', 'Response body size', SIZE_BUCKETS),
+    'db_queries_per_request': (
+        'histogram', 'Database queries executed per request', QUERY_BUCKETS),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time spent executing database queries', None),
+    'password_hash_duration_seconds': (
+        'histogram', 'CPU time of one password hash or verification',
+        LATENCY_BUCKETS),
+    'password_hash_queue_wait_seconds': (
+        'histogram', 'Time a password hash waited for a pool process',
+        LATENCY_BUCKETS),
+    'password_hash_rejected_total': (
+        'counter', 'Password hashes shed because the pool was full', None),
+    'tasks_processed_total': (
+        'counter', 'Background tasks run, by outcome', None),
+    'task_duration_seconds': (
+        'histogram', 'Time one background task ran', LATENCY_BUCKETS),
+    'task_queue_latency_seconds': (
+        'histogram', 'Time a background task waited after it was due',
+        LATENCY_BUCKETS),
+}
+
+
+class Registry:
+    """Thread safe counters and histograms keyed by (metric, labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.next_flush = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self._observe(name, labels, value)
+
+    def record_request(self, route, method, status, elapsed, query_count,
+                       query_time, render_time, size):
+        """Record everything about one request while holding the lock once"""
+        labels = (('route', route),)
+        if method not in HTTP_METHODS:
+            method = 'other'
+        counters = self.counters
+        observe = self._observe
+        with self.lock:
+            key = ('http_requests_total',
+                   labels + (('method', method), ('status', status)))
+            counters[key] = counters.get(key, 0) + 1
+            key = ('db_query_duration_seconds_total', labels)
+            counters[key] = counters.get(key, 0) + query_time
+            observe('http_request_duration_seconds', labels, elapsed)
+            observe('db_queries_per_request', labels, query_count)
+            if render_time is not None:
+                observe('http_response_render_seconds', labels, render_time)
+            if size is not None:
+                observe('http_response_size_bytes', labels, size)
+
+    def _observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        values = self.histograms.get(key)
+        if values is None:
+            # one slot per bucket, +Inf, sum
+            values = self.histograms[key] = [0] * (len(buckets) + 2)
+        values[bisect_left(buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [
+                    [name, [list(pair) for pair in labels], value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, [list(pair) for pair in labels], list(values)]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, labels, value in snapshot['counters']:
+                key = (name, _labels(labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, _labels(labels))
+                current = self.histograms.get(key)
+                if current is None:
+                    self.histograms[key] = list(values)
+                else:
+                    for index, value in enumerate(values):
+                        current[index] += value
+
+
+def _labels(pairs):
+    return tuple(tuple(pair) for pair in pairs)
+
+
+registry = Registry()
+
+# The request being served in this context and its [query count, seconds]
+current_request = ContextVar('metrics_current_request', default=None)
+query_stats = ContextVar('metrics_query_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper adding every query to the current request's stats"""
+    stats = query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Hook count_queries into every connection once, when it is opened,
+    rather than wrapping each connection on every request
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _snapshot_path(directory, pid, start):
+    return os.path.join(directory, f'metrics-{pid}-{start}.json')
+
+
+def _process_start(pid):
+    """When a process started, in clock ticks since boot; 0 if unknown"""
+    try:
+        with open(f'/proc/{pid}/stat') as fh:
+            stat = fh.read()
+    except OSError:
+        return 0
+    # Field 22, counting on from the command name, which may hold spaces
+    return int(stat.rsplit(')', 1)[1].split()[19])
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid, start):
+    """Whether the process that wrote a snapshot still runs"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Otherwise a later process was given the same pid
+    return not start or _process_start(pid) == start
+
+
+def flush(force=False):
+    """Write this process's snapshot if the flush interval has passed"""
+    now = time.monotonic()
+    if not force and now < registry.next_flush:
+        return
+    registry.next_flush = now + getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return
+    pid = os.getpid()
+    _write_json(_snapshot_path(directory, pid, _process_start(pid)),
+                registry.snapshot())
+
+
+def collect():
+    """Return a registry holding the totals of every process"""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return registry
+
+    flush(force=True)
+    total = Registry()
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, 'archive.json')
+        archive = Registry()
+        archived = _read_json(archive_path)
+        if archived:
+            archive.merge(archived)
+
+        compacted = False
+        for filename in os.listdir(directory):
+            if not (filename.startswith('metrics-')
+                    and filename.endswith('.json')):
+                continue
+            path = os.path.join(directory, filename)
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            pid, _, start = filename[len('metrics-'):-len('.json')] \
+                .partition('-')
+            if _alive(int(pid), int(start or 0)):
+                total.merge(snapshot)
+            else:
+                archive.merge(snapshot)
+                os.remove(path)
+                compacted = True
+
+        if compacted:
+            _write_json(archive_path, archive.snapshot())
+    total.merge(archive.snapshot())
+    return total
+
+
+def render(source=None):
+    """Render a registry in the Prometheus text exposition format"""
+    source = source or registry
+    snapshot = source.snapshot()
+    by_name = {}
+    for name, labels, value in snapshot['counters']:
+        by_name.setdefault(name, []).append((labels, value))
+    for name, labels, values in snapshot['histograms']:
+        by_name.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, description, buckets = METRICS[name]
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [['le', bound]])
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"'))
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+atexit.register(flush, force=True)
@@ -0,0 +1,125 @@
+import random
+import time
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+from . import metrics, profiling
+from .routers import RequestState, _request_state, pin_to_primary
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Expose the current request to ReplicaRouter and pin users who wrote
+    something to the primary, so they read their own writes
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        user = state.user()
+        if state.wrote and user is not None and settings.DATABASE_REPLICAS:
+            pin_to_primary(user)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record latency, database usage, render time and response size per
+    resolved route (``recipe:recipe-list``, ``core:token``...)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+        request_token = metrics.current_request.set(request)
+        queries_token = metrics.query_stats.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.query_stats.reset(queries_token)
+            metrics.current_request.reset(request_token)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        metrics.registry.record_request(
+            route=match.view_name if match else '<unresolved>',
+            method=request.method,
+            status=response.status_code,
+            elapsed=elapsed,
+            query_count=queries[0],
+            query_time=queries[1],
+            render_time=getattr(response, '_metrics_render_time', None),
+            size=None if response.streaming else len(response.content),
+        )
+        metrics.flush()
+        return response
+
+    def process_template_response(self, request, response):
+        """Time DRF's rendering of the response data"""
+        start = time.perf_counter()
+
+        def rendered(response):
+            response._metrics_render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests, or any request from a staff user that
+    sends ``X-Profile: 1`` (``X-Profile: sample`` for the sampling
+    profiler) along with their API token
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILING_DIR:
+            return self.get_response(request)
+
+        mode = self._requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        recorder = profiling.RECORDERS[mode]()
+        recorder.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorder.stop()
+
+        match = request.resolver_match
+        name = profiling.save_profile(
+            recorder, match.view_name if match else None
+        )
+        response['X-Profile-File'] = name
+        return response
+
+    def _requested_mode(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        if header and self._is_staff_token(request):
+            return 'sample' if header == 'sample' else 'cprofile'
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return settings.PROFILING_MODE
+        return None
+
+    def _is_staff_token(self, request):
+        keyword, _, key = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+        if keyword != 'Token' or not key:
+            return False
+        return Token.objects.filter(key=key, user__is_staff=True,
+                                    user__is_active=True).exists()
@@ -1,6 +1,12 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
+from . import hashing
 
 # Create your models here.
 
@@ -17,6 +23,25 @@ class UserManager(BaseUserManager):
         user.save()
         return user
 
+    @staticmethod
+    def email_key(email):
+        """The form emails are matched in at login: trimmed, lower cased"""
+        return email.strip().lower()
+
+    def get_by_natural_key(self, email):
+        """
+        Case-insensitive lookup for ModelBackend. Among accounts whose
+        emails differ only in case the exact match wins, otherwise none
+        """
+        users = list(self.filter(Q(email_key=self.email_key(email))
+                                 | Q(email=email)))
+        for user in users:
+            if user.email == email:
+                return user
+        if len(users) == 1:
+            return users[0]
+        raise self.model.DoesNotExist()
+
     def create_superuser(self, email, password):
         user = self.create_user(email=email, password=password)
         user.is_staff = True
@@ -32,7 +57,130 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255, null=False, blank=False)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # UserManager.email_key(email), what logins look up. Null for users
+    # saved before it existed until `manage.py email_keys` fills it in,
+    # and for those whose key another account holds
+    email_key = models.CharField(max_length=255, null=True, editable=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
+
+    class Meta:
+        constraints = [
+            # Also what logins are looked up by
+            models.UniqueConstraint(fields=['email_key'],
+                                    condition=Q(email_key__isnull=False),
+                                    name='core_user_email_key_unique'),
+        ]
+
+    # Email as loaded, so save() only recomputes the key of a new email
+    _loaded_email = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_email = user.__dict__.get('email')
+        return user
+
+    def email_changed(self):
+        return self._state.adding or self.email != self._loaded_email
+
+    def clean(self):
+        """Report an email another account has in another case to forms"""
+        super().clean()
+        if self.email and self.email_changed() and type(self).objects \
+                .filter(email_key=UserManager.email_key(self.email)) \
+                .exclude(pk=self.pk).exists():
+            raise ValidationError(
+                {'email': _('A user with this email already exists.')})
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # Accounts left without a key keep none until their email changes
+        if self.email_changed() and (update_fields is None
+                                     or 'email' in update_fields):
+            self.email_key = UserManager.email_key(self.email)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'email_key'}
+        super().save(*args, **kwargs)
+        self._loaded_email = self.email
+
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Verify on the hashing pool, upgrading outdated hashes"""
+        valid, must_update = hashing.check_password(raw_password,
+                                                    self.password)
+        if valid and must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        return valid
+
+
+class Task(models.Model):
+    """A call waiting for ``manage.py worker``, see core.tasks"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'),
+                      (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=255)
+    # JSON {"args": [...], "kwargs": {...}}
+    arguments = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class AccountDeletion(models.Model):
+    """Progress of removing a deactivated user's data, see core.accounts"""
+    # Outlives the user, so no database constraint
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True,
+                                on_delete=models.DO_NOTHING,
+                                db_constraint=False, related_name='+')
+    requested = models.DateTimeField(auto_now_add=True)
+    batches = models.PositiveIntegerField(default=0)
+    removed = models.BigIntegerField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+
+
+class ShardAssignment(models.Model):
+    """The database holding a user's cookbook, see core.sharding"""
+    # Outlives the user until its rows are purged, so no constraint
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True,
+                                on_delete=models.DO_NOTHING,
+                                db_constraint=False, related_name='+')
+    alias = models.CharField(max_length=100)
+    # Set while manage.py move_user_shard copies the user; writes fail
+    locked = models.BooleanField(default=False)
+
+
+class IdempotencyKey(models.Model):
+    """A request sent with an Idempotency-Key, see core.idempotency"""
+    # Hash of the user, method, path and key
+    key = models.CharField(max_length=64, primary_key=True)
+    # Which request holds the key while none has answered yet
+    token = models.CharField(max_length=32)
+    locked_until = models.DateTimeField(null=True)
+    # The response to replay, once there is one
+    status = models.PositiveSmallIntegerField(null=True)
+    data = models.TextField(blank=True)
+    headers = models.TextField(blank=True)
+    expires = models.DateTimeField(db_index=True)
@@ -0,0 +1,127 @@
+"""
+On-demand request profiling.
+
+Profiles are written to ``settings.PROFILING_DIR`` as
+``<route>.<microseconds>.<pid>.prof`` (cProfile, readable with pstats or
+snakeviz) or ``.collapsed`` (folded stacks from the sampling profiler,
+the input format of flamegraph.pl and speedscope). The directory is a
+ring: once it holds ``PROFILING_MAX_FILES`` profiles the oldest go.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+
+EXTENSIONS = {'cprofile': '.prof', 'sample': '.collapsed'}
+
+
+class CProfileRecorder:
+    """Deterministic profile of everything the request thread does"""
+    extension = EXTENSIONS['cprofile']
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+class SamplingRecorder:
+    """
+    Low overhead statistical profile: a helper thread snapshots the
+    request thread's stack every ``interval`` seconds
+    """
+    extension = EXTENSIONS['sample']
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='request-sampler')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({os.path.basename(code.co_filename)})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, 'w') as fh:
+            for stack, count in self.samples.items():
+                fh.write(f'{stack} {count}\n')
+
+
+RECORDERS = {'cprofile': CProfileRecorder, 'sample': SamplingRecorder}
+
+
+def route_slug(route):
+    """``recipe:recipe-list`` -> ``recipe.recipe-list``"""
+    return re.sub(r'[^A-Za-z0-9_-]+', '.', route or 'unresolved')
+
+
+def save_profile(recorder, route):
+    """Write a profile into the ring directory and return its file name"""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = (f'{route_slug(route)}.{time.time_ns() // 1000}.{os.getpid()}'
+            f'{recorder.extension}')
+    recorder.save(os.path.join(directory, name))
+    trim_ring(directory, settings.PROFILING_MAX_FILES)
+    return name
+
+
+def trim_ring(directory, limit):
+    """Delete the oldest profiles beyond ``limit``"""
+    profiles = list_profiles(directory)
+    for profile in profiles[:-limit] if limit else profiles:
+        try:
+            os.remove(profile['path'])
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles(directory):
+    """Profiles in the ring, oldest first"""
+    profiles = []
+    if not os.path.isdir(directory):
+        return profiles
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        if extension not in EXTENSIONS.values():
+            continue
+        try:
+            route, created, pid = stem.rsplit('.', 2)
+            created = int(created) / 1e6
+        except ValueError:
+            continue
+        profiles.append({
+            'route': route, 'created': created, 'pid': int(pid),
+            'format': extension, 'path': os.path.join(directory, name),
+        })
+    return sorted(profiles, key=lambda profile: profile['created'])
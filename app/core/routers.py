@@ -0,0 +1,128 @@
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+from . import sharding
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db-primary-pin:{}'
+
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def _resolved_user(request):
+    """
+    Return the request's user only if authentication already happened;
+    forcing the lazy user here would query the database from inside the
+    router and recurse
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+def pin_to_primary(user):
+    """Keep the user's reads on the primary for the sticky window"""
+    cache.set(PIN_KEY.format(user.pk), True,
+              settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return bool(cache.get(PIN_KEY.format(user.pk)))
+
+
+class RequestState:
+    """Routing state of the request being served in this context"""
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self.wrote = False
+        self._pinned = None
+        # (alias, locked) of the user's cookbook, see core.sharding
+        self.shard = None
+
+    def use_replica(self):
+        if not self.safe or self.wrote:
+            return False
+        if self._pinned is None:
+            user = _resolved_user(self.request)
+            if user is None:
+                return True
+            self._pinned = is_pinned_to_primary(user)
+        return not self._pinned
+
+    def user(self):
+        return _resolved_user(self.request)
+
+
+class ShardRouter:
+    """
+    Send the sharded models to the shard of the user being served, see
+    core.sharding; everything else is left to the next router
+    """
+
+    def _shard(self, model, hints):
+        if not sharding.enabled() or not sharding.is_sharded(model):
+            return None, False
+        current = sharding.current()
+        if current is not None:
+            return current
+        # Outside requests, follow the object the query starts from
+        instance = hints.get('instance')
+        return (instance._state.db if instance is not None else None), False
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)[0]
+
+    def db_for_write(self, model, **hints):
+        alias, locked = self._shard(model, hints)
+        if locked:
+            raise sharding.ShardLocked()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding.enabled() and (sharding.is_sharded(type(obj1))
+                                   or sharding.is_sharded(type(obj2))):
+            # Rows of one user share a shard; users and terms live on
+            # default without database constraints pointing at them
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db != DEFAULT_DB_ALIAS and db in settings.DATABASE_SHARDS:
+            # The other shards only hold cookbooks
+            return app_label in settings.DATABASE_SHARDED_APPS
+        return None
+
+
+class ReplicaRouter:
+    """
+    Send reads from safe requests to a random replica and everything else
+    to the primary ("default")
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (not settings.DATABASE_REPLICAS or state is None
+                or model._meta.app_label in settings.DATABASE_PRIMARY_ONLY_APPS
+                or not state.use_replica()):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
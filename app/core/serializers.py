@@ -1,9 +1,12 @@
+import contextlib
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
+from django.db import IntegrityError, transaction
 from django.utils.translation import ugettext_lazy as _
+from .utils.serializers import CachedFieldsMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
     Creating serializer for user model/object
     """
@@ -23,21 +26,47 @@ class UserSerializer(serializers.ModelSerializer):
         """
         Create a new user with encrypted password and return it
         """
-        return get_user_model().objects.create_user(**validated_data)
+        with self.email_taken():
+            return get_user_model().objects.create_user(**validated_data)
+
+    @contextlib.contextmanager
+    def email_taken(self):
+        """
+        Report an email key taken concurrently, past validate_email, as
+        a validation error
+        """
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {'email': [_('A user with this email already exists.')]})
+
+    def validate_email(self, value):
+        """Emails differing only in case would share a login"""
+        manager = get_user_model().objects
+        users = manager.filter(email_key=manager.email_key(value))
+        if self.instance is not None:
+            users = users.exclude(pk=self.instance.pk)
+        if users.exists():
+            raise serializers.ValidationError(
+                _('A user with this email already exists.'))
+        return value
 
     def update(self, instance, validated_data):
         """Update a user, setting the password correctly and return it"""
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
+        with self.email_taken():
+            user = super().update(instance, validated_data)
 
-        if password:
-            user.set_password(password)
-            user.save()
+            if password:
+                user.set_password(password)
+                user.save()
 
         return user
 
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for creating auth token
     """
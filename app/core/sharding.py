@@ -0,0 +1,266 @@
+"""
+Horizontal sharding by user.
+
+The models of ``DATABASE_SHARDED_APPS`` (except those listed in
+``DATABASE_UNSHARDED_MODELS``) live on one of the ``DATABASE_SHARDS``
+per user; users, tokens and everything else stay on ``default``. The
+shard map is the ``ShardAssignment`` table on ``default``: new users are
+placed by a hash of their id, users without a row (created before
+sharding was switched on) stay on ``default``. Lookups are cached for
+``SHARD_MAP_CACHE_SECONDS``.
+
+ShardRouter picks the shard of the user being served: the user bound
+with ``for_user()``/``using()`` (background work, commands), otherwise
+the authenticated user of the current request. ``manage.py
+move_user_shard`` copies a user to another shard and switches the map.
+
+Row ids are copied as they are, since clients hold on to them, so
+shards hand out disjoint ids: migrating shard number ``n`` of
+DATABASE_SHARDS starts its id sequences at ``n *
+DATABASE_SHARD_ID_STRIDE`` (``default`` keeps starting at 1), on the
+backends of ``ID_RANGE_VENDORS`` (system check core.E003). A shard
+that outgrows its range, or rows created before the ranges were set,
+can still collide; such a move fails and leaves the user where it was.
+"""
+import contextlib
+import itertools
+import zlib
+from contextvars import ContextVar
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import AutoField
+from rest_framework.exceptions import APIException
+from .db import delete_in
+
+SHARD_KEY = 'db-shard:{}'
+# Backends _reserve_sql can give an id range, see core.checks
+ID_RANGE_VENDORS = ('sqlite', 'postgresql', 'mysql')
+
+# Alias bound explicitly in this context, and whether it is read-only
+_bound = ContextVar('sharding_bound', default=None)
+
+
+class ShardLocked(APIException):
+    """Writes to a user who is being moved between shards"""
+    status_code = 503
+    default_detail = 'Account is being moved, retry in a moment.'
+    default_code = 'shard_locked'
+
+
+def enabled():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def aliases():
+    """Every database holding sharded rows"""
+    return list(settings.DATABASE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    opts = model._meta
+    return (opts.app_label in settings.DATABASE_SHARDED_APPS
+            and opts.label_lower not in settings.DATABASE_UNSHARDED_MODELS)
+
+
+def sharded_models():
+    """Sharded models, every model after those it has foreign keys to"""
+    models = [model for model in apps.get_models(include_auto_created=True)
+              if is_sharded(model)]
+    ordered = []
+    while models:
+        for model in models:
+            targets = {field.related_model for field in model._meta.fields
+                       if field.is_relation and field.related_model
+                       is not model}
+            if not targets & set(models):
+                ordered.append(model)
+                models.remove(model)
+                break
+        else:
+            raise ValueError('Sharded models have circular foreign keys')
+    return ordered
+
+
+def user_filter(model, user_id):
+    """Lookup selecting ``user_id``'s rows of a sharded model"""
+    opts = model._meta
+    for field in opts.fields:
+        if field.is_relation and field.related_model is get_user_model():
+            return {field.attname: user_id}
+    for field in opts.fields:
+        if field.is_relation and field.related_model is not None \
+                and is_sharded(field.related_model):
+            inner = user_filter(field.related_model, user_id)
+            return {f'{field.name}__{key}': value
+                    for key, value in inner.items()}
+    raise ValueError(f'{opts.label} has no path to its user')
+
+
+def place(user_id):
+    """Shard for a new user"""
+    shards = settings.DATABASE_SHARDS
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def lookup(user_id):
+    """``(alias, locked)`` of a user according to the shard map"""
+    from .models import ShardAssignment
+
+    key = SHARD_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        # Never from a replica: a stale answer would be cached
+        row = ShardAssignment.objects.using(DEFAULT_DB_ALIAS) \
+            .filter(user_id=user_id).values_list('alias', 'locked').first()
+        entry = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+        cache.set(key, entry, settings.SHARD_MAP_CACHE_SECONDS)
+    return entry
+
+
+def forget(user_id):
+    cache.delete(SHARD_KEY.format(user_id))
+
+
+@contextlib.contextmanager
+def using(alias, locked=False):
+    """Route sharded models to ``alias`` inside the block, unless None"""
+    if alias is None:
+        yield None
+        return
+    token = _bound.set((alias, locked))
+    try:
+        yield alias
+    finally:
+        _bound.reset(token)
+
+
+def for_user(user_id):
+    """Route sharded models to ``user_id``'s shard inside the block"""
+    if not enabled() or user_id is None:
+        return contextlib.nullcontext()
+    return using(*lookup(user_id))
+
+
+def current():
+    """``(alias, locked)`` sharded models go to right now, or None"""
+    if not enabled():
+        return None
+    bound = _bound.get()
+    if bound is not None:
+        return bound
+    from .routers import _request_state
+
+    state = _request_state.get()
+    if state is None:
+        return None
+    if state.shard is None:
+        user = state.user()
+        if user is None:
+            return None
+        # Looked up once per request
+        state.shard = lookup(user.pk)
+    return state.shard
+
+
+def current_alias():
+    """The shard sharded models go to right now, or None"""
+    shard = current()
+    return shard[0] if shard is not None else None
+
+
+def assign_new_user(sender, instance, created, raw=False, **kwargs):
+    """post_save of users: put new users on a shard"""
+    from .models import ShardAssignment
+
+    if created and not raw and enabled():
+        ShardAssignment.objects.create(user_id=instance.pk,
+                                       alias=place(instance.pk))
+
+
+def _reserve_sql(vendor, table, column, start):
+    """Statements moving the next id of ``table`` up to ``start``"""
+    if vendor == 'sqlite':
+        # Django's SQLite primary keys are AUTOINCREMENT
+        return [
+            ('UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+             'WHERE name = %s', [start - 1, table]),
+            ('INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+             'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence '
+             'WHERE name = %s)', [table, start - 1, table]),
+        ]
+    if vendor == 'postgresql':
+        return [(
+            'SELECT setval(seq, %s, false) FROM (SELECT '
+            'pg_get_serial_sequence(%s, %s)::regclass AS seq) AS serial '
+            'WHERE COALESCE(pg_sequence_last_value(seq), 0) < %s',
+            [start, table, column, start],
+        )]
+    if vendor == 'mysql':
+        # Ignored when rows past it exist already
+        return [(f'ALTER TABLE `{table}` AUTO_INCREMENT = {int(start)}',
+                 None)]
+    raise ImproperlyConfigured(f'Shards on {vendor} have no id ranges.')
+
+
+def reserve_ids(alias):
+    """Start ``alias``'s id sequences at its range, never moving back"""
+    index = settings.DATABASE_SHARDS.index(alias)
+    if not index:
+        return
+    start = index * settings.DATABASE_SHARD_ID_STRIDE
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            pk = model._meta.pk
+            if not isinstance(pk, AutoField):
+                continue
+            for sql, params in _reserve_sql(connection.vendor,
+                                            model._meta.db_table,
+                                            pk.column, start):
+                cursor.execute(sql, params)
+
+
+def reserve_shard_ids(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate: give a migrated shard its id range"""
+    if using in settings.DATABASE_SHARDS \
+            and sender.label in settings.DATABASE_SHARDED_APPS:
+        reserve_ids(using)
+
+
+def copy_user(user_id, source, target, batch_size=500):
+    """Copy ``user_id``'s rows from ``source`` to ``target``, count them"""
+    copied = 0
+    with transaction.atomic(using=target):
+        for model in sharded_models():
+            rows = iter(model._base_manager.using(source)
+                        .filter(**user_filter(model, user_id))
+                        .order_by('pk').iterator(chunk_size=batch_size))
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                # Explicit ids, which leave the target's sequences alone
+                model._base_manager.using(target).bulk_create(batch)
+                copied += len(batch)
+    return copied
+
+
+def delete_user(user_id, alias, batch_size=500):
+    """Delete ``user_id``'s rows from ``alias``, return how many"""
+    deleted = 0
+    for model in reversed(sharded_models()):
+        rows = model._base_manager.using(alias)
+        pks = rows.filter(**user_filter(model, user_id)).order_by('pk') \
+            .values_list('pk', flat=True)
+        while True:
+            with transaction.atomic(using=alias):
+                batch = list(pks[:batch_size])
+                if not batch:
+                    break
+                # Plain DELETEs like recipe.purge: no signals, no collector
+                deleted += delete_in(model, 'pk', batch, alias)
+    return deleted
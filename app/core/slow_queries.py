@@ -0,0 +1,202 @@
+"""
+Slow query detection.
+
+An execute wrapper times every query; those slower than
+``settings.SLOW_QUERY_THRESHOLD_MS`` are handed to a background thread
+which runs EXPLAIN on its own connection and appends a JSON line to the
+rotating ``settings.SLOW_QUERY_LOG``. The request only pays for a clock
+read and, for slow queries, a stack capture and a queue put.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.db import connections
+from . import metrics
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'mysql': 'EXPLAIN ',
+}
+# Don't EXPLAIN the same statement more than once per window
+EXPLAIN_INTERVAL = 300
+MAX_PENDING = 100
+STACK_DEPTH = 10
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+logger = logging.getLogger(__name__)
+
+_pending = queue.Queue(maxsize=MAX_PENDING)
+_last_explained = {}
+_worker = None
+_worker_lock = threading.Lock()
+_log = None
+
+
+def fingerprint(sql):
+    """Normalise a statement so differently sized IN lists group together"""
+    normalised = _LITERAL.sub('?', _IN_LIST.sub('(...)', sql))
+    return normalised, hashlib.sha1(normalised.encode()).hexdigest()[:12]
+
+
+def params_shape(params, many):
+    """Describe parameters by type and count without logging values"""
+    if many or params is None:
+        return {'many': bool(many)}
+    types = {}
+    for param in params:
+        name = type(param).__name__
+        types[name] = types.get(name, 0) + 1
+    return {'count': len(params), 'types': types}
+
+
+def query_stack():
+    """Frames that led to the query, minus the ORM and this module"""
+    frames = []
+    for frame in traceback.extract_stack()[:-3]:
+        filename = frame.filename
+        if os.sep + os.path.join('django', 'db') + os.sep in filename:
+            continue
+        if 'site-packages' + os.sep in filename:
+            filename = filename.split('site-packages' + os.sep, 1)[1]
+        elif filename.startswith(settings.BASE_DIR):
+            filename = os.path.relpath(filename, settings.BASE_DIR)
+        frames.append(f'{filename}:{frame.lineno} in {frame.name}')
+    return frames[-STACK_DEPTH:]
+
+
+def detect_slow_queries(execute, sql, params, many, context):
+    """Execute wrapper flagging queries above the configured threshold"""
+    if threading.current_thread() is _worker:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            _flag(sql, params, many, context, duration)
+
+
+def _flag(sql, params, many, context, duration):
+    request = metrics.current_request.get()
+    match = getattr(request, 'resolver_match', None)
+    normalised, digest = fingerprint(sql)
+    record = {
+        'time': time.time(),
+        'duration_ms': round(duration * 1000, 3),
+        'alias': context['connection'].alias,
+        'route': match.view_name if match else None,
+        'fingerprint': digest,
+        'sql': normalised,
+        'params': params_shape(params, many),
+        'stack': query_stack(),
+    }
+    explain = None
+    if not many and sql.lstrip()[:6].upper() == 'SELECT':
+        explain = (sql, params)
+    try:
+        _pending.put_nowait((record, explain))
+    except queue.Full:
+        logger.warning('Slow query log queue full, dropping %s', digest)
+        return
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, daemon=True,
+                                       name='slow-query-explain')
+            _worker.start()
+
+
+def _work():
+    while True:
+        record, explain = _pending.get()
+        try:
+            if explain is not None:
+                record['plan'] = _explain(record, *explain)
+            _write(record)
+        except Exception:
+            logger.exception('Failed to record slow query')
+        finally:
+            _pending.task_done()
+            connections.close_all()
+
+
+def _explain(record, sql, params):
+    now = time.monotonic()
+    if now - _last_explained.get(record['fingerprint'], -EXPLAIN_INTERVAL) \
+            < EXPLAIN_INTERVAL:
+        return None
+    _last_explained[record['fingerprint']] = now
+
+    connection = connections[record['alias']]
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] if len(row) == 1 else list(row) for row in rows]
+
+
+def _write(record):
+    global _log
+    path = os.path.abspath(settings.SLOW_QUERY_LOG)
+    if _log is None or _log.baseFilename != path:
+        if _log is not None:
+            _log.close()
+        _log = RotatingFileHandler(
+            path,
+            maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=settings.SLOW_QUERY_LOG_BACKUPS
+        )
+    _log.handle(logging.makeLogRecord({
+        'msg': json.dumps(record, default=str)
+    }))
+
+
+def drain():
+    """Block until every flagged query has been explained and written"""
+    _pending.join()
+
+
+def read_log(path):
+    """Yield records from the log and its rotated backups, oldest first"""
+    backups = settings.SLOW_QUERY_LOG_BACKUPS
+    for name in [f'{path}.{i}' for i in range(backups, 0, -1)] + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name) as fh:
+            for line in fh:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def install_slow_query_detector(sender, connection, **kwargs):
+    """Hook the detector into every connection when it is opened"""
+    if not getattr(settings, 'SLOW_QUERY_LOG', None):
+        return
+    if detect_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(detect_slow_queries)
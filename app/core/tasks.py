@@ -0,0 +1,239 @@
+"""
+Database backed background tasks.
+
+``@task`` registers a function and gives it ``delay(*args, **kwargs)``,
+which stores a ``Task`` row in the caller's transaction: the task only
+becomes visible to workers if the change it belongs to commits.
+``manage.py worker`` runs them on a pool of threads, optionally in
+several processes.
+
+Workers claim due rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` where
+the database supports it. Elsewhere (SQLite) a conditional UPDATE
+decides which worker gets a row. Finished tasks are deleted; failures
+are retried with exponential backoff until ``max_attempts`` and then
+kept with status ``failed``. Workers refresh ``locked_at`` of the tasks
+they are running every ``TASK_LOCK_TIMEOUT / 3`` seconds; a task whose
+lock is older than ``TASK_LOCK_TIMEOUT`` is presumed to have lost its
+worker and claimed again, or failed if it has no attempts left. Tasks
+run with ``run_due()`` get no heartbeat and have to finish within
+``TASK_LOCK_TIMEOUT``. Arguments have to be JSON serialisable.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connections, router, \
+    transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from . import metrics
+from .models import Task
+
+REGISTRY = {}
+
+logger = logging.getLogger(__name__)
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a task, ``name`` defaults to its path"""
+
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        REGISTRY[task_name] = func
+        func.task_name = task_name
+        func.delay = lambda *args, **kwargs: enqueue(
+            task_name, args, kwargs, max_attempts=max_attempts)
+        return func
+
+    return register
+
+
+def enqueue(name, args=(), kwargs=None, delay=0, max_attempts=None):
+    """Store a call of task ``name``, due in ``delay`` seconds"""
+    return Task.objects.create(
+        name=name,
+        arguments=json.dumps({'args': list(args), 'kwargs': kwargs or {}}),
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def _abandoned(now):
+    abandoned = now - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Q(status=Task.RUNNING, locked_at__lt=abandoned)
+
+
+def _due(now):
+    return Q(status=Task.PENDING, run_at__lte=now) | \
+        (_abandoned(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def fail_abandoned(now=None):
+    """Fail abandoned tasks without attempts left, return how many"""
+    return Task.objects.filter(
+        _abandoned(now or timezone.now()),
+        attempts__gte=F('max_attempts'),
+    ).update(status=Task.FAILED, locked_at=None,
+             last_error='Worker lost while running the last attempt')
+
+
+def claim(worker_id, limit=1):
+    """Mark up to ``limit`` due tasks as running for ``worker_id``"""
+    now = timezone.now()
+    fail_abandoned(now)
+    due = Task.objects.filter(_due(now)).order_by('run_at')
+    claimed = {'status': Task.RUNNING, 'locked_by': worker_id,
+               'locked_at': now, 'attempts': F('attempts') + 1}
+    db = router.db_for_write(Task)
+
+    if connections[db].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=db):
+            pks = list(due.using(db).select_for_update(skip_locked=True)
+                       .values_list('pk', flat=True)[:limit])
+            Task.objects.using(db).filter(pk__in=pks).update(**claimed)
+    else:
+        pks = []
+        for pk in due.using(db).values_list('pk', flat=True)[:limit * 2]:
+            # Ours only if no other worker claimed it since we looked
+            if Task.objects.using(db).filter(_due(now), pk=pk) \
+                    .update(**claimed):
+                pks.append(pk)
+                if len(pks) == limit:
+                    break
+    return list(Task.objects.using(db).filter(pk__in=pks,
+                                              locked_by=worker_id))
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``, with a little jitter"""
+    delay = min(settings.TASK_RETRY_MAX_DELAY,
+                settings.TASK_RETRY_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(1, 1.1)
+
+
+def execute(task_row):
+    """Run a claimed task and record how it went"""
+    labels = (('task', task_row.name),)
+    ours = Task.objects.filter(pk=task_row.pk, locked_by=task_row.locked_by)
+    metrics.registry.observe(
+        'task_queue_latency_seconds', labels,
+        max(0.0, (task_row.locked_at - task_row.run_at).total_seconds()))
+
+    start = time.perf_counter()
+    try:
+        func = REGISTRY.get(task_row.name)
+        if func is None:
+            raise LookupError(f'Unknown task {task_row.name}')
+        arguments = json.loads(task_row.arguments)
+        func(*arguments['args'], **arguments['kwargs'])
+    except Exception:
+        error = traceback.format_exc()
+        if task_row.attempts < task_row.max_attempts \
+                and task_row.name in REGISTRY:
+            outcome = 'retry'
+            ours.update(status=Task.PENDING, locked_by='', locked_at=None,
+                        last_error=error, run_at=timezone.now() + timedelta(
+                            seconds=backoff(task_row.attempts)))
+        else:
+            outcome = 'failed'
+            ours.update(status=Task.FAILED, locked_at=None,
+                        last_error=error)
+        logger.warning('Task %s %s (attempt %d)\n%s', task_row.name,
+                       outcome, task_row.attempts, error)
+    else:
+        outcome = 'done'
+        ours.delete()
+    metrics.registry.observe('task_duration_seconds', labels,
+                             time.perf_counter() - start)
+    metrics.registry.inc('tasks_processed_total',
+                         labels + (('outcome', outcome),))
+    return outcome
+
+
+def run_due(worker_id='inline'):
+    """Run tasks until none is due, return how many ran"""
+    count = 0
+    while True:
+        tasks = claim(worker_id)
+        if not tasks:
+            return count
+        for task_row in tasks:
+            execute(task_row)
+            count += 1
+
+
+class Worker:
+    """Threads claiming and running one task at a time until stopped"""
+
+    def __init__(self, threads=1, poll_interval=None):
+        self.threads = threads
+        self.poll_interval = poll_interval or settings.TASK_POLL_INTERVAL
+        self.id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        # locked_by of the threads running a task right now
+        self.running = set()
+
+    def run(self, burst=False):
+        """Work until stop(), or with ``burst`` until nothing is due"""
+        workers = [
+            threading.Thread(target=self._work, args=(f'{self.id}:{index}',
+                                                      burst),
+                             name=f'task-worker-{index}')
+            for index in range(self.threads)
+        ]
+        for thread in workers:
+            thread.start()
+        heartbeat = time.monotonic()
+        while any(thread.is_alive() for thread in workers):
+            metrics.flush()
+            if time.monotonic() - heartbeat >= settings.TASK_LOCK_TIMEOUT / 3:
+                self.heartbeat()
+                heartbeat = time.monotonic()
+            for thread in workers:
+                thread.join(self.poll_interval)
+        metrics.flush(force=True)
+        connections.close_all()
+
+    def heartbeat(self):
+        """Keep the tasks running here from being presumed abandoned"""
+        running = list(self.running)
+        if not running:
+            return
+        try:
+            Task.objects.filter(status=Task.RUNNING,
+                                locked_by__in=running) \
+                .update(locked_at=timezone.now())
+        except Exception:
+            logger.exception('Failed to refresh task locks')
+
+    def stop(self):
+        """Let running tasks finish, then return from run()"""
+        self.stopping.set()
+
+    def _work(self, worker_id, burst):
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                tasks = claim(worker_id)
+            except Exception:
+                logger.exception('Failed to claim tasks')
+                tasks = []
+            for task_row in tasks:
+                self.running.add(worker_id)
+                try:
+                    execute(task_row)
+                except Exception:
+                    logger.exception('Failed to run task %s', task_row.pk)
+                finally:
+                    self.running.discard(worker_id)
+            if not tasks:
+                if burst:
+                    break
+                self.stopping.wait(self.poll_interval)
+        connections.close_all()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core import tasks
+from core.models import AccountDeletion, Task
+from recipe.models import Recipe, Tag, Ingredient
+
+USER_PROFILE_URL = reverse('core:profile')
+
+
+@override_settings(ACCOUNT_DELETION_BATCH=2)
+class AccountDeletionTest(TestCase):
+
+    def setUp(self) -> None:
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+        tags = [Tag.objects.create(user=self.user, name=f'tag-{index}')
+                for index in range(3)]
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.recipes = []
+        for index in range(5):
+            recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                           time=5, price=3)
+            recipe.tags.add(*tags)
+            recipe.ingredients.add(ingredient)
+            self.recipes.append(recipe)
+        self.recipes[0].image.save('photo.jpg', ContentFile(b'jpeg'))
+        self.image = self.recipes[0].image.path
+
+    def test_delete_deactivates_immediately(self):
+        """Test the account is locked and its data left for the worker"""
+        response = self.client.delete(USER_PROFILE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertEqual(Task.objects.get().name, 'core.delete_account')
+        self.assertEqual(self.client.get(USER_PROFILE_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_worker_removes_data_in_batches(self):
+        """Test the data goes batch by batch, then the user"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        Recipe.objects.create(user=other, name='Soup', time=5, price=3)
+        self.client.delete(USER_PROFILE_URL)
+
+        tasks.run_due()
+
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+        self.assertEqual(list(Recipe.objects.values_list('user', flat=True)),
+                         [other.pk])
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.assertFalse(os.path.exists(self.image))
+
+        deletion = AccountDeletion.objects.get(user_id=self.user.pk)
+        self.assertIsNotNone(deletion.finished)
+        # 5 recipes with 20 links in 3 batches, 3 tags in 2, 1 ingredient
+        # and the user
+        self.assertEqual(deletion.removed, 29)
+        self.assertEqual(deletion.batches, 7)
+
+    def test_image_delete_failure(self):
+        """Test a file that can't be removed doesn't stop the deletion"""
+        storage = Recipe._meta.get_field('image').storage
+        self.client.delete(USER_PROFILE_URL)
+
+        with patch.object(storage, 'delete', side_effect=PermissionError), \
+                self.assertLogs('recipe.purge', 'ERROR'):
+            tasks.run_due()
+
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+        self.assertTrue(os.path.exists(self.image))
+
+    def test_progress_report(self):
+        """Test the command lists unfinished deletions"""
+        self.client.delete(USER_PROFILE_URL)
+        out = StringIO()
+
+        call_command('account_deletions', stdout=out)
+
+        self.assertIn(f'user {self.user.pk}: in progress', out.getvalue())
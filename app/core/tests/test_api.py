@@ -1,4 +1,6 @@
+from unittest.mock import patch
 from django.test import TestCase
+from django.db.utils import InterfaceError, OperationalError
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
@@ -7,6 +9,7 @@ from rest_framework import status
 CREATE_USER_URL = reverse('core:create')
 TOKEN_CREATE_URL = reverse('core:token')
 USER_PROFILE_URL = reverse('core:profile')
+HEALTH_URL = reverse('healthz')
 
 
 def create_user(**kwargs):
@@ -84,6 +87,38 @@ class PublicUserApiTest(TestCase):
         self.assertIn('token', response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_create_auth_token_any_case(self):
+        """Test the email is matched regardless of case"""
+        create_user(email='TestEmail@test.com', password='test_password')
+
+        response = self.client.post(TOKEN_CREATE_URL, {
+            'email': 'testemail@TEST.com', 'password': 'test_password'})
+
+        self.assertIn('token', response.data)
+
+    def test_user_exists_in_other_case(self):
+        """Test an email differing only in case is taken"""
+        create_user(email='testemail@test.com', password='test_password')
+
+        response = self.client.post(CREATE_USER_URL, {
+            'email': 'TestEmail@test.com', 'password': 'test_password',
+            'name': 'test_user_pa'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_concurrent_signup_in_other_case(self):
+        """Test a signup racing past the email check is rejected"""
+        create_user(email='testemail@test.com', password='test_password')
+
+        with patch('core.serializers.UserSerializer.validate_email',
+                   side_effect=lambda value: value):
+            response = self.client.post(CREATE_USER_URL, {
+                'email': 'TestEmail@test.com', 'password': 'test_password',
+                'name': 'test_user_pa'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
     def test_create_auth_token_with_wrong_credentials(self):
         """
         Testing auth token generation with wrong credentials
@@ -185,3 +220,63 @@ class PrivateUserApiTest(TestCase):
         self.assertTrue(
             self.test_user.check_password(updated_data["password"])
         )
+
+    def test_update_user_without_email_key(self):
+        """Test a user whose email key another account holds can update"""
+        other = create_user(email="other@test.com", password="test_password")
+        # Saved before emails were compared case-insensitively
+        get_user_model().objects.filter(pk=other.pk).update(
+            email="TestEmail@test.com", email_key=None)
+        self.client.force_authenticate(
+            user=get_user_model().objects.get(pk=other.pk))
+
+        response = self.client.patch(USER_PROFILE_URL, {"name": "new_name"})
+
+        other.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(other.name, "new_name")
+        self.assertIsNone(other.email_key)
+
+    def test_update_email_taken_concurrently(self):
+        """Test an email key taken past the email check is rejected"""
+        create_user(email="other@test.com", password="test_password")
+
+        with patch('core.serializers.UserSerializer.validate_email',
+                   side_effect=lambda value: value):
+            response = self.client.patch(USER_PROFILE_URL,
+                                         {"email": "Other@test.com"})
+
+        self.test_user.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+        self.assertEqual(self.test_user.email, "testemail@test.com")
+
+
+class HealthApiTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+    def test_health_ok(self):
+        """Test health endpoint reports database latency"""
+        response = self.client.get(HEALTH_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "ok")
+        self.assertGreaterEqual(response.data["database"]["latency_ms"], 0)
+
+    @patch("core.views.probe_database", side_effect=OperationalError)
+    def test_health_database_down(self, probe):
+        """Test health endpoint returns 503 when the database is down"""
+        response = self.client.get(HEALTH_URL)
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @patch("core.views.probe_database", side_effect=InterfaceError)
+    def test_health_connection_dropped(self, probe):
+        """Test health endpoint returns 503 on a dropped connection"""
+        response = self.client.get(HEALTH_URL)
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -1,21 +1,110 @@
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
+from core.db import probe_database
+from core.management.commands import serve
+
+PROBE = "core.management.commands.wait_for_db.probe_database"
 
 
 class MyTestCase(TestCase):
     def test_wait_for_db_ready(self):
         """Test for waiting for db when the db is available"""
-        with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
-            gi.return_value = True
+        with patch(PROBE) as probe:
+            probe.return_value = 0.001
             call_command("wait_for_db")
-            self.assertEqual(gi.call_count, 1)
+            self.assertEqual(probe.call_count, 1)
 
     @patch("time.sleep", return_value=True)
     def test_wait_for_db(self, ts):
         """Test for waiting for db"""
-        with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
+        with patch(PROBE) as probe:
+            probe.side_effect = [OperationalError] * 5 + [0.001]
             call_command("wait_for_db")
-            self.assertEqual(gi.call_count, 6)
+            self.assertEqual(probe.call_count, 6)
+            self.assertEqual(ts.call_count, 5)
+
+    @patch("time.sleep", return_value=True)
+    def test_wait_for_db_backoff(self, ts):
+        """Test the retry delay grows and is capped by max delay"""
+        with patch(PROBE) as probe:
+            probe.side_effect = [OperationalError] * 6 + [0.001]
+            call_command("wait_for_db", initial_delay=1, max_delay=8)
+
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertLessEqual(delays[0], 1)
+        self.assertGreaterEqual(delays[3], 4)
+        self.assertTrue(all(delay <= 8 for delay in delays))
+
+    @patch("time.sleep", return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """Test the command fails once the deadline has passed"""
+        with patch(PROBE) as probe:
+            probe.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command("wait_for_db", timeout=0)
+
+    def test_probe_database(self):
+        """Test the probe round trips against the real database"""
+        self.assertGreaterEqual(probe_database(), 0)
+
+
+class ServeCommandTest(TestCase):
+
+    @patch("gunicorn.app.base.BaseApplication.run", autospec=True)
+    @patch("core.management.commands.serve.default_workers",
+           return_value=5)
+    def test_serve_wsgi(self, workers, run):
+        """Test serve runs gunicorn with preloading and recycling"""
+        call_command("serve", max_requests=500)
+
+        run.assert_called_once()
+        app = run.call_args.args[0]
+        self.assertEqual(app.cfg.workers, 5)
+        self.assertEqual(app.cfg.max_requests, 500)
+        self.assertTrue(app.cfg.preload_app)
+
+    def test_gunicorn_config(self):
+        """Test command options map onto gunicorn settings"""
+        command = serve.Command()
+        parser = command.create_parser("manage.py", "serve")
+        options = vars(parser.parse_args(["--workers", "3", "--asgi"]))
+
+        config = command.gunicorn_config(options)
+
+        self.assertEqual(config["workers"], 3)
+        self.assertTrue(config["preload_app"])
+        self.assertEqual(config["max_requests"], 1000)
+        self.assertEqual(config["worker_class"], serve.ASGI_WORKER)
+
+    @patch.dict("os.environ", {"WEB_CONCURRENCY": "7"})
+    def test_default_workers_from_env(self):
+        """Test WEB_CONCURRENCY overrides the core based worker count"""
+        self.assertEqual(serve.default_workers(), 7)
+
+
+class EmailKeysCommandTest(TestCase):
+
+    def test_fill_and_report_collisions(self):
+        """Test keys are filled in and case-only duplicates listed"""
+        users = get_user_model().objects
+        first = users.create_user(email='Cook@test.com', password='pass')
+        second = users.create_user(email='other@test.com', password='pass')
+        # Saved before emails were compared case-insensitively
+        users.filter(pk=second.pk).update(email='COOK@test.com',
+                                          email_key=None)
+        out = StringIO()
+
+        call_command('email_keys', stdout=out)
+
+        self.assertIsNone(users.get(pk=second.pk).email_key)
+        self.assertIn(f'cook@test.com: user {first.pk} (Cook@test.com), '
+                      f'user {second.pk} (COOK@test.com)', out.getvalue())
+        self.assertIn('1 colliding emails', out.getvalue())
+        # The account without a key logs in with its exact email only
+        self.assertEqual(users.get_by_natural_key('COOK@test.com'), second)
+        self.assertEqual(users.get_by_natural_key('cook@test.com'), first)
@@ -0,0 +1,118 @@
+from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.test import TestCase, override_settings
+from app.database import parse_database_url, database_from_env, \
+    shards_from_env, cache_from_env
+from core.db import close_unusable_connections
+
+
+class DatabaseConfigTest(TestCase):
+
+    def test_parse_postgres_url(self):
+        """Test parsing a postgres database url"""
+        config = parse_database_url(
+            'postgres://postgres:PASS%40123@db:6432/app'
+        )
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['NAME'], 'app')
+        self.assertEqual(config['USER'], 'postgres')
+        self.assertEqual(config['PASSWORD'], 'PASS@123')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertEqual(config['PORT'], '6432')
+
+    def test_parse_sqlite_url(self):
+        """Test parsing relative and absolute sqlite urls"""
+        self.assertEqual(
+            parse_database_url('sqlite:///db.sqlite3')['NAME'], 'db.sqlite3'
+        )
+        self.assertEqual(
+            parse_database_url('sqlite:////tmp/app.db')['NAME'], '/tmp/app.db'
+        )
+
+    def test_parse_unsupported_url(self):
+        """Test unknown database schemes are rejected"""
+        with self.assertRaises(ValueError):
+            parse_database_url('mysql://user@host/app')
+
+    @patch.dict('os.environ', {
+        'DB_HOST': 'db', 'DB_NAME': 'app', 'DB_USER': 'postgres',
+        'DB_PASSWORD': 'secret', 'DB_CONN_MAX_AGE': '300',
+        'DB_PGBOUNCER': '1'
+    }, clear=True)
+    def test_postgres_from_env(self):
+        """Test the docker-compose variables select postgres"""
+        config = database_from_env('db.sqlite3')
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertEqual(config['CONN_MAX_AGE'], 300)
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+
+    @patch.dict('os.environ', {}, clear=True)
+    def test_sqlite_default(self):
+        """Test falling back to a local sqlite file"""
+        config = database_from_env('db.sqlite3')
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], 'db.sqlite3')
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertNotIn('DISABLE_SERVER_SIDE_CURSORS', config)
+
+    @patch.dict('os.environ', {
+        'DATABASE_SHARD_URLS': 'sqlite:///a.sqlite3, sqlite:///b.sqlite3'
+    }, clear=True)
+    def test_shards_from_env(self):
+        """Test shard URLs become shard1, shard2..."""
+        shards = shards_from_env()
+
+        self.assertEqual(list(shards), ['shard1', 'shard2'])
+        self.assertEqual(shards['shard2']['NAME'], 'b.sqlite3')
+
+    @patch.dict('os.environ', {'CACHE_URL': 'db://cache_table'}, clear=True)
+    def test_cache_from_env(self):
+        """Test CACHE_URL selects a shared cache"""
+        config = cache_from_env()
+
+        self.assertEqual(config['BACKEND'],
+                         'django.core.cache.backends.db.DatabaseCache')
+        self.assertEqual(config['LOCATION'], 'cache_table')
+
+    @patch.dict('os.environ', {}, clear=True)
+    def test_cache_default(self):
+        """Test each process keeps its own cache without CACHE_URL"""
+        self.assertEqual(cache_from_env()['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+
+
+class ConnectionSetupTest(TestCase):
+
+    def test_sqlite_pragmas_applied(self):
+        """Test pragmas are applied to the sqlite connection"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # 1 == NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=True)
+    def test_unusable_connection_closed(self):
+        """Test a broken persistent connection is closed on request start"""
+        conn = MagicMock(connection=object(), in_atomic_block=False)
+        conn.is_usable.return_value = False
+        with patch('core.db.connections') as connections:
+            connections.all.return_value = [conn]
+            close_unusable_connections()
+
+        conn.close.assert_called_once()
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=False)
+    def test_health_checks_disabled(self):
+        """Test connections are not pinged when health checks are off"""
+        conn = MagicMock(connection=object(), in_atomic_block=False)
+        with patch('core.db.connections') as connections:
+            connections.all.return_value = [conn]
+            close_unusable_connections()
+
+        conn.is_usable.assert_not_called()
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import hashing, metrics
+
+TOKEN_URL = reverse('core:token')
+
+
+class TestHashingPool(TestCase):
+
+    def setUp(self) -> None:
+        self.pool = hashing.HashingPool(workers=1, max_pending=0)
+
+    def tearDown(self) -> None:
+        self.pool.shutdown()
+
+    def test_hash_and_verify_in_pool(self):
+        """Test hashing runs in the pool and records its timings"""
+        encoded = self.pool.run('hash', hashing._encode, 'test_password')
+
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$'))
+        self.assertEqual(
+            self.pool.run('verify', hashing._verify, 'test_password',
+                          encoded),
+            (True, False)
+        )
+        labels = (('operation', 'verify'),)
+        self.assertIn(('password_hash_queue_wait_seconds', labels),
+                      metrics.registry.histograms)
+        self.assertIn(('password_hash_duration_seconds', labels),
+                      metrics.registry.histograms)
+
+    def test_overloaded(self):
+        """Test hashing fails fast once the pool and queue are full"""
+        self.pool.in_flight = 1
+
+        with self.assertRaises(hashing.HashingOverloaded):
+            self.pool.run('hash', hashing._encode, 'test_password')
+
+
+class TestUserHashing(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+
+    def test_check_password(self):
+        """Test users verify their password through the pool"""
+        self.assertTrue(self.user.check_password('test_password'))
+        self.assertFalse(self.user.check_password('wrong_password'))
+
+    def test_rehash_on_login(self):
+        """Test a hash from an older hasher is upgraded on login"""
+        self.user.password = make_password('test_password',
+                                           hasher='pbkdf2_sha1')
+        self.user.save()
+
+        response = APIClient().post(TOKEN_URL, {
+            'email': 'test_user@y.com', 'password': 'test_password'
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+    def test_login_shed_when_overloaded(self):
+        """Test logins get 503 while the hashing pool is saturated"""
+        pool = hashing.get_pool()
+        with patch.object(pool, 'in_flight',
+                          pool.workers + pool.max_pending):
+            response = APIClient().post(TOKEN_URL, {
+                'email': 'test_user@y.com', 'password': 'test_password'
+            })
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self) -> None:
+        self.registry = metrics.Registry()
+        patcher = patch('core.metrics.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="metrics@test.com",
+            password="test_password"
+        )
+
+    def test_request_recorded_per_route(self):
+        """Test latency, queries, render time and size are recorded"""
+        self.client.force_authenticate(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        route = (('route', 'recipe:recipe-list'),)
+        self.assertEqual(self.registry.counters[(
+            'http_requests_total',
+            route + (('method', 'GET'), ('status', 200))
+        )], 1)
+        queries = self.registry.histograms[('db_queries_per_request', route)]
+        self.assertEqual(sum(queries[:-1]), 1)
+        self.assertGreaterEqual(queries[-1], 1)
+        self.assertIn(('http_response_render_seconds', route),
+                      self.registry.histograms)
+        self.assertIn(('http_response_size_bytes', route),
+                      self.registry.histograms)
+
+    def test_render_prometheus_text(self):
+        """Test histograms render cumulative buckets, sum and count"""
+        labels = (('route', 'core:token'),)
+        self.registry.observe('http_request_duration_seconds', labels, 0.02)
+        self.registry.observe('http_request_duration_seconds', labels, 3)
+
+        text = metrics.render(self.registry)
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket'
+                      '{route="core:token",le="0.025"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket'
+                      '{route="core:token",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count'
+                      '{route="core:token"} 2', text)
+
+    def test_metrics_endpoint(self):
+        """Test the metrics endpoint serves Prometheus text to staff"""
+        self.client.get(RECIPE_URL)
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(METRICS_URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total{route="recipe:recipe-list"',
+                      response.content)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_token(self):
+        """Test the metrics endpoint requires the configured token"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        response = self.client.get(METRICS_URL,
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_method_label(self):
+        """Test verbs outside HTTP's are counted together"""
+        self.registry.record_request('core:token', 'BREW', 405, 0.01, 0, 0,
+                                     None, None)
+
+        self.assertIn(('http_requests_total',
+                       (('route', 'core:token'), ('method', 'other'),
+                        ('status', 405))), self.registry.counters)
+
+    def test_reused_pid_is_dead(self):
+        """Test a snapshot whose pid now belongs to another process"""
+        pid = os.getpid()
+        start = metrics._process_start(pid)
+
+        self.assertTrue(metrics._alive(pid, start))
+        if start:
+            self.assertFalse(metrics._alive(pid, start + 1))
+
+    def test_collect_across_processes(self):
+        """Test snapshots of other workers are merged and dead ones archived"""
+        labels = [['route', 'core:token']]
+        other = {'counters': [['http_requests_total', labels, 2]],
+                 'histograms': []}
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory), \
+                patch('core.metrics._alive',
+                      side_effect=lambda pid, start: pid != 999999):
+            self.registry.inc('http_requests_total', metrics._labels(labels))
+            with open(os.path.join(directory, 'metrics-1-5.json'),
+                      'w') as fh:
+                json.dump(other, fh)
+            with open(os.path.join(directory, 'metrics-999999-5.json'),
+                      'w') as fh:
+                json.dump(other, fh)
+
+            total = metrics.collect()
+            files = sorted(os.listdir(directory))
+            again = metrics.collect()
+
+        key = ('http_requests_total', metrics._labels(labels))
+        self.assertEqual(total.counters[key], 5)
+        self.assertEqual(again.counters[key], 5)
+        self.assertNotIn('metrics-999999-5.json', files)
+        self.assertIn('archive.json', files)
@@ -1,3 +1,5 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -29,6 +31,45 @@ class ModelTest(TestCase):
 
         self.assertEqual(user.email, email.lower())
 
+    def test_email_key(self):
+        """Testing the lower cased email logins use is kept up to date"""
+        user = get_user_model().objects.create_user(
+            email="Test123@test.com",
+            password="test_password"
+        )
+        user.email = "Renamed@test.com"
+        user.save(update_fields=["email"])
+
+        user.refresh_from_db()
+        self.assertEqual(user.email_key, "renamed@test.com")
+
+    def test_email_key_unique(self):
+        """Testing two accounts can't share an email key"""
+        get_user_model().objects.create_user(email="Test123@test.com",
+                                             password="test_password")
+
+        with self.assertRaises(IntegrityError):
+            get_user_model().objects.create_user(email="TEST123@test.com",
+                                                 password="test_password")
+
+    def test_email_key_taken_in_other_case(self):
+        """Testing a user without a key saves, and forms report the key"""
+        users = get_user_model().objects
+        users.create_user(email="Test123@test.com", password="test_password")
+        user = users.create_user(email="other@test.com",
+                                 password="test_password")
+        users.filter(pk=user.pk).update(email="TEST123@test.com",
+                                        email_key=None)
+        user = users.get(pk=user.pk)
+
+        user.name = "renamed"
+        user.save()
+        user.email = "tEST123@test.com"
+
+        self.assertIsNone(users.get(pk=user.pk).email_key)
+        with self.assertRaises(ValidationError):
+            user.clean()
+
     def test_create_user_with_invalid_email(self):
         """ Testing crate user with in valid email"""
         with self.assertRaises(ValueError):
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core import profiling
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(PROFILING_DIR=self.directory,
+                                     PROFILING_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_superuser(
+            email="staff@test.com",
+            password="test_password"
+        )
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="test_password"
+        )
+
+    def get_tags(self, user, **headers):
+        token = Token.objects.create(user=user)
+        return self.client.get(TAGS_URL,
+                               HTTP_AUTHORIZATION=f'Token {token.key}',
+                               **headers)
+
+    def test_staff_token_profiles_request(self):
+        """Test staff users can profile a request with a header"""
+        response = self.get_tags(self.staff, HTTP_X_PROFILE='1')
+
+        profiles = profiling.list_profiles(self.directory)
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['route'], 'recipe.tag-list')
+        self.assertEqual(profiles[0]['format'], '.prof')
+        self.assertEqual(response['X-Profile-File'],
+                         os.path.basename(profiles[0]['path']))
+
+    def test_non_staff_header_ignored(self):
+        """Test the profile header is ignored for regular users"""
+        response = self.get_tags(self.user, HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(profiling.list_profiles(self.directory), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MODE='sample')
+    def test_sampled_requests_write_collapsed_stacks(self):
+        """Test sampled requests are profiled with the sampling profiler"""
+        self.get_tags(self.user)
+
+        profiles = profiling.list_profiles(self.directory)
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['format'], '.collapsed')
+
+    @override_settings(PROFILING_MAX_FILES=2)
+    def test_ring_is_bounded(self):
+        """Test the oldest profiles are removed beyond the limit"""
+        for _ in range(4):
+            self.get_tags(self.staff, HTTP_X_PROFILE='1')
+            Token.objects.all().delete()
+
+        self.assertEqual(len(profiling.list_profiles(self.directory)), 2)
+
+    def test_profiles_command_lists_and_merges(self):
+        """Test the command lists profiles per route and merges them"""
+        for _ in range(2):
+            self.get_tags(self.staff, HTTP_X_PROFILE='1')
+            Token.objects.all().delete()
+        merged = os.path.join(self.directory, 'merged.out')
+
+        out = StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn('recipe.tag-list: 2 profiles', out.getvalue())
+
+        out = StringIO()
+        call_command('profiles', route='recipe:tag-list', output=merged,
+                     stdout=out)
+        self.assertIn('Merged 2 profiles', out.getvalue())
+        self.assertTrue(os.path.exists(merged))
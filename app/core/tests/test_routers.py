@@ -0,0 +1,104 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+from core.checks import check_shared_cache
+from core.middleware import ReplicaRoutingMiddleware
+from core.routers import pin_to_primary, is_pinned_to_primary
+from recipe.models import Tag
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user(
+            email="router@test.com",
+            password="test_password"
+        )
+
+    def route(self, request, view):
+        """Run the view through the routing middleware"""
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def test_outside_request_uses_primary(self):
+        """Test reads outside a request go to the primary"""
+        self.assertEqual(Tag.objects.all().db, 'default')
+
+    def test_safe_request_reads_replica(self):
+        """Test GET requests read from a replica"""
+        request = self.factory.get('/')
+        request.user = self.user
+
+        self.assertEqual(
+            self.route(request, lambda r: Tag.objects.all().db), 'replica1'
+        )
+
+    def test_unsafe_request_reads_primary(self):
+        """Test reads during a POST go to the primary"""
+        request = self.factory.post('/')
+        request.user = self.user
+
+        self.assertEqual(
+            self.route(request, lambda r: Tag.objects.all().db), 'default'
+        )
+
+    def test_primary_only_apps(self):
+        """Test auth tokens are always read from the primary"""
+        request = self.factory.get('/')
+
+        self.assertEqual(
+            self.route(request, lambda r: Token.objects.all().db), 'default'
+        )
+
+    def test_reads_after_write_in_request_use_primary(self):
+        """Test a request that wrote reads its own write from the primary"""
+        request = self.factory.get('/')
+        request.user = self.user
+
+        def view(r):
+            Tag.objects.create(user=self.user, name='Vegan')
+            return Tag.objects.all().db
+
+        self.assertEqual(self.route(request, view), 'default')
+
+    def test_write_pins_user_to_primary(self):
+        """Test users who wrote keep reading from the primary"""
+        request = self.factory.post('/')
+        request.user = self.user
+        self.route(request, lambda r: Tag.objects.create(
+            user=self.user, name='Vegan'
+        ))
+        self.assertTrue(is_pinned_to_primary(self.user))
+
+        request = self.factory.get('/')
+        request.user = self.user
+        self.assertEqual(
+            self.route(request, lambda r: Tag.objects.all().db), 'default'
+        )
+
+    @override_settings(DATABASE_REPLICA_STICKY_SECONDS=0.05)
+    def test_pin_expires(self):
+        """Test reads return to the replica after the sticky window"""
+        pin_to_primary(self.user)
+        time.sleep(0.1)
+
+        request = self.factory.get('/')
+        request.user = self.user
+        self.assertEqual(
+            self.route(request, lambda r: Tag.objects.all().db), 'replica1'
+        )
+
+    def test_replicas_need_shared_cache(self):
+        """Test replicas with a per-process cache fail the system check"""
+        errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_table'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
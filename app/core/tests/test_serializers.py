@@ -0,0 +1,45 @@
+from django.test import TestCase
+from core.serializers import UserSerializer
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+
+class CachedFieldsTest(TestCase):
+
+    def test_fields_template_built_once(self):
+        """Test the field template is built once per serializer class"""
+        RecipeSerializer().fields
+        template = RecipeSerializer._fields_template
+        RecipeSerializer().fields
+
+        self.assertIs(RecipeSerializer._fields_template, template)
+        self.assertEqual(list(template), list(RecipeSerializer.Meta.fields))
+
+    def test_fields_not_shared_between_instances(self):
+        """Test every serializer instance gets its own bound fields"""
+        first = RecipeSerializer().fields
+        second = RecipeSerializer().fields
+
+        for name in first:
+            self.assertIsNot(first[name], second[name])
+        self.assertIsNot(
+            first['tags'].child_relation,
+            second['tags'].child_relation
+        )
+
+    def test_subclass_keeps_own_template(self):
+        """Test subclasses do not reuse the parent's field template"""
+        RecipeSerializer().fields
+        detail_fields = RecipeDetailSerializer().fields
+
+        self.assertIsNot(
+            RecipeDetailSerializer._fields_template,
+            RecipeSerializer._fields_template
+        )
+        self.assertTrue(detail_fields['tags'].read_only)
+
+    def test_cloned_fields_keep_options(self):
+        """Test cloned fields keep the options from Meta.extra_kwargs"""
+        password = UserSerializer().fields['password']
+
+        self.assertTrue(password.write_only)
+        self.assertEqual(password.min_length, 5)
@@ -0,0 +1,201 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connections
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import routers, sharding
+from core.accounts import delete_account
+from core.checks import check_shard_vendors
+from core.models import ShardAssignment
+from recipe.models import Recipe, Tag, ChangeSequence
+
+SHARDS = ['default', 'shard1', 'shard2']
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardingTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        for alias in SHARDS[1:]:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.directory, f'{alias}.sqlite3'),
+            }
+            with override_settings(DATABASE_SHARDS=SHARDS):
+                call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS[1:]:
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = self.create_user('test_user@y.com', 'shard1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_user(self, email, alias):
+        user = get_user_model().objects.create_user(
+            email=email, password='test_password')
+        ShardAssignment.objects.filter(user_id=user.pk).update(alias=alias)
+        sharding.forget(user.pk)
+        return user
+
+    def create_recipe(self):
+        tag = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        return self.client.post(RECIPES_URL, {
+            'name': 'Salad', 'time': 5, 'price': 3,
+            'tags': [tag.data['id']],
+        })
+
+    def test_new_user_placed(self):
+        """Test new users are put on a shard by their id"""
+        user = get_user_model().objects.create_user(
+            email='new@y.com', password='test_password')
+
+        assignment = ShardAssignment.objects.get(user_id=user.pk)
+        self.assertEqual(assignment.alias, sharding.place(user.pk))
+        self.assertIn(assignment.alias, SHARDS)
+
+    def test_requests_use_users_shard(self):
+        """Test a user's recipes, tags and links go to its shard"""
+        response = self.create_recipe()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.using('shard1').count(), 1)
+        self.assertEqual(Recipe.tags.through.objects.using('shard1')
+                         .count(), 1)
+        self.assertFalse(Recipe.objects.using('default').exists())
+        self.assertEqual(len(self.client.get(RECIPES_URL).data), 1)
+
+        other = self.create_user('other@y.com', 'shard2')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(RECIPES_URL).data, [])
+
+    def test_locked_user_cannot_write(self):
+        """Test writes fail while the user is being moved, reads don't"""
+        ShardAssignment.objects.filter(user_id=self.user.pk) \
+            .update(locked=True)
+        sharding.forget(self.user.pk)
+
+        response = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.client.get(TAGS_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_move_user(self):
+        """Test moving copies every row to the target and switches"""
+        recipe = self.create_recipe().data
+
+        call_command('move_user_shard', self.user.pk, 'shard2',
+                     '--settle', '0', stdout=StringIO())
+
+        self.assertEqual(
+            ShardAssignment.objects.get(user_id=self.user.pk).alias,
+            'shard2')
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        self.assertFalse(Tag.objects.using('shard1').exists())
+        self.assertEqual(self.client.get(RECIPES_URL).data, [recipe])
+        last = ChangeSequence.objects.using('shard2').get(
+            user_id=self.user.pk).last
+        tag = self.client.post(TAGS_URL, {'name': 'Raw'})
+        self.assertGreater(Tag.objects.using('shard2').get(
+            pk=tag.data['id']).seq, last)
+
+    def test_shards_hand_out_disjoint_ids(self):
+        """Test each shard's ids start in its own range"""
+        other = self.create_user('other@y.com', 'shard2')
+        self.create_recipe()
+        self.client.force_authenticate(other)
+        self.create_recipe()
+
+        stride = settings.DATABASE_SHARD_ID_STRIDE
+        self.assertGreaterEqual(Recipe.objects.using('shard1').get().pk,
+                                stride)
+        self.assertGreaterEqual(Recipe.objects.using('shard2').get().pk,
+                                2 * stride)
+
+    def test_shards_on_backends_without_id_ranges(self):
+        """Test the system check rejects shards it can't give id ranges"""
+        self.assertEqual(check_shard_vendors(None), [])
+        with patch.object(connections['shard2'], 'vendor', 'oracle'):
+            self.assertEqual([error.id for error in
+                              check_shard_vendors(None)], ['core.E003'])
+
+    def test_move_next_to_other_users(self):
+        """Test a user moves to a shard other users' rows are on"""
+        recipe = self.create_recipe().data
+        other = self.create_user('other@y.com', 'shard2')
+        self.client.force_authenticate(other)
+        self.create_recipe()
+
+        call_command('move_user_shard', self.user.pk, 'shard2',
+                     '--settle', '0', stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.using('shard2').count(), 2)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(RECIPES_URL).data, [recipe])
+
+    def test_move_with_colliding_ids(self):
+        """Test a move that would reuse another user's ids is undone"""
+        tag_id = self.create_recipe().data['tags'][0]
+        other = self.create_user('other@y.com', 'shard2')
+        Tag.objects.using('shard2').bulk_create(
+            [Tag(pk=tag_id, user=other, name='Clash')])
+
+        with self.assertRaises(CommandError):
+            call_command('move_user_shard', self.user.pk, 'shard2',
+                         '--settle', '0', stdout=StringIO())
+
+        assignment = ShardAssignment.objects.get(user_id=self.user.pk)
+        self.assertEqual(assignment.alias, 'shard1')
+        self.assertFalse(assignment.locked)
+        self.assertEqual(Recipe.objects.using('shard1').count(), 1)
+        self.assertFalse(Recipe.objects.using('shard2').exists())
+
+    def test_shard_map_read_from_primary(self):
+        """Test shard lookups never go to a replica"""
+        request = RequestFactory().get(RECIPES_URL)
+        request.user = self.user
+        token = routers._request_state.set(routers.RequestState(request))
+        try:
+            with override_settings(DATABASE_REPLICAS=['missing']):
+                self.assertEqual(sharding.lookup(self.user.pk),
+                                 ('shard1', False))
+        finally:
+            routers._request_state.reset(token)
+
+    def test_deleted_account_purged_from_shard(self):
+        """Test account deletion removes the rows on the user's shard"""
+        self.create_recipe()
+        self.user.is_active = False
+        self.user.save()
+
+        while get_user_model().objects.filter(pk=self.user.pk).exists():
+            delete_account(self.user.pk)
+
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        self.assertFalse(Tag.objects.using('shard1').exists())
+        self.assertFalse(
+            ShardAssignment.objects.filter(user_id=self.user.pk).exists())
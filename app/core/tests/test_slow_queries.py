@@ -0,0 +1,85 @@
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import slow_queries
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class SlowQueryTest(TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'slow.log')
+        slow_queries._last_explained.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="slow@test.com",
+            password="test_password"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_fingerprint_groups_in_lists(self):
+        """Test IN lists of any length share a fingerprint"""
+        short = 'SELECT * FROM t WHERE id IN (%s, %s)'
+        long = 'SELECT * FROM t WHERE id IN (%s, %s, %s, %s)'
+
+        self.assertEqual(slow_queries.fingerprint(short)[1],
+                         slow_queries.fingerprint(long)[1])
+
+    def test_params_shape_hides_values(self):
+        """Test parameter values are reduced to types and counts"""
+        shape = slow_queries.params_shape([1, 2, 'secret'], False)
+
+        self.assertEqual(shape, {'count': 3, 'types': {'int': 2, 'str': 1}})
+
+    def test_slow_query_logged_with_plan(self):
+        """Test slow queries are logged with route, stack and plan"""
+        with override_settings(SLOW_QUERY_LOG=self.log,
+                               SLOW_QUERY_THRESHOLD_MS=0), \
+                connection.execute_wrapper(slow_queries.detect_slow_queries):
+            self.client.get(RECIPE_URL, {'tags': '1,2,3'})
+            slow_queries.drain()
+
+            records = list(slow_queries.read_log(self.log))
+
+        recipe_queries = [r for r in records if 'recipe_recipe' in r['sql']]
+        self.assertTrue(recipe_queries)
+        record = recipe_queries[0]
+        self.assertEqual(record['route'], 'recipe:recipe-list')
+        self.assertIn('(...)', record['sql'])
+        self.assertTrue(record['plan'])
+        self.assertTrue(any('list' in f for f in record['stack']))
+
+    def test_fast_queries_ignored(self):
+        """Test queries under the threshold are not logged"""
+        with override_settings(SLOW_QUERY_LOG=self.log,
+                               SLOW_QUERY_THRESHOLD_MS=10000), \
+                connection.execute_wrapper(slow_queries.detect_slow_queries):
+            self.client.get(RECIPE_URL)
+            slow_queries.drain()
+
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_summary_command(self):
+        """Test the summary command ranks statements from the log"""
+        with override_settings(SLOW_QUERY_LOG=self.log,
+                               SLOW_QUERY_THRESHOLD_MS=0), \
+                connection.execute_wrapper(slow_queries.detect_slow_queries):
+            self.client.get(RECIPE_URL)
+            self.client.get(RECIPE_URL)
+            slow_queries.drain()
+
+        out = StringIO()
+        call_command('slow_queries', log=self.log, stdout=out,
+                     route='recipe:recipe-list')
+
+        self.assertIn('2x total', out.getvalue())
+        self.assertIn('recipe:recipe-list', out.getvalue())
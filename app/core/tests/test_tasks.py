@@ -0,0 +1,158 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from core import metrics, tasks
+from core.models import Task
+
+calls = []
+
+
+@tasks.task(name='test.record')
+def record(value, times=1):
+    calls.extend([value] * times)
+
+
+@tasks.task(name='test.broken', max_attempts=2)
+def broken():
+    raise RuntimeError('broken')
+
+
+class TaskQueueTest(TestCase):
+
+    def setUp(self) -> None:
+        calls.clear()
+
+    def test_delay_and_run(self):
+        """Test a delayed call runs once and leaves no row behind"""
+        record.delay('a', times=2)
+
+        self.assertEqual(tasks.run_due(), 1)
+
+        self.assertEqual(calls, ['a', 'a'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_not_due_yet(self):
+        """Test tasks scheduled for later wait"""
+        tasks.enqueue('test.record', ['a'], delay=60)
+
+        self.assertEqual(tasks.run_due(), 0)
+        self.assertEqual(calls, [])
+
+    def test_retry_with_backoff_then_fail(self):
+        """Test failures are retried later and kept after the last try"""
+        broken.delay()
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_due(), 1)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts),
+                         (Task.PENDING, 1))
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertIn('RuntimeError', task.last_error)
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.tasks', 'WARNING'):
+            tasks.run_due()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertEqual(tasks.run_due(), 0)
+
+    def test_unknown_task_fails(self):
+        """Test a task nobody registered fails without retries"""
+        tasks.enqueue('test.missing')
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            tasks.run_due()
+
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    def test_abandoned_task_claimed_again(self):
+        """Test a task whose worker died is run by another one"""
+        record.delay('a')
+        self.assertEqual(len(tasks.claim('dead-worker')), 1)
+        self.assertEqual(tasks.claim('other'), [])
+
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(tasks.run_due('other'), 1)
+        self.assertEqual(calls, ['a'])
+
+    def test_abandoned_last_attempt_fails(self):
+        """Test an abandoned task without attempts left isn't run again"""
+        broken.delay()
+        tasks.claim('dead-worker')
+        Task.objects.update(attempts=2,
+                            locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(tasks.run_due('other'), 0)
+
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_heartbeat(self):
+        """Test running tasks stay claimed past the lock timeout"""
+        record.delay('a')
+        tasks.claim('host:1:0')
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        worker = tasks.Worker()
+        worker.running.add('host:1:0')
+
+        worker.heartbeat()
+
+        self.assertEqual(tasks.claim('other'), [])
+
+    def test_metrics(self):
+        """Test outcomes and durations are recorded per task"""
+        metrics.registry.counters.clear()
+        record.delay('a')
+        broken.delay()
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            tasks.run_due()
+
+        counters = metrics.registry.counters
+        self.assertEqual(counters[('tasks_processed_total', (
+            ('task', 'test.record'), ('outcome', 'done')))], 1)
+        self.assertEqual(counters[('tasks_processed_total', (
+            ('task', 'test.broken'), ('outcome', 'retry')))], 1)
+        self.assertIn(('task_duration_seconds', (('task', 'test.record'),)),
+                      metrics.registry.histograms)
+
+
+# Worker threads only see committed tasks
+class WorkerCommandTest(TransactionTestCase):
+
+    def setUp(self) -> None:
+        calls.clear()
+
+    def test_worker_command_burst(self):
+        """Test the worker command runs due tasks and exits when idle"""
+        for value in 'abc':
+            record.delay(value)
+
+        call_command('worker', '--burst', '--threads', '1',
+                     stdout=StringIO())
+
+        self.assertEqual(sorted(calls), ['a', 'b', 'c'])
+
+    def test_worker_survives_database_errors(self):
+        """Test a failure recording a task doesn't stop the thread"""
+        for value in 'ab':
+            record.delay(value)
+        execute = tasks.execute
+        failures = [DatabaseError('gone')]
+
+        def flaky(task_row):
+            if failures:
+                raise failures.pop()
+            return execute(task_row)
+
+        with patch('core.tasks.execute', side_effect=flaky), \
+                self.assertLogs('core.tasks', 'ERROR'):
+            tasks.Worker(threads=1).run(burst=True)
+
+        self.assertEqual(len(calls), 1)
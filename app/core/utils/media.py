@@ -0,0 +1,135 @@
+"""
+Serving uploaded files after the view has checked access.
+
+With ``settings.MEDIA_SENDFILE`` set the response is empty and the front
+proxy sends the file: ``x-accel-redirect`` for nginx (an ``internal``
+location at ``MEDIA_ACCEL_PREFIX`` aliasing ``MEDIA_ROOT``) or
+``x-sendfile`` for Apache/lighttpd. Otherwise Django streams it with a
+FileResponse, answering single ``Range`` requests itself.
+
+Upload names are unique (see recipe.utils.recipe.get_image_path) and a
+new upload gets a new name, so the name doubles as the ETag. A URL
+naming the version it wants (``?v=<name>``, see ``versioned_url``) may
+be cached for good; without one the URL stays the same when the file is
+replaced, so clients revalidate it with the ETag.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote, urlencode
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE = 'private, no-cache'
+VERSION_PARAM = 'v'
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRenderer(JSONRenderer):
+    """
+    Lets file views pass content negotiation whatever the client accepts;
+    the views return plain Django responses, errors still come out as JSON
+    """
+    media_type = '*/*'
+    format = 'file'
+
+
+class _FileRange:
+    """Read at most ``length`` bytes of ``fh`` from ``start``"""
+
+    def __init__(self, fh, start, length):
+        fh.seek(start)
+        self.fh = fh
+        self.remaining = length
+
+    def read(self, size):
+        data = self.fh.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fh.close()
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` of a single ``bytes=`` range, inclusive; None to send
+    the whole file; ValueError when it lies outside a ``size`` byte file
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Malformed or several ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def version(field_file):
+    return os.path.basename(field_file.name)
+
+
+def versioned_url(url, field_file):
+    """``url`` pinned to the current version of ``field_file``"""
+    return f'{url}?{urlencode({VERSION_PARAM: version(field_file)})}'
+
+
+def serve(request, field_file, immutable=False):
+    """
+    Response sending ``field_file`` (a FieldFile) to the client, cacheable
+    for good when ``immutable``
+    """
+    etag = '"{}"'.format(version(field_file))
+    content_type = mimetypes.guess_type(field_file.name)[0] \
+        or 'application/octet-stream'
+
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponse(status=304)
+    elif settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_PREFIX + field_file.name)
+    elif settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    else:
+        response = _stream(request, field_file, content_type, etag)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL if immutable else REVALIDATE
+    return response
+
+
+def _stream(request, field_file, content_type, etag):
+    size = field_file.size
+    header = request.META.get('HTTP_RANGE')
+    # A Range only applies to the version the client already has part of
+    if header and request.META.get('HTTP_IF_RANGE', etag) != etag:
+        header = None
+    try:
+        byte_range = parse_range(header, size) if header else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    fh = field_file.storage.open(field_file.name, 'rb')
+    if byte_range is None:
+        # Whole files can go out through the server's wsgi.file_wrapper
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(_FileRange(fh, start, end - start + 1),
+                                status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from rest_framework.fields import Field
+
+
+def clone_field(field: Field):
+    """
+    Return a fresh, unbound copy of a serializer field.
+
+    Like DRF's own ``Field.__deepcopy__`` the field is re-instantiated from
+    the arguments it was created with, but only nested fields are cloned;
+    every other argument (querysets, validators, choices) is shared, since
+    DRF never mutates them after construction.
+    """
+    args = [_clone_value(arg) for arg in field._args]
+    kwargs = {key: _clone_value(value) for key, value in field._kwargs.items()}
+    return field.__class__(*args, **kwargs)
+
+
+def _clone_value(value):
+    if isinstance(value, Field):
+        return clone_field(value)
+    return value
+
+
+class CachedFieldsMixin:
+    """
+    Build the serializer field mapping once per class and clone it for
+    every instance instead of re-introspecting the model on each request
+    """
+
+    def get_fields(self):
+        cls = type(self)
+        template = cls.__dict__.get('_fields_template')
+        if template is None:
+            template = super().get_fields()
+            cls._fields_template = template
+
+        return OrderedDict(
+            (name, clone_field(field)) for name, field in template.items()
+        )
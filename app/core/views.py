@@ -1,7 +1,30 @@
-from rest_framework import generics, permissions, authentication
+from django.conf import settings
+from django.db.utils import InterfaceError, OperationalError
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import generics, permissions, authentication, status, \
+    exceptions, views
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .serializers import UserSerializer, AuthTokenSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from . import accounts, hashing, metrics
+from .db import probe_database
+
+
+class ServiceBusy(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server busy, retry shortly.'
+    default_code = 'service_busy'
+
+
+def exception_handler(exc, context):
+    """DRF's handler, plus the errors raised below the views"""
+    if isinstance(exc, hashing.HashingOverloaded):
+        exc = ServiceBusy('Too many sign-ins at once, retry shortly.',
+                          'hashing_overloaded')
+    return views.exception_handler(exc, context)
 
 
 class CreatUserView(generics.CreateAPIView):
@@ -19,7 +42,7 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Managing user profile details"""
     serializer_class = UserSerializer
     authentication_classes = (authentication.TokenAuthentication,)
@@ -27,3 +50,48 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the account now, its data goes in the background"""
+        accounts.schedule_deletion(self.get_object())
+        return Response(data={"status": "scheduled"},
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class HealthView(APIView):
+    """Liveness/readiness probe reporting the database round trip"""
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        try:
+            latency = probe_database()
+        except (OperationalError, InterfaceError):
+            # InterfaceError: the connection was dropped under us
+            return Response(
+                data={"status": "unavailable", "database": None},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        return Response(data={
+            "status": "ok",
+            "database": {"latency_ms": round(latency * 1000, 3)}
+        })
+
+
+def metrics_view(request):
+    """Expose request metrics of all workers in Prometheus text format"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    else:
+        # Without a scraper token only staff signed in to the admin
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,5 +1,44 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete, post_delete, \
+    m2m_changed, post_migrate
 
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        from core.accounts import purge_user
+        from .counters import count_links_changed, count_recipe_deleted
+        from .documents import schedule_saved, schedule_links_changed, \
+            drop_linked
+        from .events import publish_saved, publish_deleted, \
+            publish_links_changed
+        from .models import Tag, Ingredient, Recipe
+        from .purge import purge_cookbook
+        from .sync import record_deletion, record_links_changed, \
+            forget_user
+        from .utils.stats import invalidate_saved, invalidate_links_changed
+        from .utils.terms import clear_cache
+
+        for model in (Tag, Ingredient, Recipe):
+            post_save.connect(publish_saved, sender=model)
+            post_delete.connect(publish_deleted, sender=model)
+            post_delete.connect(record_deletion, sender=model)
+            post_save.connect(invalidate_saved, sender=model)
+            post_delete.connect(invalidate_saved, sender=model)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(publish_links_changed, sender=through)
+            m2m_changed.connect(record_links_changed, sender=through)
+            m2m_changed.connect(count_links_changed, sender=through)
+            m2m_changed.connect(invalidate_links_changed, sender=through)
+        for model in (Tag, Ingredient):
+            post_save.connect(drop_linked, sender=model)
+            pre_delete.connect(drop_linked, sender=model)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(schedule_links_changed, sender=through)
+        post_save.connect(schedule_saved, sender=Recipe)
+        pre_delete.connect(count_recipe_deleted, sender=Recipe)
+        post_delete.connect(forget_user, sender=get_user_model())
+        purge_user.connect(purge_cookbook, sender=get_user_model())
+        post_migrate.connect(clear_cache, sender=self)
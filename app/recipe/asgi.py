@@ -0,0 +1,303 @@
+"""
+Native ASGI handlers for the read-only recipe API.
+
+Django 3.0 has no async views and DRF views are synchronous, so under
+ASGI every request would hold a thread from start to finish, including
+while a slow client uploads its request or downloads the response. The
+list/retrieve endpoints below are served straight from the event loop
+instead: only the token lookup, the query and the serialization run on a
+bounded thread pool. The change feed of recipe/events.py is streamed
+from here as well, each open stream costing a queue rather than a thread.
+Everything else falls through to Django.
+
+These requests skip Django's middleware, so what it does for them is
+done here: the headers of SecurityMiddleware and XFrameOptionsMiddleware
+are added, and the handlers run with the request state ReplicaRouter,
+ShardRouter and the slow query log expect. Requests that need more
+(plain http under SECURE_SSL_REDIRECT, profiled requests) fall through
+to Django. Sessions, CSRF and messages don't apply to token-authenticated
+reads.
+"""
+import asyncio
+import random
+import time
+from django.conf import settings
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, Resolver404
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from core import metrics
+from core.authentication import AsyncTokenAuthentication
+from core.executor import BoundedExecutor
+from core.routers import RequestState, _request_state
+from . import documents, events
+from .models import Tag, Ingredient, Recipe
+from .serializers import TagSerializer, IngredientSerializer, \
+    RecipeSerializer, RecipeDetailSerializer
+from .views import filter_recipes, filter_recipe_attrs
+
+
+def list_recipes(user, query_params):
+    if settings.RECIPE_DOCUMENTS and not query_params:
+        return documents.summaries(user).encode()
+    queryset = filter_recipes(Recipe.objects.all(), user, query_params)
+    return RecipeSerializer(queryset, many=True).data
+
+
+def retrieve_recipe(user, query_params, pk):
+    stored = settings.RECIPE_DOCUMENTS and not query_params
+    queryset = filter_recipes(Recipe.objects.all(), user, query_params)
+    try:
+        document = documents.detail(user, pk) if stored else None
+        if document is not None:
+            return document.encode()
+        recipe = queryset.get(pk=pk)
+    except (Recipe.DoesNotExist, ValueError):
+        raise exceptions.NotFound()
+    if stored:
+        documents.schedule([recipe.pk])
+    return RecipeDetailSerializer(recipe).data
+
+
+def list_tags(user, query_params):
+    queryset = filter_recipe_attrs(Tag.objects.all(), user, query_params)
+    return TagSerializer(queryset, many=True).data
+
+
+def list_ingredients(user, query_params):
+    queryset = filter_recipe_attrs(Ingredient.objects.all(), user,
+                                   query_params)
+    return IngredientSerializer(queryset, many=True).data
+
+
+HANDLERS = {
+    'recipe:recipe-list': list_recipes,
+    'recipe:recipe-detail': retrieve_recipe,
+    'recipe:tag-list': list_tags,
+    'recipe:ingredient-list': list_ingredients,
+}
+EVENTS_VIEW = 'recipe:events'
+
+
+def is_secure(scope):
+    """request.is_secure() for an ASGI scope"""
+    if settings.SECURE_PROXY_SSL_HEADER:
+        header, secure = settings.SECURE_PROXY_SSL_HEADER
+        name = header[len('HTTP_'):].lower().replace('_', '-').encode()
+        for key, value in scope['headers']:
+            if key == name:
+                return value.decode('latin-1') == secure
+    return scope.get('scheme') == 'https'
+
+
+def security_headers(scope):
+    """The headers SecurityMiddleware and XFrameOptionsMiddleware add"""
+    headers = []
+    if settings.SECURE_HSTS_SECONDS and is_secure(scope):
+        hsts = f'max-age={settings.SECURE_HSTS_SECONDS}'
+        if settings.SECURE_HSTS_INCLUDE_SUBDOMAINS:
+            hsts += '; includeSubDomains'
+        if settings.SECURE_HSTS_PRELOAD:
+            hsts += '; preload'
+        headers.append((b'strict-transport-security', hsts.encode()))
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        headers.append((b'x-content-type-options', b'nosniff'))
+    if settings.SECURE_BROWSER_XSS_FILTER:
+        headers.append((b'x-xss-protection', b'1; mode=block'))
+    policy = settings.SECURE_REFERRER_POLICY
+    if policy:
+        if not isinstance(policy, str):
+            policy = ','.join(policy)
+        headers.append((b'referrer-policy', policy.encode()))
+    frame_options = getattr(settings, 'X_FRAME_OPTIONS', 'DENY')
+    headers.append((b'x-frame-options', frame_options.upper().encode()))
+    return headers
+
+
+class AsyncRecipeAPI:
+    """ASGI application serving HANDLERS natively, Django for the rest"""
+
+    def __init__(self, fallback, executor=None):
+        self.fallback = fallback
+        self.executor = executor or BoundedExecutor(
+            max_workers=settings.ASYNC_API_THREADS,
+            max_pending=settings.ASYNC_API_MAX_PENDING,
+        )
+        self.authentication = AsyncTokenAuthentication(self.executor)
+        self.renderer = JSONRenderer()
+
+    async def __call__(self, scope, receive, send):
+        route = self._route(scope)
+        if route is None:
+            return await self.fallback(scope, receive, send)
+
+        view_name = route.view_name
+        if view_name == EVENTS_VIEW:
+            return await self._stream_events(scope, receive, send)
+        start = time.perf_counter()
+        queries = [0, 0.0]
+        status, body = await self._handle(scope, route, queries)
+        render_start = time.perf_counter()
+        # Stored documents come back already rendered
+        content = body if isinstance(body, bytes) \
+            else self.renderer.render(body)
+        render_time = time.perf_counter() - render_start
+
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(content)).encode()),
+            (b'vary', b'Accept'),
+        ] + security_headers(scope)
+        if status == 401:
+            headers.append((b'www-authenticate', b'Token'))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        # HEAD gets the headers of GET, Content-Length included
+        await send({'type': 'http.response.body',
+                    'body': b'' if scope['method'] == 'HEAD' else content})
+
+        metrics.registry.record_request(
+            route=view_name, method=scope['method'], status=status,
+            elapsed=time.perf_counter() - start, query_count=queries[0],
+            query_time=queries[1], render_time=render_time,
+            size=len(content),
+        )
+
+    def _route(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return None
+        if settings.SECURE_SSL_REDIRECT and not is_secure(scope):
+            return None
+        for name, value in scope['headers']:
+            # Leave browsers to DRF's browsable API
+            if name == b'accept' and b'text/html' in value:
+                return None
+            if name == b'x-profile' and settings.PROFILING_DIR:
+                return None
+        rate = settings.PROFILING_SAMPLE_RATE
+        if settings.PROFILING_DIR and rate and random.random() < rate:
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        if match.view_name not in HANDLERS \
+                and match.view_name != EVENTS_VIEW:
+            return None
+        return match
+
+    async def _authenticate(self, scope, ticket=False):
+        authorization = b''
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                authorization = value
+        auth = await self.authentication.authenticate_async(authorization)
+        if auth is not None:
+            return auth[0]
+        if ticket:
+            query = QueryDict(scope.get('query_string', b''))
+            if query.get('ticket'):
+                return await self.executor.run(events.ticket_user,
+                                               query['ticket'])
+        raise exceptions.NotAuthenticated()
+
+    async def _handle(self, scope, match, queries):
+        try:
+            user = await self._authenticate(scope)
+            query_params = QueryDict(scope.get('query_string', b''))
+            request = HttpRequest()
+            request.method = scope['method']
+            request.path = request.path_info = scope['path']
+            request.resolver_match = match
+            request.user = user
+            data = await self.executor.run(
+                self._call, HANDLERS[match.view_name], queries, request,
+                query_params, **match.kwargs
+            )
+        except exceptions.APIException as error:
+            return error.status_code, {'detail': error.detail}
+        except BoundedExecutor.Overloaded:
+            return 503, {'detail': 'Server busy, retry shortly.'}
+        except ValueError:
+            return 400, {'detail': 'Malformed query parameter.'}
+        return 200, data
+
+    async def _stream_events(self, scope, receive, send):
+        """Hold a text/event-stream open, pushing the user's changes"""
+        headers = [(b'content-type', b'text/event-stream'),
+                   (b'cache-control', b'no-cache'),
+                   (b'x-accel-buffering', b'no')] + security_headers(scope)
+        try:
+            user = await self._authenticate(scope, ticket=True)
+        except (exceptions.APIException, BoundedExecutor.Overloaded) as error:
+            if isinstance(error, exceptions.APIException):
+                status, detail = error.status_code, error.detail
+            else:
+                status, detail = 503, 'Server busy, retry shortly.'
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': headers})
+            await send({'type': 'http.response.body',
+                        'body': events.encode_event(events.Event(
+                            None, 'error', {'detail': detail}))})
+            return
+
+        broker = events.get_broker()
+        # Subscribe before replaying so nothing slips in between
+        subscription = broker.subscribe(user.id)
+        disconnected = asyncio.ensure_future(self._disconnect(receive))
+        try:
+            last_event_id = None
+            for name, value in scope['headers']:
+                if name == b'last-event-id':
+                    last_event_id = value.decode('latin-1')
+            content, cursor = events.replay(broker, user.id, last_event_id)
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': headers})
+            await send({'type': 'http.response.body', 'body': content,
+                        'more_body': True})
+
+            while not subscription.overflowed:
+                getter = asyncio.ensure_future(subscription.get())
+                await asyncio.wait({getter, disconnected},
+                                   timeout=settings.EVENTS_HEARTBEAT,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    getter.cancel()
+                    return
+                if getter.done():
+                    event = getter.result()
+                    if event.id <= cursor:
+                        continue
+                    content = events.encode_event(event)
+                else:
+                    getter.cancel()
+                    content = b': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': content,
+                            'more_body': True})
+            # Too far behind: end the stream, the client resumes from its
+            # Last-Event-ID
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    @staticmethod
+    async def _disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def _call(handler, queries, request, *args, **kwargs):
+        """
+        Run a handler on a pool thread, counting its queries, with the
+        request state the middleware would have set
+        """
+        queries_token = metrics.query_stats.set(queries)
+        request_token = metrics.current_request.set(request)
+        state_token = _request_state.set(RequestState(request))
+        try:
+            return handler(request.user, *args, **kwargs)
+        finally:
+            _request_state.reset(state_token)
+            metrics.current_request.reset(request_token)
+            metrics.query_stats.reset(queries_token)
@@ -0,0 +1,89 @@
+"""
+``recipe_count`` on tags and ingredients: the number of recipes using
+them, kept in step with ``F()`` updates as links are added and removed
+so popularity ordering and ``assigned_only`` need no join.
+``manage.py repair_recipe_counts`` recomputes them from the links.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Tag, Ingredient, Recipe
+
+COUNTED = ((Tag, 'tags', 'tag_id'), (Ingredient, 'ingredients',
+                                     'ingredient_id'))
+
+
+def _linked(through, recipe_ids, target_field, target_ids):
+    """Ids of targets actually linked to the recipes, once per link"""
+    links = through.objects.filter(recipe_id__in=recipe_ids)
+    if target_ids is not None:
+        links = links.filter(**{f'{target_field}__in': target_ids})
+    return list(links.values_list(target_field, flat=True))
+
+
+def _adjust(model, ids, delta):
+    """Add ``delta`` per occurrence of each id"""
+    per_id = {}
+    for pk in ids:
+        per_id[pk] = per_id.get(pk, 0) + delta
+    by_amount = {}
+    for pk, amount in per_id.items():
+        by_amount.setdefault(amount, []).append(pk)
+    for amount, pks in by_amount.items():
+        model.objects.filter(pk__in=pks).update(
+            recipe_count=F('recipe_count') + amount)
+
+
+def count_links_changed(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    """m2m_changed handler for Recipe.tags and Recipe.ingredients"""
+    target_field = 'tag_id' if sender is Recipe.tags.through \
+        else 'ingredient_id'
+    target = Tag if target_field == 'tag_id' else Ingredient
+
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() reports the ids it was given, clear() none at all, so
+        # look up which links really go before they do
+        if reverse:
+            recipe_ids = pk_set if action == 'pre_remove' else None
+            links = sender.objects.filter(**{target_field: instance.pk})
+            if recipe_ids is not None:
+                links = links.filter(recipe_id__in=recipe_ids)
+            instance._removed_links = [instance.pk] * links.count()
+        else:
+            instance._removed_links = _linked(
+                sender, [instance.pk], target_field,
+                pk_set if action == 'pre_remove' else None)
+    elif action in ('post_remove', 'post_clear'):
+        _adjust(target, getattr(instance, '_removed_links', ()), -1)
+        instance._removed_links = ()
+    elif action == 'post_add' and pk_set:
+        # pk_set only holds the links that were actually created
+        if reverse:
+            _adjust(target, [instance.pk] * len(pk_set), 1)
+        else:
+            _adjust(target, pk_set, 1)
+
+
+def count_recipe_deleted(sender, instance, **kwargs):
+    """pre_delete: the recipe's links are about to be removed"""
+    for model in (Tag, Ingredient):
+        model.objects.filter(recipe=instance).update(
+            recipe_count=F('recipe_count') - 1)
+
+
+def recount(model, relation, target_field):
+    """
+    Recompute ``model.recipe_count`` from the links in one statement and
+    return how many rows were wrong
+    """
+    through = getattr(Recipe, relation).through
+    actual = Coalesce(Subquery(
+        through.objects.filter(**{target_field: OuterRef('pk')})
+        .order_by().values(target_field).annotate(count=Count('*'))
+        .values('count')
+    ), 0)
+    wrong = model.objects.annotate(actual=actual) \
+        .exclude(recipe_count=F('actual')).count()
+    if wrong:
+        model.objects.update(recipe_count=actual)
+    return wrong
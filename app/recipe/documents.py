@@ -0,0 +1,236 @@
+"""
+Pre-rendered recipe documents for the read path.
+
+Each recipe's detail JSON and its entry in the list JSON are stored in a
+``RecipeDocument`` stamped with the recipe's ``seq``. Saves and link
+changes already move ``seq`` on (recipe.sync), so a document is current
+exactly while the two match and the readers below check that in the
+same query that fetches it. Renaming or deleting a tag or ingredient
+doesn't touch the recipes using it, so their documents are dropped.
+
+Rebuilds run on a background thread once the change commits; until then
+readers render the affected recipes themselves. A rename that races a
+rebuild can still leave an outdated document behind, which
+``manage.py check_recipe_documents --repair`` finds and rebuilds.
+"""
+import json
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db import connections, router, transaction, IntegrityError
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from core import sharding
+from .models import Tag, Ingredient, Recipe, RecipeIngredient, \
+    RecipeDocument
+from .serializers import RecipeSerializer, RecipeDetailSerializer
+
+MAX_PENDING = 1000
+BATCH_SIZE = 100
+
+# model -> (through model, field pointing at it)
+LINKS = {
+    Tag: (Recipe.tags.through, 'tag_id'),
+    Ingredient: (RecipeIngredient, 'ingredient_id'),
+}
+
+logger = logging.getLogger(__name__)
+
+_pending = queue.Queue(maxsize=MAX_PENDING)
+_worker = None
+_worker_lock = threading.Lock()
+_renderer = JSONRenderer()
+
+
+def prefetched(recipe_ids):
+    """The recipes with everything their documents render"""
+    return Recipe.objects.filter(pk__in=recipe_ids).prefetch_related(
+        'tags', 'ingredients', 'amounts')
+
+
+def render(recipe):
+    """``(detail, summary)`` JSON of a recipe, as the API renders them"""
+    return (_renderer.render(RecipeDetailSerializer(recipe).data).decode(),
+            _renderer.render(RecipeSerializer(recipe).data).decode())
+
+
+def build(recipe_ids):
+    """(Re)build the documents of the given recipes, return how many"""
+    built = 0
+    for recipe in prefetched(recipe_ids):
+        detail, summary = render(recipe)
+        try:
+            with transaction.atomic(
+                    using=router.db_for_write(RecipeDocument)):
+                RecipeDocument.objects.update_or_create(
+                    recipe_id=recipe.pk,
+                    defaults={'seq': recipe.seq, 'detail': detail,
+                              'summary': summary},
+                )
+        except IntegrityError:
+            # Deleted since it was read
+            continue
+        built += 1
+    return built
+
+
+def schedule(recipe_ids):
+    """Rebuild documents in the background once the transaction commits"""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids and settings.RECIPE_DOCUMENTS:
+        # The worker has no request to tell it the shard
+        db = sharding.current_alias()
+        transaction.on_commit(lambda: _enqueue(db, recipe_ids), using=db)
+
+
+def _enqueue(db, recipe_ids):
+    try:
+        _pending.put_nowait((db, recipe_ids))
+    except queue.Full:
+        # Readers keep rendering these until the next change or repair
+        logger.warning('Recipe document queue full, dropping %d',
+                       len(recipe_ids))
+        return
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, daemon=True,
+                                       name='recipe-documents')
+            _worker.start()
+
+
+def _work():
+    while True:
+        batches = [_pending.get()]
+        # Coalesce whatever else is waiting into one pass
+        while len(batches) < BATCH_SIZE:
+            try:
+                batches.append(_pending.get_nowait())
+            except queue.Empty:
+                break
+        shards = {}
+        for db, recipe_ids in batches:
+            shards.setdefault(db, set()).update(recipe_ids)
+        try:
+            for db, recipe_ids in shards.items():
+                with sharding.using(db):
+                    build(recipe_ids)
+        except Exception:
+            logger.exception('Failed to build recipe documents')
+        finally:
+            for _ in batches:
+                _pending.task_done()
+            connections.close_all()
+
+
+def drain():
+    """Block until every scheduled rebuild has run"""
+    _pending.join()
+
+
+def detail(user, pk):
+    """Stored detail JSON of ``user``'s recipe ``pk``, None unless current"""
+    return Recipe.objects.filter(
+        user=user, pk=pk, document__seq=F('seq')
+    ).values_list('document__detail', flat=True).first()
+
+
+def summaries(user):
+    """
+    The list JSON of all of ``user``'s recipes in id order, put together
+    from their stored entries. Recipes without a current document are
+    rendered here and scheduled for a rebuild
+    """
+    rows = list(Recipe.objects.filter(user=user).order_by('id').values_list(
+        'id', 'seq', 'document__seq', 'document__summary'))
+    stale = [pk for pk, seq, built, _ in rows if built != seq]
+    rendered = {}
+    if stale:
+        rendered = {recipe.pk: render(recipe)[1]
+                    for recipe in prefetched(stale)}
+        schedule(stale)
+    return '[' + ','.join(
+        rendered.get(pk, summary) for pk, seq, built, summary in rows
+        if pk in rendered or built == seq
+    ) + ']'
+
+
+def usable(request):
+    """
+    Whether ``request`` may be answered with stored JSON: an unfiltered,
+    default ordered read that DRF would render with plain JSONRenderer
+    """
+    return (settings.RECIPE_DOCUMENTS and not request.query_params
+            and type(request.accepted_renderer) is JSONRenderer
+            and 'indent' not in request.accepted_media_type)
+
+
+class DocumentResponse(Response):
+    """A Response whose body is already rendered JSON"""
+
+    def __init__(self, document, **kwargs):
+        super().__init__(**kwargs)
+        self.document = document
+
+    @property
+    def data(self):
+        # Only parsed when somebody looks, e.g. the test client
+        if self._data is None and self.document is not None:
+            self._data = json.loads(self.document)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = 'application/json'
+        return self.document.encode()
+
+
+def schedule_saved(sender, instance, **kwargs):
+    """post_save of a recipe"""
+    schedule([instance.pk])
+
+
+def schedule_links_changed(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """m2m_changed of Recipe.tags and Recipe.ingredients"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule([instance.pk])
+        return
+    if action == 'pre_clear' and settings.RECIPE_DOCUMENTS:
+        # clear() from the tag/ingredient side names no recipes
+        through, field = LINKS[type(instance)]
+        instance._cleared_recipes = list(through.objects.filter(
+            **{field: instance.pk}).values_list('recipe_id', flat=True))
+    elif action == 'post_clear':
+        schedule(getattr(instance, '_cleared_recipes', ()))
+        instance._cleared_recipes = ()
+    elif action in ('post_add', 'post_remove'):
+        schedule(pk_set or ())
+
+
+def drop_linked(sender, instance, created=False, **kwargs):
+    """
+    post_save and pre_delete of tags and ingredients: the names embedded
+    in the detail JSON of the recipes using them go out of date
+    """
+    if created or not settings.RECIPE_DOCUMENTS:
+        return
+    through, field = LINKS[sender]
+    recipe_ids = list(through.objects.filter(
+        **{field: instance.pk}).values_list('recipe_id', flat=True))
+    if recipe_ids:
+        RecipeDocument.objects.filter(recipe_id__in=recipe_ids).delete()
+        schedule(recipe_ids)
@@ -0,0 +1,269 @@
+"""
+Change feed for recipes, tags and ingredients.
+
+Model signals publish ``<model>.<created|updated|deleted>`` events to a
+broker once the writing transaction commits; ``recipe/asgi.py`` streams
+each user's events as server-sent events and replays the ones a client
+missed from its ``Last-Event-ID``.
+
+Browsers' EventSource can't send an Authorization header, so a client
+first POSTs to ``events/ticket/`` with its token and opens
+``events/?ticket=<ticket>``. Tickets are signed, carry nothing but the
+user id and expire after ``EVENTS_TICKET_SECONDS``; they are only
+checked when a stream is opened, so a client whose reconnect is refused
+fetches a new ticket and opens the stream again.
+
+The broker is ``settings.EVENTS_BROKER``. ``InProcessBroker`` only sees
+writes made by its own process, so with several server processes, swap
+in a shared broker (Redis pub/sub, Postgres LISTEN/NOTIFY) implementing
+``publish``, ``subscribe``, ``latest_id`` and ``since``.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque, namedtuple
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+Event = namedtuple('Event', 'id type data')
+TICKET_SALT = 'recipe.events.ticket'
+
+
+class Subscription:
+    """One stream's queue of live events, filled from any thread"""
+
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        # Set when the client fell too far behind to keep up; it has to
+        # reconnect and replay from history
+        self.overflowed = False
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan events out to this process's streams, keeping recent history"""
+
+    def __init__(self, history=None, queue_size=None):
+        self.history = history or settings.EVENTS_HISTORY
+        self.queue_size = queue_size or settings.EVENTS_QUEUE_SIZE
+        self.lock = threading.Lock()
+        # Ids keep increasing across restarts, so a Last-Event-ID from a
+        # previous process is recognised as older than our history
+        self.counter = itertools.count(time.time_ns() // 1000)
+        self.first_id = self.last_id = next(self.counter)
+        self.events = {}
+        self.evicted = {}
+        self.subscribers = {}
+
+    def publish(self, user_id, event_type, data):
+        with self.lock:
+            self.last_id = next(self.counter)
+            event = Event(self.last_id, event_type, data)
+            events = self.events.setdefault(user_id, deque())
+            if len(events) == self.history:
+                self.evicted[user_id] = events.popleft().id
+            events.append(event)
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, user_id):
+        """Call from the event loop that will consume the events"""
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscribers.pop(subscription.user_id, None)
+
+    def latest_id(self):
+        return self.last_id
+
+    def since(self, user_id, last_id):
+        """
+        Events after ``last_id``, or None when some of them are no longer
+        in the history and the client must refetch
+        """
+        with self.lock:
+            if last_id < self.first_id - 1 \
+                    or last_id < self.evicted.get(user_id, 0):
+                return None
+            return [event for event in self.events.get(user_id, ())
+                    if event.id > last_id]
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def encode_event(event):
+    """Format an event for a text/event-stream response"""
+    data = json.dumps(event.data, cls=JSONEncoder)
+    lines = [f'event: {event.type}', f'data: {data}']
+    if event.id is not None:
+        lines.insert(0, f'id: {event.id}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def replay(broker, user_id, last_event_id):
+    """
+    What a (re)connecting client gets first, and the id after which its
+    live events start. Clients without a usable Last-Event-ID get a
+    ``ready`` event (or ``reset`` when history was lost) carrying the
+    current id: refetch, then follow the stream from there.
+    """
+    content = f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode()
+    last_id = parse_last_event_id(last_event_id)
+    missed = None if last_id is None else broker.since(user_id, last_id)
+    if missed:
+        return content + b''.join(map(encode_event, missed)), missed[-1].id
+    if missed is None:
+        cursor = broker.latest_id()
+        event_type = 'ready' if last_id is None else 'reset'
+        return content + encode_event(Event(cursor, event_type, {})), cursor
+    return content, last_id
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        # Errors raised before the view ran, e.g. authentication
+        return encode_event(Event(None, 'error', data))
+
+
+def issue_ticket(user):
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def ticket_user(ticket):
+    """The active user a ticket was issued to"""
+    try:
+        user_id = signing.loads(ticket, salt=TICKET_SALT,
+                                max_age=settings.EVENTS_TICKET_SECONDS)
+    except signing.BadSignature:
+        raise AuthenticationFailed('Invalid or expired ticket.')
+    user = get_user_model()._default_manager \
+        .filter(pk=user_id, is_active=True).first()
+    if user is None:
+        raise AuthenticationFailed('User inactive or deleted.')
+    return user
+
+
+class TicketAuthentication(BaseAuthentication):
+    """``?ticket=`` from issue_ticket, for EventSource clients"""
+
+    def authenticate(self, request):
+        ticket = request.query_params.get('ticket')
+        if not ticket:
+            return None
+        return ticket_user(ticket), None
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _publish(user_id, event_type, data):
+    transaction.on_commit(
+        lambda: get_broker().publish(user_id, event_type, data)
+    )
+
+
+def _serialize(instance):
+    from .serializers import TagSerializer, IngredientSerializer, \
+        RecipeSerializer
+    serializer = {
+        'tag': TagSerializer,
+        'ingredient': IngredientSerializer,
+        'recipe': RecipeSerializer,
+    }[instance._meta.model_name]
+    return serializer(instance).data
+
+
+def publish_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    action = 'created' if created else 'updated'
+    name = instance._meta.model_name
+    # Serialized after commit. RecipeSerializer writes a recipe and its
+    # links in one transaction, so this event shows them and the link
+    # changes on the same instance don't publish another one
+    instance._event_pending = True
+
+    def publish():
+        instance._event_pending = False
+        get_broker().publish(instance.user_id, f'{name}.{action}',
+                             _serialize(instance))
+
+    transaction.on_commit(publish)
+
+
+def publish_deleted(sender, instance, **kwargs):
+    _publish(instance.user_id, f'{instance._meta.model_name}.deleted',
+             {'id': instance.pk})
+
+
+def publish_links_changed(sender, instance, action, reverse, model, pk_set,
+                          **kwargs):
+    """Tags/ingredients added to or removed from recipes"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from .models import Recipe
+    if not reverse:
+        if getattr(instance, '_event_pending', False):
+            return
+        recipes = [instance]
+    elif pk_set:
+        recipes = list(Recipe.objects.filter(pk__in=pk_set))
+    else:
+        return
+    for recipe in recipes:
+        transaction.on_commit(lambda recipe=recipe: get_broker().publish(
+            recipe.user_id, 'recipe.updated', _serialize(recipe)
+        ))
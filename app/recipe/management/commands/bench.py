@@ -0,0 +1,276 @@
+import io
+import json
+import statistics
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from recipe.models import Recipe, Tag, Ingredient
+from recipe.utils.seed import seed_email, SEED_PASSWORD
+
+SCENARIOS = (
+    'recipe-list', 'recipe-filter', 'recipe-detail', 'recipe-create',
+    'recipe-upload', 'tag-list', 'tag-assigned', 'ingredient-list',
+    'ingredient-assigned', 'token-login',
+)
+
+
+class InProcessClient:
+    """Drive the WSGI handler in-process through Django's test client"""
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, token=None, data=None, files=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        if method == 'GET':
+            response = self.client.get(path, data, **headers)
+        elif files:
+            response = self.client.post(path, {**(data or {}), **files},
+                                        **headers)
+        else:
+            response = self.client.post(path, json.dumps(data),
+                                        content_type='application/json',
+                                        **headers)
+        return response.status_code
+
+
+class HttpClient:
+    """Drive a running server over HTTP"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token=None, data=None, files=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        url = self.base_url + path
+        body = None
+        if method == 'GET' and data:
+            url += '?' + urllib.parse.urlencode(data)
+        elif files:
+            boundary = uuid.uuid4().hex
+            headers['Content-Type'] = \
+                f'multipart/form-data; boundary={boundary}'
+            body = self._multipart(boundary, data or {}, files)
+        elif method != 'GET':
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(data).encode()
+
+        request = urllib.request.Request(url, body, headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def _multipart(self, boundary, data, files):
+        parts = []
+        for name, value in data.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; '
+                f'name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        for name, fh in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; '
+                f'name="{name}"; filename="{fh.name}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+                + fh.getvalue() + b'\r\n'
+            )
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return b''.join(parts)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1,
+                max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def sample_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(buffer, format='JPEG')
+    buffer.name = 'bench.jpg'
+    buffer.seek(0)
+    return buffer
+
+
+class Command(BaseCommand):
+    """Benchmark every API endpoint against a seeded dataset"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--rank', type=int, default=1,
+                            help='Seeded user to act as (1 owns the most '
+                                 'recipes), see manage.py seed')
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS,
+                            help='Run only these scenarios')
+        parser.add_argument('--url', default=None,
+                            help='Benchmark a running server instead of '
+                                 'the in-process test client; writes are '
+                                 'not rolled back on the server')
+        parser.add_argument('--output', default=None,
+                            help='Save results as JSON')
+        parser.add_argument('--compare', default=None,
+                            help='JSON results of a previous run')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(
+            email=seed_email(options['rank'])
+        ).first()
+        if user is None:
+            raise CommandError('No seeded data, run manage.py seed first')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.token = token.key
+        self.email = user.email
+        self.recipe_id = Recipe.objects.filter(user=user) \
+            .values_list('id', flat=True).first()
+        self.tag_ids = list(Tag.objects.filter(user=user)
+                            .values_list('id', flat=True)[:3])
+        self.ingredient_ids = list(Ingredient.objects.filter(user=user)
+                                   .values_list('id', flat=True)[:3])
+        client = HttpClient(options['url']) if options['url'] \
+            else InProcessClient()
+
+        results = {}
+        scenarios = options['scenario'] or SCENARIOS
+        # Writes made in-process are rolled back and uploads go to a
+        # throwaway directory so runs are repeatable
+        with transaction.atomic(), tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            for name in scenarios:
+                results[name] = self.run_scenario(client, name, options)
+                self.report(name, results[name])
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({
+                    'created': datetime.now().isoformat(),
+                    'target': options['url'] or 'in-process',
+                    'database': connection.vendor,
+                    'debug': settings.DEBUG,
+                    'user': self.email,
+                    'requests': options['requests'],
+                    'results': results,
+                }, fh, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'])
+
+    def run_scenario(self, client, name, options):
+        call = getattr(self, 'scenario_' + name.replace('-', '_'))
+        for _ in range(options['warmup']):
+            call(client)
+
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            start = time.perf_counter()
+            status = call(client)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'count': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / elapsed,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:20s} p50 {result['p50_ms']:8.2f}ms "
+            f"p95 {result['p95_ms']:8.2f}ms p99 {result['p99_ms']:8.2f}ms "
+            f"{result['throughput']:8.1f} req/s"
+            + (f" {result['errors']} errors" if result['errors'] else '')
+        )
+
+    def compare(self, results, path):
+        with open(path) as fh:
+            baseline = json.load(fh)['results']
+        self.stdout.write(f'Compared with {path} (negative is faster):')
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            deltas = ', '.join(
+                f"{key[:-3]} {(result[key] / baseline[name][key] - 1):+.1%}"
+                for key in ('p50_ms', 'p95_ms', 'p99_ms')
+                if baseline[name][key]
+            )
+            self.stdout.write(f'{name:20s} {deltas}')
+
+    def scenario_recipe_list(self, client):
+        return client.request('GET', reverse('recipe:recipe-list'),
+                              self.token)
+
+    def scenario_recipe_filter(self, client):
+        return client.request('GET', reverse('recipe:recipe-list'),
+                              self.token, data={
+                                  'tags': ','.join(map(str, self.tag_ids)),
+                                  'ingredients': ','.join(
+                                      map(str, self.ingredient_ids)),
+                              })
+
+    def scenario_recipe_detail(self, client):
+        return client.request(
+            'GET', reverse('recipe:recipe-detail', args=[self.recipe_id]),
+            self.token
+        )
+
+    def scenario_recipe_create(self, client):
+        return client.request('POST', reverse('recipe:recipe-list'),
+                              self.token, data={
+                                  'name': 'Bench recipe', 'time': 10,
+                                  'price': '5.00', 'tags': self.tag_ids,
+                                  'ingredients': self.ingredient_ids,
+                              })
+
+    def scenario_recipe_upload(self, client):
+        return client.request(
+            'POST',
+            reverse('recipe:recipe-upload-image', args=[self.recipe_id]),
+            self.token, files={'image': sample_image()}
+        )
+
+    def scenario_tag_list(self, client):
+        return client.request('GET', reverse('recipe:tag-list'), self.token)
+
+    def scenario_tag_assigned(self, client):
+        return client.request('GET', reverse('recipe:tag-list'), self.token,
+                              data={'assigned_only': 1})
+
+    def scenario_ingredient_list(self, client):
+        return client.request('GET', reverse('recipe:ingredient-list'),
+                              self.token)
+
+    def scenario_ingredient_assigned(self, client):
+        return client.request('GET', reverse('recipe:ingredient-list'),
+                              self.token, data={'assigned_only': 1})
+
+    def scenario_token_login(self, client):
+        return client.request('POST', reverse('core:token'), data={
+            'email': self.email, 'password': SEED_PASSWORD,
+        })
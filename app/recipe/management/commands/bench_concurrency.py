@@ -0,0 +1,203 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from recipe.utils.seed import seed_email
+from recipe.management.commands.bench import percentile
+
+SCENARIOS = ('baseline', 'idle-connections', 'slow-clients')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def timed_get(port, path, token, timeout):
+    """One authenticated GET on a fresh connection; (status, seconds)"""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection('127.0.0.1', port), timeout)
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'
+            f'Authorization: Token {token}\r\nAccept: application/json\r\n'
+            f'Connection: close\r\n\r\n'.encode()
+        )
+        response = await asyncio.wait_for(reader.read(), timeout)
+        writer.close()
+        status = int(response.split(b' ', 2)[1])
+    except (asyncio.TimeoutError, OSError, IndexError, ValueError):
+        status = 0
+    return status, time.perf_counter() - start
+
+
+async def idle_connection(port, stop):
+    """Connect and send nothing, like a client keeping a socket around"""
+    try:
+        _, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    await stop.wait()
+    writer.close()
+
+
+async def slow_client(port, path, token, stop, delay):
+    """Trickle a request one byte at a time, then read the response"""
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'
+        f'Authorization: Token {token}\r\nConnection: close\r\n\r\n'
+    ).encode()
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for index in range(len(request)):
+                if stop.is_set():
+                    break
+                writer.write(request[index:index + 1])
+                await asyncio.sleep(delay)
+            else:
+                await reader.read()
+            writer.close()
+        except OSError:
+            await asyncio.sleep(delay)
+
+
+class Command(BaseCommand):
+    """Compare WSGI and ASGI serving under idle and slow clients"""
+    help = (
+        'Start manage.py serve as WSGI and as ASGI on local ports and '
+        'measure authenticated GET latency while other clients hold '
+        'connections open or trickle their requests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Measured requests in flight at once')
+        parser.add_argument('--idle', type=int, default=200,
+                            help='Idle connections held open')
+        parser.add_argument('--slow', type=int, default=50,
+                            help='Clients trickling their requests')
+        parser.add_argument('--slow-delay', type=float, default=0.05,
+                            help='Seconds between bytes of a slow client')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Threads per WSGI worker')
+        parser.add_argument('--timeout', type=float, default=10,
+                            help='Seconds before a measured request counts '
+                                 'as an error')
+        parser.add_argument('--rank', type=int, default=1,
+                            help='Seeded user to act as (1 owns the most '
+                                 'recipes), see manage.py seed')
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS)
+        parser.add_argument('--server', action='append',
+                            choices=('wsgi', 'asgi'))
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(
+            email=seed_email(options['rank'])
+        ).first()
+        if user is None:
+            raise CommandError(f'No seeded user of rank {options["rank"]}, '
+                               f'run manage.py seed first')
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.path = reverse('recipe:recipe-list')
+
+        for server in options['server'] or ('wsgi', 'asgi'):
+            port = free_port()
+            process = self.start_server(server, port, options)
+            try:
+                for name in options['scenario'] or SCENARIOS:
+                    result = asyncio.run(self.run_scenario(name, port,
+                                                           options))
+                    self.report(server, name, result)
+            finally:
+                process.terminate()
+                process.wait()
+
+    def start_server(self, server, port, options):
+        command = [
+            sys.executable, 'manage.py', 'serve',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(options['workers']),
+            '--threads', str(options['threads']),
+            '--timeout', '120', '--max-requests', '0',
+        ]
+        if server == 'asgi':
+            command.append('--asgi')
+        process = subprocess.Popen(
+            command, cwd=os.getcwd(), stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{server} server exited with '
+                                   f'{process.returncode}')
+            try:
+                urllib.request.urlopen(
+                    f"http://127.0.0.1:{port}{reverse('healthz')}", timeout=1)
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'{server} server did not become ready')
+
+    async def run_scenario(self, name, port, options):
+        stop = asyncio.Event()
+        background = []
+        if name == 'idle-connections':
+            background = [idle_connection(port, stop)
+                          for _ in range(options['idle'])]
+        elif name == 'slow-clients':
+            background = [
+                slow_client(port, self.path, self.token, stop,
+                            options['slow_delay'])
+                for _ in range(options['slow'])
+            ]
+        tasks = [asyncio.ensure_future(coro) for coro in background]
+        # Let the background clients occupy the server first
+        await asyncio.sleep(0.5 if tasks else 0)
+
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def measured():
+            async with semaphore:
+                return await timed_get(port, self.path, self.token,
+                                       options['timeout'])
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(measured() for _ in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies = sorted(seconds for status, seconds in results)
+        return {
+            'errors': sum(status != 200 for status, _ in results),
+            'throughput': len(results) / elapsed,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+
+    def report(self, server, name, result):
+        self.stdout.write(
+            f"{server} {name:17s} p50 {result['p50_ms']:8.2f}ms "
+            f"p99 {result['p99_ms']:8.2f}ms "
+            f"{result['throughput']:8.1f} req/s"
+            + (f" {result['errors']} errors" if result['errors'] else '')
+        )
@@ -0,0 +1,60 @@
+import timeit
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipe.models import Tag, Ingredient, Recipe
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+
+class Command(BaseCommand):
+    """Micro-benchmark for serializer instantiation and list serialization"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=1000,
+                            help='Iterations per measurement')
+        parser.add_argument('--recipes', type=int, default=50,
+                            help='Rows serialized by the list benchmark')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        with transaction.atomic():
+            recipes = self._sample_recipes(options['recipes'])
+            recipe = recipes[0]
+
+            self._report('RecipeSerializer fields', number,
+                         lambda: RecipeSerializer().fields)
+            self._report('RecipeDetailSerializer fields', number,
+                         lambda: RecipeDetailSerializer().fields)
+            self._report('RecipeDetailSerializer data', number,
+                         lambda: RecipeDetailSerializer(recipe).data)
+            self._report(f'RecipeSerializer list ({len(recipes)})',
+                         max(number // 10, 1),
+                         lambda: RecipeSerializer(recipes, many=True).data)
+
+            transaction.set_rollback(True)
+
+    def _sample_recipes(self, count):
+        """Create throwaway rows, rolled back once the benchmark is done"""
+        user = get_user_model().objects.create_user(
+            email='bench_serializers@bench.local',
+            password=None,
+            name='bench'
+        )
+        tags = [Tag.objects.create(user=user, name=f'tag{i}')
+                for i in range(3)]
+        ingredients = [Ingredient.objects.create(user=user, name=f'ing{i}')
+                       for i in range(5)]
+        for i in range(count):
+            recipe = Recipe.objects.create(user=user, name=f'recipe{i}',
+                                           time=10, price=5)
+            recipe.tags.set(tags)
+            recipe.ingredients.set(ingredients)
+
+        return list(Recipe.objects.filter(user=user)
+                    .prefetch_related('tags', 'ingredients'))
+
+    def _report(self, label, number, func):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        self.stdout.write(
+            f'{label}: {seconds / number * 1e6:.1f} us/op ({number} ops)'
+        )
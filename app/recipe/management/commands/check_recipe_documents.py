@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from core import sharding
+from recipe import documents
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    """Find recipe documents that don't match their recipe"""
+    help = (
+        'Compare every stored recipe document with a fresh rendering and '
+        'report missing, stale and diverged ones; --repair rebuilds them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Rebuild the documents found wrong')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        missing = stale = diverged = built = 0
+        for alias in sharding.aliases():
+            with sharding.using(alias):
+                wrong = self.check(size)
+                missing += len(wrong[0])
+                stale += len(wrong[1])
+                diverged += len(wrong[2])
+                if options['repair']:
+                    wrong = [pk for ids in wrong for pk in ids]
+                    built += sum(documents.build(wrong[start:start + size])
+                                 for start in range(0, len(wrong), size))
+
+        self.stdout.write(
+            f'missing: {missing}, stale: {stale}, diverged: {diverged}'
+        )
+        if options['repair']:
+            self.stdout.write(f'rebuilt {built} documents')
+
+    @staticmethod
+    def check(size):
+        """Ids of the missing, stale and diverged documents"""
+        recipes = Recipe.objects.order_by('id')
+        missing = list(recipes.filter(document__isnull=True)
+                       .values_list('id', flat=True))
+        stale = list(recipes.exclude(document__isnull=True)
+                     .exclude(document__seq=F('seq'))
+                     .values_list('id', flat=True))
+
+        # Current by seq but rendered before a tag or ingredient rename
+        diverged = []
+        current = list(recipes.filter(document__seq=F('seq'))
+                       .values_list('id', flat=True))
+        for start in range(0, len(current), size):
+            batch = current[start:start + size]
+            for recipe in documents.prefetched(batch).select_related(
+                    'document'):
+                if documents.render(recipe) != (recipe.document.detail,
+                                                recipe.document.summary):
+                    diverged.append(recipe.pk)
+        return missing, stale, diverged
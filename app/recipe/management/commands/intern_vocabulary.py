@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from core import sharding
+from recipe import vocabulary
+from recipe.counters import COUNTED
+
+
+class Command(BaseCommand):
+    """Point tags and ingredients at shared terms, merging duplicates"""
+    help = (
+        'Intern the names of tags and ingredients that have no Term yet '
+        'and, with --merge, fold each user\'s rows sharing a term into '
+        'one. Run it once after upgrading and after bulk imports.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merge', action='store_true',
+                            help='Also merge per-user duplicates')
+
+    def handle(self, *args, **options):
+        for model, relation, target_field in COUNTED:
+            interned = removed = 0
+            for alias in sharding.aliases():
+                with sharding.using(alias):
+                    interned += vocabulary.intern(model)
+                    if options['merge']:
+                        removed += vocabulary.merge_duplicates(
+                            model, relation, target_field)
+            self.stdout.write(f'{model.__name__}: interned {interned}')
+            if options['merge']:
+                self.stdout.write(
+                    f'{model.__name__}: merged {removed} duplicates')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from core import sharding
+from recipe.counters import COUNTED, recount
+
+
+class Command(BaseCommand):
+    """Recompute recipe_count of every tag and ingredient from the links"""
+    help = (
+        'Recompute Tag.recipe_count and Ingredient.recipe_count in bulk. '
+        'Links changed while it runs may be miscounted; run it again '
+        'during quiet hours if it reports many fixes.'
+    )
+
+    def handle(self, *args, **options):
+        for model, relation, target_field in COUNTED:
+            wrong = 0
+            for alias in sharding.aliases():
+                with sharding.using(alias):
+                    wrong += recount(model, relation, target_field)
+            self.stdout.write(f'{model.__name__}: fixed {wrong} counts')
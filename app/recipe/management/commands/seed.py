@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from recipe.utils.seed import seed, SEED_PASSWORD
+
+
+class Command(BaseCommand):
+    """Bulk-generate a synthetic dataset of users and recipes"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=20,
+                            help='Mean recipes per user, Zipf distributed')
+        parser.add_argument('--tags-per-user', type=int, default=20)
+        parser.add_argument('--ingredients-per-user', type=int, default=50)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent, higher is more skewed')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for a reproducible dataset')
+        parser.add_argument('--password', default=SEED_PASSWORD)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = seed(
+            users=options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            tags_per_user=options['tags_per_user'],
+            ingredients_per_user=options['ingredients_per_user'],
+            exponent=options['zipf'],
+            random_seed=options['seed'],
+            password=options['password'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users in '
+            f'{time.perf_counter() - start:.1f}s, heaviest is '
+            f'{users[0].email if users else "-"}'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.db.models import Case, When
+from core import sharding
+from recipe.models import ChangeSequence
+from recipe.sync import SYNCED_MODELS
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Number rows saved before delta sync existed (seq 0)"""
+
+    def handle(self, *args, **options):
+        for name, model in SYNCED_MODELS.items():
+            total = 0
+            for alias in sharding.aliases():
+                with sharding.using(alias):
+                    user_ids = model.objects.filter(seq=0) \
+                        .values_list('user_id', flat=True).distinct()
+                    for user_id in list(user_ids):
+                        total += self.backfill(model, user_id)
+            self.stdout.write(f'Numbered {total} {name}s')
+
+    def backfill(self, model, user_id):
+        total = 0
+        while True:
+            with transaction.atomic(using=router.db_for_write(model)):
+                ids = list(model.objects.filter(user_id=user_id, seq=0)
+                           .order_by('id')
+                           .values_list('id', flat=True)[:BATCH_SIZE])
+                if not ids:
+                    return total
+                first = ChangeSequence.objects.allocate(
+                    user_id, len(ids)) - len(ids) + 1
+                model.objects.filter(id__in=ids).update(seq=Case(
+                    *(When(id=pk, then=first + offset)
+                      for offset, pk in enumerate(ids))
+                ))
+            total += len(ids)
@@ -1,42 +1,269 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F
 from django.conf import settings
 from .utils.recipe import get_image_path
+from .utils.units import UNIT_CHOICES
+from .utils import terms
 
 # Create your models here.
 
 
-class Tag(models.Model):
+class ChangeSequenceManager(models.Manager):
+
+    def allocate(self, user_id, count=1):
+        """
+        Reserve ``count`` sequence numbers for ``user_id`` and return the
+        last one. The counter row stays locked until the caller's
+        transaction ends, so a user's changes commit in sequence order
+        and a sync never skips one that committed late
+        """
+        db = router.db_for_write(self.model)
+        counters = self.using(db).filter(user_id=user_id)
+        with transaction.atomic(using=db):
+            if not counters.update(last=F('last') + count):
+                try:
+                    with transaction.atomic(using=db):
+                        self.using(db).create(user_id=user_id, last=count)
+                    return count
+                except IntegrityError:
+                    # Created concurrently, the row exists now
+                    counters.update(last=F('last') + count)
+            return counters.values_list('last', flat=True).get()
+
+
+class ChangeSequence(models.Model):
+    """Per-user counter behind the ``seq`` of synced objects"""
+    # No database constraint: rows are removed after the user is deleted,
+    # see recipe.sync.forget_user
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True,
+                                on_delete=models.DO_NOTHING,
+                                db_constraint=False, related_name='+')
+    last = models.BigIntegerField(default=0)
+
+    objects = ChangeSequenceManager()
+
+
+class Tombstone(models.Model):
+    """A deleted tag, ingredient or recipe, for delta sync"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.DO_NOTHING,
+                             db_constraint=False, related_name='+')
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    seq = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'seq'])]
+
+
+class SyncedModel(models.Model):
+    """
+    Stamps every save with the owner's next change sequence number.
+    QuerySet.update() and bulk_create() bypass save(), so they have to set
+    ``seq`` themselves
+    """
+    seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+        indexes = [models.Index(fields=['user', 'seq'],
+                                name='%(app_label)s_%(class)s_user_seq')]
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self),
+                                                           instance=self)
+        with transaction.atomic(using=using):
+            self.seq = ChangeSequence.objects.allocate(self.user_id)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'seq'}
+            super().save(*args, **kwargs)
+
+
+class TermManager(models.Manager):
+
+    def lookup(self, kind, name):
+        """Id of the term ``name`` is interned under, None if there's none"""
+        key = (kind, terms.normalize(name))
+        pk = terms.cache.get(key)
+        if pk is None:
+            pk = self.filter(kind=kind, normalized=key[1]) \
+                .values_list('pk', flat=True).first()
+            if pk is not None:
+                terms.cache.put(key, pk)
+        return pk
+
+    def intern(self, kind, name):
+        """Id of the term for ``name``, created on first use"""
+        key = (kind, terms.normalize(name))
+        pk = terms.cache.get(key)
+        if pk is None:
+            pk = self.get_or_create(kind=kind, normalized=key[1],
+                                    defaults={'name': name.strip()})[0].pk
+            # A term created in a transaction that rolls back must not be
+            # remembered
+            transaction.on_commit(lambda: terms.cache.put(key, pk))
+        return pk
+
+
+class Term(models.Model):
+    """
+    A tag or ingredient name shared by every user. Each user's Tag or
+    Ingredient rows point at one, keeping their own spelling as an alias
+    """
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    KIND_CHOICES = [(TAG, 'Tag'), (INGREDIENT, 'Ingredient')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    normalized = models.CharField(max_length=255)
+    # Spelling of the first use
+    name = models.CharField(max_length=255)
+
+    objects = TermManager()
+
+    class Meta:
+        unique_together = ('kind', 'normalized')
+
+    def __str__(self):
+        return self.name
+
+
+class VocabularyModel(SyncedModel):
+    """A user's tag or ingredient, interned as a shared Term on save"""
+    TERM_KIND = None
+
+    # Null until saved, or until `manage.py intern_vocabulary` fills in
+    # rows from bulk_create(). Terms stay on the default database when
+    # the cookbook is sharded (core.sharding), hence no constraint
+    term = models.ForeignKey(Term, on_delete=models.PROTECT, null=True,
+                             editable=False, related_name='+',
+                             db_constraint=False)
+
+    class Meta(SyncedModel.Meta):
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.term_id = Term.objects.intern(self.TERM_KIND, self.name)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'term'}
+        super().save(*args, **kwargs)
+
+
+# Serves ordering=-recipe_count (and its reverse) for one user's rows
+POPULARITY_INDEX = models.Index(
+    fields=['user', '-recipe_count', 'id'],
+    name='%(app_label)s_%(class)s_popular',
+)
+# Serves ?name= lookups
+TERM_INDEX = models.Index(fields=['user', 'term'],
+                          name='%(app_label)s_%(class)s_user_term')
+
+
+class Tag(VocabularyModel):
+    TERM_KIND = Term.TAG
+
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         to=settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
+    # Recipes using it, maintained by recipe.counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta(VocabularyModel.Meta):
+        indexes = SyncedModel.Meta.indexes + [POPULARITY_INDEX, TERM_INDEX]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(VocabularyModel):
+    TERM_KIND = Term.INGREDIENT
+
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         to=settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
+    # Recipes using it, maintained by recipe.counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta(VocabularyModel.Meta):
+        indexes = SyncedModel.Meta.indexes + [POPULARITY_INDEX, TERM_INDEX]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(SyncedModel):
+    # Users stay on the default database when the cookbook is sharded
+    # (core.sharding), hence no constraint here and on tags/ingredients
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE, db_constraint=False)
     name = models.CharField(max_length=255)
     time = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
-    ingredients = models.ManyToManyField('Ingredient')
+    ingredients = models.ManyToManyField('Ingredient',
+                                         through='RecipeIngredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=get_image_path)
 
+    class Meta(SyncedModel.Meta):
+        indexes = SyncedModel.Meta.indexes + [
+            models.Index(fields=['user', 'time', 'id'],
+                         name='recipe_recipe_user_time'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='recipe_recipe_user_price'),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class RecipeIngredient(models.Model):
+    """
+    How much of an ingredient a recipe needs.
+
+    ``Recipe.ingredients`` used to be a plain many-to-many, and Django
+    can't migrate one to a through model: makemigrations wants to drop
+    the links. A database created before this model needs its generated
+    migration replaced by hand with
+
+    - ``SeparateDatabaseAndState(state_operations=[...])`` creating this
+      model without ``quantity`` and ``unit`` and altering
+      ``Recipe.ingredients`` to ``through='recipe.RecipeIngredient'``,
+      with no database operations (the table, its columns and unique
+      constraint already exist under the name below);
+    - ``AddField`` for ``quantity`` and ``unit``.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='amounts')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    # Blank when the recipe doesn't say, e.g. "salt to taste"
+    quantity = models.DecimalField(max_digits=10, decimal_places=3,
+                                   null=True, blank=True)
+    unit = models.CharField(max_length=10, choices=UNIT_CHOICES,
+                            blank=True)
+
+    class Meta:
+        # The table Django created for the plain many-to-many, so the
+        # migration above can keep it
+        db_table = 'recipe_recipe_ingredients'
+        unique_together = ('recipe', 'ingredient')
+
+
+class RecipeDocument(models.Model):
+    """
+    A recipe rendered ahead of time for the read path, see
+    recipe.documents. Current while ``seq`` matches the recipe's
+    """
+    recipe = models.OneToOneField(Recipe, primary_key=True,
+                                  on_delete=models.CASCADE,
+                                  related_name='document')
+    seq = models.BigIntegerField()
+    # JSON of the detail view and of the recipe's entry in the list view
+    detail = models.TextField()
+    summary = models.TextField()
@@ -0,0 +1,60 @@
+"""
+Removal of a deleted account's cookbook, one bounded batch at a time (see
+core.accounts). Rows go with plain DELETEs, children before parents, so
+nothing is loaded into memory and no per-row signals fire: the owner is
+gone, so there is nobody left to notify, count for or sync to. An image
+file that can't be removed is logged and left behind.
+"""
+import logging
+from django.db import router, transaction
+from core.db import delete_in
+from .models import Tag, Ingredient, Recipe, RecipeIngredient, \
+    RecipeDocument
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_images(names):
+    storage = Recipe._meta.get_field('image').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Failed to delete image %s', name)
+
+
+def purge_cookbook(sender, user_id, limit, **kwargs):
+    """
+    purge_user receiver: delete up to ``limit`` of the user's recipes, or
+    once those are gone its tags or ingredients, with their links
+    """
+    recipe_ids = list(Recipe.objects.filter(user_id=user_id).order_by('pk')
+                      .values_list('pk', flat=True)[:limit])
+    if recipe_ids:
+        images = list(Recipe.objects.filter(pk__in=recipe_ids)
+                      .exclude(image='').exclude(image__isnull=True)
+                      .values_list('image', flat=True))
+        db = router.db_for_write(Recipe)
+        with transaction.atomic(using=db):
+            removed = sum(delete_in(model, field, recipe_ids, db)
+                          for model, field in (
+                              (RecipeDocument, 'recipe'),
+                              (Recipe.tags.through, 'recipe'),
+                              (RecipeIngredient, 'recipe'),
+                              (Recipe, 'pk'),
+                          ))
+        _delete_images(images)
+        return removed
+
+    for model, through, field in (
+            (Tag, Recipe.tags.through, 'tag'),
+            (Ingredient, RecipeIngredient, 'ingredient')):
+        ids = list(model.objects.filter(user_id=user_id).order_by('pk')
+                   .values_list('pk', flat=True)[:limit])
+        if ids:
+            db = router.db_for_write(model)
+            with transaction.atomic(using=db):
+                # Links from other users' recipes, if any
+                return delete_in(through, field, ids, db) + \
+                    delete_in(model, 'pk', ids, db)
+    return 0
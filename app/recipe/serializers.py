@@ -1,8 +1,12 @@
+from django.db import router, transaction
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Tag, Ingredient, Recipe
+from .models import Tag, Ingredient, Recipe, RecipeIngredient
+from core.utils import media
+from core.utils.serializers import CachedFieldsMixin
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for Tags"""
 
     class Meta:
@@ -11,7 +15,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_Fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for Ingredients"""
 
     class Meta:
@@ -20,8 +24,23 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_Fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeIngredientSerializer(CachedFieldsMixin,
+                                 serializers.ModelSerializer):
+    """Serializer for the amount of an ingredient in a recipe"""
+    ingredient = serializers.PrimaryKeyRelatedField(
+        queryset=Ingredient.objects.all()
+    )
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('ingredient', 'quantity', 'unit')
+
+
+class RecipeSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for Recipes"""
+    # Written with the recipe, read back from the detail view
+    amounts = RecipeIngredientSerializer(many=True, required=False,
+                                         write_only=True)
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
@@ -33,20 +52,66 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'tags', 'ingredients', 'link', 'price', 'time')
+        fields = ('id', 'name', 'tags', 'ingredients', 'link', 'price',
+                  'time', 'amounts')
         read_only_Fields = ('id',)
 
+    # The recipe and its links in one transaction, so the change feed
+    # publishes them as one event, see events.publish_saved
+    def create(self, validated_data):
+        amounts = validated_data.pop('amounts', None)
+        with transaction.atomic(using=router.db_for_write(Recipe)):
+            recipe = super().create(validated_data)
+            if amounts:
+                self._save_amounts(recipe, amounts)
+        return recipe
+
+    def update(self, instance, validated_data):
+        amounts = validated_data.pop('amounts', None)
+        with transaction.atomic(using=router.db_for_write(Recipe)):
+            recipe = super().update(instance, validated_data)
+            if amounts:
+                self._save_amounts(recipe, amounts)
+        return recipe
+
+    def _save_amounts(self, recipe, amounts):
+        """Set the amounts, linking ingredients that aren't linked yet"""
+        linked = set(recipe.amounts.values_list('ingredient_id', flat=True))
+        for amount in amounts:
+            ingredient = amount.pop('ingredient')
+            if ingredient.id in linked:
+                recipe.amounts.filter(ingredient=ingredient).update(**amount)
+            else:
+                # Through the relation so the link signals fire
+                recipe.ingredients.add(ingredient, through_defaults=amount)
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Detail view serializer for recipe"""
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    amounts = RecipeIngredientSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for uploading the recipe image"""
 
     class Meta:
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+    def to_representation(self, instance):
+        """
+        Point at the owner-only image view rather than MEDIA_URL, at the
+        current version so clients can cache it for good
+        """
+        data = super().to_representation(instance)
+        if instance.image:
+            url = media.versioned_url(
+                reverse('recipe:recipe-image', args=[instance.pk]),
+                instance.image)
+            request = self.context.get('request')
+            data['image'] = request.build_absolute_uri(url) if request \
+                else url
+        return data
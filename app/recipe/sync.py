@@ -0,0 +1,76 @@
+"""
+Delta sync for offline clients.
+
+Every save of a tag, ingredient or recipe stamps it with the owner's next
+change sequence number (``SyncedModel.seq``), adding or removing a
+recipe's tags or ingredients re-stamps the recipe, and deletes leave a
+``Tombstone`` with a sequence number of its own. A client that has seen
+everything up to ``seq`` N asks for the rows with a higher ``seq``.
+"""
+import heapq
+from django.db import router, transaction
+from .models import ChangeSequence, Tombstone, Tag, Ingredient, Recipe
+
+SYNCED_MODELS = {'tag': Tag, 'ingredient': Ingredient, 'recipe': Recipe}
+
+
+def record_deletion(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted tag, ingredient or recipe"""
+    with transaction.atomic(using=router.db_for_write(Tombstone)):
+        Tombstone.objects.create(
+            user_id=instance.user_id, model=instance._meta.model_name,
+            object_id=instance.pk,
+            seq=ChangeSequence.objects.allocate(instance.user_id),
+        )
+
+
+def record_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Re-stamp recipes whose tags or ingredients changed"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        restamp([(instance.pk, instance.user_id)])
+    elif pk_set:
+        restamp(Recipe.objects.filter(pk__in=pk_set)
+                .values_list('pk', 'user_id'))
+
+
+def restamp(recipes):
+    """Give ``(pk, user_id)`` recipes their owner's next sequence number"""
+    with transaction.atomic(using=router.db_for_write(Recipe)):
+        for pk, user_id in list(recipes):
+            Recipe.objects.filter(pk=pk).update(
+                seq=ChangeSequence.objects.allocate(user_id))
+
+
+def forget_user(sender, instance, **kwargs):
+    """Drop a deleted user's counter and tombstones"""
+    Tombstone.objects.filter(user_id=instance.pk).delete()
+    ChangeSequence.objects.filter(user_id=instance.pk).delete()
+
+
+def changes_since(user, since, limit):
+    """
+    Up to ``limit`` changes after ``since`` in sequence order, as
+    ``(changes, last_seq, more)`` where ``changes`` maps ``tags``,
+    ``ingredients``, ``recipes`` to objects and ``deleted`` to tombstones
+    """
+    sources = {
+        'tags': Tag.objects.all(),
+        'ingredients': Ingredient.objects.all(),
+        'recipes': Recipe.objects.prefetch_related('tags', 'ingredients'),
+        'deleted': Tombstone.objects.all(),
+    }
+    streams = [
+        [(obj.seq, key, obj) for obj in queryset.filter(
+            user=user, seq__gt=since).order_by('seq')[:limit + 1]]
+        for key, queryset in sources.items()
+    ]
+    merged = list(heapq.merge(*streams, key=lambda row: row[0]))
+
+    changes = {key: [] for key in sources}
+    for seq, key, obj in merged[:limit]:
+        changes[key].append(obj)
+    last_seq = merged[:limit][-1][0] if merged else since
+    return changes, last_seq, len(merged) > limit
@@ -0,0 +1,200 @@
+import json
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from core import metrics, routers
+from core.executor import BoundedExecutor
+from recipe import asgi
+from recipe.asgi import AsyncRecipeAPI
+from recipe.models import Recipe, Tag, Ingredient
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, \
+    TagSerializer
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class FallbackApp:
+    """Stands in for Django's ASGI handler"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, scope, receive, send):
+        self.calls.append(scope)
+        await send({'type': 'http.response.start', 'status': 299,
+                    'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+class FullExecutor(BoundedExecutor):
+
+    async def run(self, func, *args, **kwargs):
+        raise self.Overloaded()
+
+
+# Pool threads use their own connections, so the data must be committed
+class TestAsyncRecipeAPI(TransactionTestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.fallback = FallbackApp()
+        self.executor = BoundedExecutor(max_workers=2, max_pending=2)
+        self.app = AsyncRecipeAPI(self.fallback, self.executor)
+
+    def tearDown(self) -> None:
+        self.executor.pool.shutdown()
+
+    def request(self, path, method='GET', token=None, query=b'',
+                app=None):
+        headers = [(b'accept', b'application/json')]
+        if token:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'query_string': query, 'headers': headers}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(app or self.app)(scope, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages)
+        self.headers = dict(messages[0]['headers'])
+        return messages[0]['status'], body
+
+    def test_list_recipes(self):
+        """Test the native recipe list matches the serializer"""
+        Recipe.objects.create(user=self.user, name='Omlette', time=5,
+                              price=30)
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        Recipe.objects.create(user=other, name='Other', time=5, price=30)
+
+        status, body = self.request(RECIPE_URL, token=self.token)
+
+        serializer = RecipeSerializer(
+            Recipe.objects.filter(user=self.user).order_by('-id'), many=True)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body),
+                         json.loads(json.dumps(serializer.data)))
+
+    def test_retrieve_recipe(self):
+        """Test the native recipe detail matches the serializer"""
+        recipe = Recipe.objects.create(user=self.user, name='Omlette',
+                                       time=5, price=30)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Veg'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Egg'))
+
+        status, body = self.request(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            token=self.token)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            json.loads(body),
+            json.loads(json.dumps(RecipeDetailSerializer(recipe).data)))
+
+    def test_list_tags_assigned_only(self):
+        """Test query parameters reach the native tag list"""
+        tag = Tag.objects.create(user=self.user, name='Veg')
+        Tag.objects.create(user=self.user, name='Unused')
+        recipe = Recipe.objects.create(user=self.user, name='Omlette',
+                                       time=5, price=30)
+        recipe.tags.add(tag)
+
+        status, body = self.request(reverse('recipe:tag-list'),
+                                    token=self.token,
+                                    query=b'assigned_only=1')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [TagSerializer(tag).data])
+
+    def test_auth_required(self):
+        """Test requests without a valid token are rejected"""
+        status, _ = self.request(RECIPE_URL)
+        self.assertEqual(status, 401)
+
+        status, _ = self.request(RECIPE_URL, token='wrong')
+        self.assertEqual(status, 401)
+
+    def test_other_users_recipe_not_found(self):
+        """Test retrieving another user's recipe returns 404"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        recipe = Recipe.objects.create(user=other, name='Other', time=5,
+                                       price=30)
+
+        status, _ = self.request(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            token=self.token)
+
+        self.assertEqual(status, 404)
+
+    def test_other_requests_fall_back(self):
+        """Test writes, HTML and other routes are left to Django"""
+        self.request(RECIPE_URL, method='POST', token=self.token)
+        self.request(reverse('healthz'))
+
+        self.assertEqual(len(self.fallback.calls), 2)
+
+    def test_overloaded(self):
+        """Test a saturated pool sheds load with 503"""
+        app = AsyncRecipeAPI(self.fallback,
+                             FullExecutor(max_workers=1, max_pending=0))
+
+        status, _ = self.request(RECIPE_URL, token=self.token, app=app)
+
+        self.assertEqual(status, 503)
+
+    def test_head_has_no_body(self):
+        """Test HEAD answers with the headers of GET and no body"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        _, body = self.request(reverse('recipe:tag-list'), token=self.token)
+
+        status, head = self.request(reverse('recipe:tag-list'),
+                                    method='HEAD', token=self.token)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(head, b'')
+        self.assertEqual(self.headers[b'content-length'],
+                         str(len(body)).encode())
+
+    def test_security_headers(self):
+        """Test the headers of Django's security middleware are sent"""
+        self.request(RECIPE_URL, token=self.token)
+
+        self.assertEqual(self.headers[b'x-content-type-options'],
+                         b'nosniff')
+        self.assertEqual(self.headers[b'x-frame-options'], b'DENY')
+
+    @override_settings(SECURE_SSL_REDIRECT=True)
+    def test_insecure_requests_fall_back(self):
+        """Test plain http is left to Django to redirect"""
+        self.request(RECIPE_URL, token=self.token)
+
+        self.assertEqual(len(self.fallback.calls), 1)
+
+    def test_request_state(self):
+        """Test handlers run with the state the middleware would set"""
+        seen = []
+
+        def capture(user, query_params):
+            state = routers._request_state.get()
+            request = metrics.current_request.get()
+            seen.append((state.user(), request.resolver_match.view_name))
+            return []
+
+        with patch.dict(asgi.HANDLERS, {'recipe:tag-list': capture}):
+            self.request(reverse('recipe:tag-list'), token=self.token)
+
+        self.assertEqual(seen, [(self.user, 'recipe:tag-list')])
+        self.assertIsNone(routers._request_state.get())
@@ -0,0 +1,81 @@
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from recipe.models import Tag, Ingredient, Recipe
+
+
+class TestRecipeCounters(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salad = self.recipe('Salad')
+        self.soup = self.recipe('Soup')
+
+    def recipe(self, name):
+        return Recipe.objects.create(user=self.user, name=name, time=5,
+                                     price=3)
+
+    def counts(self, *objects):
+        return [type(obj).objects.get(pk=obj.pk).recipe_count
+                for obj in objects]
+
+    def test_add_and_remove(self):
+        """Test adding and removing links updates the counts"""
+        self.salad.tags.add(self.vegan, self.quick)
+        self.soup.tags.add(self.vegan)
+        self.soup.tags.add(self.vegan)
+        self.assertEqual(self.counts(self.vegan, self.quick), [2, 1])
+
+        self.salad.tags.remove(self.vegan)
+        self.soup.tags.remove(self.quick)
+        self.assertEqual(self.counts(self.vegan, self.quick), [1, 1])
+
+        self.salad.tags.clear()
+        self.assertEqual(self.counts(self.vegan, self.quick), [1, 0])
+
+    def test_set(self):
+        """Test replacing a recipe's links updates the counts"""
+        self.salad.tags.set([self.vegan])
+
+        self.salad.tags.set([self.quick])
+
+        self.assertEqual(self.counts(self.vegan, self.quick), [0, 1])
+
+    def test_reverse_relation(self):
+        """Test links changed from the tag side are counted"""
+        self.vegan.recipe_set.add(self.salad, self.soup)
+        self.assertEqual(self.counts(self.vegan), [2])
+
+        self.vegan.recipe_set.remove(self.soup)
+        self.assertEqual(self.counts(self.vegan), [1])
+
+        self.vegan.recipe_set.clear()
+        self.assertEqual(self.counts(self.vegan), [0])
+
+    def test_recipe_deleted(self):
+        """Test deleting a recipe releases its tags and ingredients"""
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        self.salad.tags.add(self.vegan)
+        self.salad.ingredients.add(kale)
+        self.soup.tags.add(self.vegan)
+
+        self.salad.delete()
+
+        self.assertEqual(self.counts(self.vegan, kale), [1, 0])
+
+    def test_repair(self):
+        """Test the repair command recomputes drifted counts"""
+        self.salad.tags.add(self.vegan)
+        self.soup.tags.add(self.vegan)
+        Tag.objects.update(recipe_count=7)
+        out = StringIO()
+
+        call_command('repair_recipe_counts', stdout=out)
+
+        self.assertEqual(self.counts(self.vegan, self.quick), [2, 0])
+        self.assertIn('Tag: fixed 2 counts', out.getvalue())
@@ -0,0 +1,116 @@
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from recipe import documents
+from recipe.models import Recipe, Tag, RecipeDocument
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def get_detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+# Documents are rebuilt on commit, which TestCase never does. SQLite's
+# shared in-memory test database locks whole tables, so every write is
+# followed by drain() before the test goes on
+@override_settings(RECIPE_DOCUMENTS=True)
+class TestRecipeDocuments(TransactionTestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                            time=5, price=3)
+        documents.drain()
+        self.recipe.tags.add(self.tag)
+        documents.drain()
+
+    def document(self):
+        return RecipeDocument.objects.get(recipe=self.recipe)
+
+    def test_built_on_commit(self):
+        """Test a saved recipe gets a document matching the API output"""
+        self.recipe.refresh_from_db()
+        document = self.document()
+
+        self.assertEqual(document.seq, self.recipe.seq)
+        self.assertEqual(documents.render(self.recipe),
+                         (document.detail, document.summary))
+
+    def test_served_from_document(self):
+        """Test unfiltered reads return the stored documents"""
+        with self.assertNumQueries(1):
+            response = self.client.get(get_detail_url(self.recipe.id))
+        listing = self.client.get(RECIPE_URL)
+
+        self.assertIsInstance(response, documents.DocumentResponse)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content.decode(), self.document().detail)
+        self.assertEqual(response.data,
+                         RecipeDetailSerializer(self.recipe).data)
+        self.assertEqual(listing.data, [RecipeSerializer(self.recipe).data])
+
+    def test_stale_document_not_served(self):
+        """Test a change is visible before the rebuild has run"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            name='Soup', seq=self.recipe.seq + 100)
+
+        response = self.client.get(get_detail_url(self.recipe.id))
+        documents.drain()
+        RecipeDocument.objects.filter(recipe=self.recipe).delete()
+        listing = self.client.get(RECIPE_URL)
+        documents.drain()
+
+        self.assertEqual(response.data['name'], 'Soup')
+        self.assertEqual(listing.data[0]['name'], 'Soup')
+        self.assertIn('Soup', self.document().summary)
+
+    def test_rename_rebuilds_linked(self):
+        """Test renaming a tag refreshes the recipes using it"""
+        self.tag.name = 'Vegetarian'
+        self.tag.save()
+        documents.drain()
+
+        response = self.client.get(get_detail_url(self.recipe.id))
+
+        self.assertIn('Vegetarian', self.document().detail)
+        self.assertEqual(response.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_link_changes_rebuild(self):
+        """Test removing a tag from the recipe updates its documents"""
+        self.recipe.tags.remove(self.tag)
+        documents.drain()
+
+        self.assertEqual(self.client.get(RECIPE_URL).data[0]['tags'], [])
+
+    def test_other_users_document(self):
+        """Test another user's recipe stays a 404"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        self.client.force_authenticate(other)
+
+        response = self.client.get(get_detail_url(self.recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(RECIPE_URL).data, [])
+
+    def test_check_and_repair(self):
+        """Test the check command finds and rebuilds wrong documents"""
+        RecipeDocument.objects.filter(recipe=self.recipe).update(
+            detail='{}')
+        out = StringIO()
+
+        call_command('check_recipe_documents', '--repair', stdout=out)
+
+        self.assertIn('diverged: 1', out.getvalue())
+        self.assertNotEqual(self.document().detail, '{}')
@@ -0,0 +1,239 @@
+import asyncio
+import json
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.executor import BoundedExecutor
+from recipe import events
+from recipe.asgi import AsyncRecipeAPI
+from recipe.models import Tag, Ingredient, Recipe
+
+EVENTS_URL = reverse('recipe:events')
+TICKET_URL = reverse('recipe:events-ticket')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def parse_events(content):
+    """Decode a text/event-stream body into a list of dicts"""
+    parsed = []
+    for block in content.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines()
+                      if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            fields['data'] = json.loads(fields['data'])
+            parsed.append(fields)
+    return parsed
+
+
+# on_commit callbacks only run outside TestCase's wrapping transaction
+class TestEventFeed(TransactionTestCase):
+
+    def setUp(self) -> None:
+        events._broker = events.InProcessBroker(history=10)
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self) -> None:
+        events._broker = None
+
+    def poll(self, last_event_id=None):
+        headers = {'HTTP_ACCEPT': 'text/event-stream'}
+        if last_event_id is not None:
+            headers['HTTP_LAST_EVENT_ID'] = str(last_event_id)
+        response = self.client.get(EVENTS_URL, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return parse_events(response.content)
+
+    def test_ready_then_changes(self):
+        """Test a new client gets a cursor, then the changes after it"""
+        ready, = self.poll()
+        self.assertEqual(ready['event'], 'ready')
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tag.name = 'Vegetarian'
+        tag.save()
+        tag_id = tag.id
+        tag.delete()
+
+        changes = self.poll(ready['id'])
+        self.assertEqual([event['event'] for event in changes],
+                         ['tag.created', 'tag.updated', 'tag.deleted'])
+        self.assertEqual(changes[1]['data'],
+                         {'id': tag_id, 'name': 'Vegetarian'})
+        self.assertEqual(self.poll(changes[-1]['id']), [])
+
+    def test_recipe_published_with_links(self):
+        """Test a created recipe is published once, with its links"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        ready, = self.poll()
+
+        response = self.client.post(RECIPE_URL, {
+            'name': 'Salad', 'time': 5, 'price': '3.00',
+            'tags': [tag.id], 'ingredients': [ingredient.id],
+        })
+
+        change, = self.poll(ready['id'])
+        self.assertEqual(change['event'], 'recipe.created')
+        self.assertEqual(change['data']['id'], response.data['id'])
+        self.assertEqual(change['data']['tags'], [tag.id])
+        self.assertEqual(change['data']['ingredients'], [ingredient.id])
+
+    def test_recipe_links_publish_update(self):
+        """Test linking a tag to recipes publishes the recipes"""
+        recipe = Recipe.objects.create(user=self.user, name='Salad', time=5,
+                                       price=3)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ready, = self.poll()
+
+        tag.recipe_set.add(recipe)
+
+        change, = self.poll(ready['id'])
+        self.assertEqual(change['event'], 'recipe.updated')
+        self.assertEqual(change['data']['tags'], [tag.id])
+
+    def test_only_own_events(self):
+        """Test users only see changes to their own objects"""
+        ready, = self.poll()
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        Tag.objects.create(user=other, name='Vegan')
+
+        self.assertEqual(self.poll(ready['id']), [])
+
+    def test_reset_when_history_lost(self):
+        """Test clients too far behind are told to refetch"""
+        ready, = self.poll()
+        for index in range(11):
+            Tag.objects.create(user=self.user, name=f'tag-{index}')
+
+        reset, = self.poll(ready['id'])
+
+        self.assertEqual(reset['event'], 'reset')
+        self.assertEqual(self.poll(reset['id']), [])
+
+    def test_auth_required(self):
+        """Test the feed requires authentication"""
+        response = APIClient().get(EVENTS_URL,
+                                   HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_ticket(self):
+        """Test a ticket opens the feed without an Authorization header"""
+        ticket = self.client.post(TICKET_URL).data['ticket']
+
+        response = APIClient().get(EVENTS_URL, {'ticket': ticket},
+                                   HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(parse_events(response.content)[0]['event'],
+                         'ready')
+
+    def test_ticket_invalid_or_expired(self):
+        """Test forged and expired tickets are refused"""
+        ticket = self.client.post(TICKET_URL).data['ticket']
+        client = APIClient()
+
+        forged = client.get(EVENTS_URL, {'ticket': ticket + 'x'},
+                            HTTP_ACCEPT='text/event-stream')
+        with override_settings(EVENTS_TICKET_SECONDS=-1):
+            expired = client.get(EVENTS_URL, {'ticket': ticket},
+                                 HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(forged.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(expired.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TestAsgiEventStream(TransactionTestCase):
+
+    def setUp(self) -> None:
+        events._broker = events.InProcessBroker(history=10)
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.executor = BoundedExecutor(max_workers=2, max_pending=2)
+        self.app = AsyncRecipeAPI(None, self.executor)
+
+    def tearDown(self) -> None:
+        events._broker = None
+        self.executor.pool.shutdown()
+
+    def stream(self, publish, last_event_id=None, query=b''):
+        """Open a stream, publish while it is open, then disconnect"""
+        headers = []
+        if not query:
+            headers.append((b'authorization', f'Token {self.token}'.encode()))
+        if last_event_id is not None:
+            headers.append((b'last-event-id', str(last_event_id).encode()))
+        scope = {'type': 'http', 'method': 'GET', 'path': EVENTS_URL,
+                 'query_string': query, 'headers': headers}
+        messages = []
+
+        async def run():
+            done = asyncio.Event()
+
+            async def receive():
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if len(messages) == 2:
+                    publish()
+                elif len(messages) > 2:
+                    done.set()
+
+            await self.app(scope, receive, send)
+
+        async_to_sync(run)()
+        body = b''.join(message.get('body', b'') for message in messages)
+        return messages[0], parse_events(body)
+
+    def test_stream_pushes_events(self):
+        """Test live events are pushed to an open stream"""
+        start, received = self.stream(lambda: events.get_broker().publish(
+            self.user.id, 'tag.created', {'id': 1, 'name': 'Vegan'}))
+
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      start['headers'])
+        self.assertEqual([event['event'] for event in received],
+                         ['ready', 'tag.created'])
+
+    def test_stream_resumes(self):
+        """Test reconnecting replays missed events before live ones"""
+        broker = events.get_broker()
+        first = broker.publish(self.user.id, 'tag.created', {'id': 1})
+        broker.publish(self.user.id, 'tag.created', {'id': 2})
+
+        _, received = self.stream(
+            lambda: broker.publish(self.user.id, 'tag.deleted', {'id': 1}),
+            last_event_id=first.id
+        )
+
+        self.assertEqual([event['data'] for event in received],
+                         [{'id': 2}, {'id': 1}])
+
+    def test_stream_with_ticket(self):
+        """Test EventSource clients open the stream with a ticket"""
+        ticket = events.issue_ticket(self.user)
+
+        start, received = self.stream(
+            lambda: events.get_broker().publish(self.user.id, 'tag.created',
+                                                {'id': 1}),
+            query=f'ticket={ticket}'.encode())
+
+        self.assertEqual(start['status'], 200)
+        self.assertEqual([event['event'] for event in received],
+                         ['ready', 'tag.created'])
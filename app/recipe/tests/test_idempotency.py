@@ -0,0 +1,156 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import idempotency
+from core.checks import check_idempotency_lock
+from core.models import IdempotencyKey
+from recipe.models import Recipe
+
+RECIPE_URL = reverse('recipe:recipe-list')
+PAYLOAD = {'name': 'Salad', 'time': 5, 'price': '3.00'}
+
+
+class TestIdempotencyKeys(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, key, url=RECIPE_URL, data=PAYLOAD, **kwargs):
+        return self.client.post(url, data, HTTP_IDEMPOTENCY_KEY=key,
+                                **kwargs)
+
+    def test_retry_replays_response(self):
+        """Test a retried create returns the first response, once"""
+        first = self.post('key-1')
+        retry = self.post('key-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_keys_are_per_request_and_user(self):
+        """Test other keys, or the same key of another user, run again"""
+        self.post('key-1')
+        self.post('key-2')
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        self.client.force_authenticate(other)
+        self.post('key-1')
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Recipe.objects.filter(user=other).count(), 1)
+
+    def test_without_key(self):
+        """Test requests without a key aren't deduplicated"""
+        self.client.post(RECIPE_URL, PAYLOAD)
+        self.client.post(RECIPE_URL, PAYLOAD)
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_partial_update_replayed(self):
+        """Test a retried PATCH is answered without running again"""
+        recipe = Recipe.objects.create(user=self.user, name='Soup', time=5,
+                                       price=3)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        self.client.patch(url, {'name': 'Stew'}, HTTP_IDEMPOTENCY_KEY='k')
+        seq = Recipe.objects.get(pk=recipe.pk).seq
+        retry = self.client.patch(url, {'name': 'Stew'},
+                                  HTTP_IDEMPOTENCY_KEY='k')
+
+        self.assertEqual(retry.data['name'], 'Stew')
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).seq, seq)
+
+    def hold(self, key, locked_until):
+        """Store ``key`` as taken by a request that hasn't answered"""
+        request = RequestFactory().post(RECIPE_URL)
+        request.user = self.user
+        IdempotencyKey.objects.create(
+            key=idempotency._hash_key(request, key), token='first',
+            locked_until=locked_until,
+            expires=timezone.now() + timedelta(days=1))
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0)
+    def test_request_in_progress(self):
+        """Test a retry during the first request is told to come back"""
+        self.hold('key-1', timezone.now() + timedelta(minutes=5))
+
+        response = self.post('key-1')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_dead_request_taken_over(self):
+        """Test a retry runs once the first request's lock ran out"""
+        self.hold('key-1', timezone.now() - timedelta(seconds=1))
+
+        response = self.post('key-1')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_expired_key_runs_again(self):
+        """Test a response is replayed only until it expires"""
+        self.post('key-1')
+        IdempotencyKey.objects.update(expires=timezone.now())
+
+        retry = self.post('key-1')
+
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_purge_expired_keys(self):
+        """Test the command removes expired keys only"""
+        self.post('key-1')
+        self.post('key-2')
+        IdempotencyKey.objects.filter(
+            pk=IdempotencyKey.objects.first().pk).update(
+            expires=timezone.now())
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_lock_outlasts_wait(self):
+        """Test a lock shorter than the wait fails the system check"""
+        self.assertEqual(check_idempotency_lock(None), [])
+        with override_settings(IDEMPOTENCY_LOCK_TTL=30,
+                               IDEMPOTENCY_LOCK_TIMEOUT=30):
+            self.assertEqual([error.id for error in
+                              check_idempotency_lock(None)], ['core.E002'])
+
+    def test_upload_replayed(self):
+        """Test a retried upload doesn't store the image again"""
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        recipe = Recipe.objects.create(user=self.user, name='Soup', time=5,
+                                       price=3)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+
+        with override_settings(MEDIA_ROOT=media.name), \
+                tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            first = self.post('key-1', url, {'image': ntf},
+                              format='multipart')
+            ntf.seek(0)
+            retry = self.post('key-1', url, {'image': ntf},
+                              format='multipart')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
@@ -0,0 +1,143 @@
+import tempfile
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.utils import media
+from recipe.models import Recipe
+
+CONTENT = b'0123456789'
+
+
+def get_image_url(recipe_id):
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
+
+class TestRecipeImageServing(TestCase):
+
+    def setUp(self) -> None:
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                            time=5, price=3)
+        self.recipe.image.save('photo.jpg', ContentFile(CONTENT))
+        self.url = get_image_url(self.recipe.id)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        response.body = b''.join(response.streaming_content) \
+            if response.streaming else response.content
+        return response
+
+    def test_whole_file(self):
+        """Test the image is sent to be revalidated with its ETag"""
+        response = self.get(HTTP_ACCEPT='image/jpeg')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.body, CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn(self.recipe.image.name.split('/')[-1],
+                      response['ETag'])
+
+    def test_versioned_url(self):
+        """Test a URL naming the current version may be cached for good"""
+        self.url = media.versioned_url(self.url, self.recipe.image)
+
+        response = self.get()
+
+        self.assertEqual(response.body, CONTENT)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_replaced_version(self):
+        """Test a URL naming a replaced version is a 404"""
+        old_url = media.versioned_url(self.url, self.recipe.image)
+        self.recipe.image.save('photo.jpg', ContentFile(CONTENT))
+
+        response = self.client.get(old_url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_range(self):
+        """Test byte ranges are answered with 206"""
+        response = self.get(HTTP_RANGE='bytes=2-4')
+        suffix = self.get(HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.body, b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(suffix.body, b'789')
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end is rejected"""
+        response = self.get(HTTP_RANGE='bytes=20-')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        """Test a Range for another version of the file is ignored"""
+        response = self.get(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.body, CONTENT)
+
+    def test_not_modified(self):
+        """Test a cached copy is confirmed without the body"""
+        etag = self.get()['ETag']
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.body, b'')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect(self):
+        """Test the proxy is told which file to send"""
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/' + self.recipe.image.name)
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_sendfile(self):
+        """Test the server is given the file's path"""
+        response = self.get()
+
+        self.assertEqual(response['X-Sendfile'], self.recipe.image.path)
+
+    def test_other_users_image(self):
+        """Test only the owner gets the image"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        self.client.force_authenticate(other)
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_no_image(self):
+        """Test a recipe without an image is a 404"""
+        recipe = Recipe.objects.create(user=self.user, name='Soup',
+                                       time=5, price=3)
+
+        response = self.client.get(get_image_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -261,6 +261,52 @@ class TestPrivateRecipeAPI(TestCase):
         self.assertIn(serializer2.data, response.data)
         self.assertNotIn(serializer3.data, response.data)
 
+    def test_recipe_filtering_time_and_price(self):
+        """Test filtering recipes by time and price ranges"""
+        quick = sample_recipe(user=self.user, name='Toast', time=5,
+                              price=2.50)
+        sample_recipe(user=self.user, name='Stew', time=90, price=4.00)
+        sample_recipe(user=self.user, name='Lobster', time=20, price=60.00)
+
+        response = self.client.get(RECIPE_URL, {
+            'time_max': 30, 'price_max': '10.00', 'price_min': '1',
+        })
+
+        self.assertEqual(response.data, [RecipeSerializer(quick).data])
+
+    def test_recipe_filtering_huge_bounds(self):
+        """Test bounds beyond what the columns hold are clamped"""
+        recipe = sample_recipe(user=self.user)
+        huge = str(10 ** 30)
+
+        everything = self.client.get(RECIPE_URL, {
+            'time_max': huge, 'price_max': huge, 'time_min': '-' + huge,
+        })
+        nothing = self.client.get(RECIPE_URL, {'price_min': huge})
+
+        self.assertEqual(everything.data, [RecipeSerializer(recipe).data])
+        self.assertEqual(nothing.data, [])
+
+    def test_recipe_ordering(self):
+        """Test ordering recipes by price with id breaking ties"""
+        cheap = sample_recipe(user=self.user, name='Toast', price=2)
+        pricey = sample_recipe(user=self.user, name='Lobster', price=60)
+        also_cheap = sample_recipe(user=self.user, name='Rice', price=2)
+
+        response = self.client.get(RECIPE_URL, {'ordering': '-price'})
+
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [pricey.id, also_cheap.id, cheap.id])
+
+    def test_recipe_invalid_parameters(self):
+        """Test malformed ranges and unknown orderings are rejected"""
+        for params in ({'time_min': 'soon'}, {'price_max': 'NaN'},
+                       {'ordering': 'user'}):
+            response = self.client.get(RECIPE_URL, params)
+
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
 
 class TestRecipeImageUpload(TestCase):
 
@@ -292,6 +338,8 @@ class TestRecipeImageUpload(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('image', response.data)
+        self.assertTrue(response.data['image'].endswith(
+            '?v=' + os.path.basename(self.recipe.image.name)))
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
     def test_recipe_image_upload_fail(self):
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from recipe.models import Recipe, Tag, Ingredient
+from recipe.utils.seed import seed, zipf_counts
+
+
+class TestSeed(TestCase):
+
+    def test_zipf_counts(self):
+        """Test recipe counts decrease with rank and keep the total"""
+        counts = zipf_counts(1000, 10, 1.1)
+
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertAlmostEqual(sum(counts), 1000, delta=10)
+
+    def test_seed(self):
+        """Test seeding users, vocabulary, recipes and links"""
+        users = seed(users=5, recipes_per_user=4, tags_per_user=3,
+                     ingredients_per_user=6, random_seed=1)
+
+        self.assertEqual(len(users), 5)
+        self.assertEqual(Tag.objects.count(), 15)
+        self.assertEqual(Ingredient.objects.count(), 30)
+        self.assertGreater(Recipe.objects.filter(user=users[0]).count(),
+                           Recipe.objects.filter(user=users[-1]).count())
+        recipe = Recipe.objects.filter(user=users[0]).first()
+        self.assertTrue(recipe.tags.exists())
+        self.assertTrue(recipe.ingredients.exists())
+        self.assertFalse(Tag.objects.filter(recipe__in=Recipe.objects.filter(
+            user=users[0])).exclude(user=users[0]).exists())
+        self.assertTrue(users[0].check_password('seed_password'))
+        self.assertEqual(users[0].email_key, users[0].email)
+
+    def test_seed_command_twice(self):
+        """Test seeding again adds new users instead of colliding"""
+        call_command('seed', users=2, recipes_per_user=1, stdout=StringIO())
+        call_command('seed', users=2, recipes_per_user=1, stdout=StringIO())
+
+        self.assertEqual(get_user_model().objects.count(), 4)
+
+
+class TestBench(TestCase):
+
+    def test_bench_saves_results(self):
+        """Test the benchmark drives every endpoint and saves results"""
+        seed(users=2, recipes_per_user=3, random_seed=1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench', requests=2, warmup=0, output=output,
+                         stdout=StringIO())
+            out = StringIO()
+            call_command('bench', requests=2, warmup=0, compare=output,
+                         scenario=['recipe-detail'], stdout=out)
+            with open(output) as fh:
+                results = json.load(fh)['results']
+
+        self.assertIn('Compared with', out.getvalue())
+        for name, result in results.items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_bench_concurrency_without_seed(self):
+        """Test the concurrency benchmark names the seeded user it lacks"""
+        with self.assertRaisesMessage(CommandError, 'rank 1'):
+            call_command('bench_concurrency', stdout=StringIO())
@@ -0,0 +1,119 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from recipe.models import Recipe, Ingredient, RecipeIngredient
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class TestShoppingListAPI(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.flour = Ingredient.objects.create(user=self.user, name='Flour')
+        self.eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        self.milk = Ingredient.objects.create(user=self.user, name='Milk')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+    def recipe(self, name, *amounts):
+        recipe = Recipe.objects.create(user=self.user, name=name, time=10,
+                                       price=5)
+        for ingredient, quantity, unit in amounts:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, quantity=quantity,
+                unit=unit)
+        return recipe
+
+    def test_merged_totals(self):
+        """Test amounts are scaled, normalised and summed per ingredient"""
+        pancakes = self.recipe('Pancakes', (self.flour, 250, 'g'),
+                               (self.eggs, 2, 'piece'),
+                               (self.milk, Decimal('0.5'), 'l'),
+                               (self.salt, None, ''))
+        bread = self.recipe('Bread', (self.flour, 1, 'kg'),
+                            (self.milk, 1, 'cup'))
+
+        response = self.client.get(SHOPPING_LIST_URL, {
+            'recipes': f'{pancakes.id}:2,{bread.id}'
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = {item['name']: item for item in response.data}
+        self.assertEqual((items['Flour']['quantity'], items['Flour']['unit']),
+                         (Decimal('1.5'), 'kg'))
+        self.assertEqual(items['Flour']['recipes'], 2)
+        self.assertEqual((items['Eggs']['quantity'], items['Eggs']['unit']),
+                         (Decimal('4'), 'piece'))
+        self.assertEqual((items['Milk']['quantity'], items['Milk']['unit']),
+                         (Decimal('1.24'), 'l'))
+        self.assertEqual((items['Salt']['quantity'], items['Salt']['unit']),
+                         (None, ''))
+
+    def test_quantity_without_unit(self):
+        """Test a quantity without a unit is counted in pieces"""
+        omelette = self.recipe('Omelette', (self.eggs, 3, ''))
+        pancakes = self.recipe('Pancakes', (self.eggs, 2, 'piece'))
+
+        response = self.client.get(SHOPPING_LIST_URL, {
+            'recipes': f'{omelette.id},{pancakes.id}'
+        })
+
+        self.assertEqual(
+            [(item['name'], item['quantity'], item['unit'], item['recipes'])
+             for item in response.data],
+            [('Eggs', Decimal('5'), 'piece', 2)])
+
+    def test_other_users_recipes(self):
+        """Test recipes of other users are not found"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        recipe = Recipe.objects.create(user=other, name='Soup', time=5,
+                                       price=3)
+
+        response = self.client.get(SHOPPING_LIST_URL,
+                                   {'recipes': str(recipe.id)})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_recipes(self):
+        """Test malformed recipe lists are rejected"""
+        for recipes in ('', 'abc', '1:0', '1:-2', '1:x'):
+            response = self.client.get(SHOPPING_LIST_URL,
+                                       {'recipes': recipes})
+
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+    def test_create_recipe_with_amounts(self):
+        """Test amounts are saved with the recipe and shown in detail"""
+        response = self.client.post(RECIPE_URL, {
+            'name': 'Omelette', 'time': 5, 'price': '2.00', 'tags': [],
+            'ingredients': [self.eggs.id],
+            'amounts': [
+                {'ingredient': self.eggs.id, 'quantity': '3',
+                 'unit': 'piece'},
+                {'ingredient': self.milk.id, 'quantity': '50',
+                 'unit': 'ml'},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(set(recipe.ingredients.all()),
+                         {self.eggs, self.milk})
+        self.assertEqual(Ingredient.objects.get(id=self.milk.id)
+                         .recipe_count, 1)
+        detail = self.client.get(
+            reverse('recipe:recipe-detail', args=[recipe.id]))
+        self.assertEqual(
+            {(amount['ingredient'], amount['unit'])
+             for amount in detail.data['amounts']},
+            {(self.eggs.id, 'piece'), (self.milk.id, 'ml')})
@@ -0,0 +1,82 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from recipe.models import Recipe, Tag
+
+STATS_URL = reverse('recipe:stats')
+
+
+# Invalidation runs on commit, which TestCase never does
+class TestStatsAPI(TransactionTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recipe(self, time, price):
+        return Recipe.objects.create(user=self.user, name='Recipe',
+                                     time=time, price=price)
+
+    def test_auth_required(self):
+        """Test stats require authentication"""
+        response = APIClient().get(STATS_URL)
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_empty(self):
+        """Test stats of a user without recipes"""
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recipes'], 0)
+        self.assertIsNone(response.data['time']['median'])
+
+    def test_stats(self):
+        """Test counts, time statistics, price buckets and top tags"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        for time, price in ((10, 3), (20, 8), (30, 8), (100, 60)):
+            self.recipe(time, price).tags.add(vegan)
+        self.recipe(15, 12).tags.add(quick)
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        Recipe.objects.create(user=other, name='Other', time=1, price=1)
+
+        data = self.client.get(STATS_URL).data
+
+        self.assertEqual(data['recipes'], 5)
+        self.assertEqual(data['time']['median'], 20)
+        self.assertEqual(data['time']['average'], 35)
+        self.assertEqual((data['time']['min'], data['time']['max']),
+                         (10, 100))
+        self.assertEqual(
+            [bucket['recipes'] for bucket in data['price']['histogram']],
+            [1, 2, 1, 0, 1])
+        self.assertEqual(data['price']['average'], Decimal('18.20'))
+        self.assertEqual(
+            [(tag['name'], tag['recipes']) for tag in data['top_tags']],
+            [('Vegan', 4), ('Quick', 1)])
+
+    def test_cached_and_invalidated(self):
+        """Test stats are cached until the user's recipes change"""
+        recipe = self.recipe(10, 5)
+        self.client.get(STATS_URL)
+
+        with self.assertNumQueries(0):
+            self.client.get(STATS_URL)
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        self.assertEqual(
+            len(self.client.get(STATS_URL).data['top_tags']), 1)
+
+        recipe.delete()
+        self.assertEqual(self.client.get(STATS_URL).data['recipes'], 0)
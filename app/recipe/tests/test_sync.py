@@ -0,0 +1,135 @@
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from recipe.models import Recipe, Tag, Ingredient, Tombstone, \
+    ChangeSequence
+
+SYNC_URL = reverse('recipe:sync')
+
+
+class TestSyncAPI(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=0, **params):
+        response = self.client.get(SYNC_URL, {'since': since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_auth_required(self):
+        """Test sync requires authentication"""
+        response = APIClient().get(SYNC_URL)
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_sequence_increases_per_user(self):
+        """Test every save takes the owner's next sequence number"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        tag.name = 'Vegetarian'
+        tag.save()
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+
+        self.assertEqual((ingredient.seq, tag.seq), (2, 3))
+        self.assertEqual(Tag.objects.create(user=other, name='Raw').seq, 1)
+
+    def test_full_and_delta_sync(self):
+        """Test only rows changed after since are returned"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        first = self.sync()
+        self.assertEqual([row['name'] for row in first['tags']], ['Vegan'])
+
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                       time=5, price=3)
+        delta = self.sync(first['seq'])
+
+        self.assertEqual(delta['tags'], [])
+        self.assertEqual([row['id'] for row in delta['ingredients']],
+                         [ingredient.id])
+        self.assertEqual([row['id'] for row in delta['recipes']],
+                         [recipe.id])
+        self.assertFalse(delta['more'])
+        self.assertEqual(self.sync(delta['seq'])['recipes'], [])
+        self.assertTrue(tag.seq <= first['seq'] < recipe.seq)
+
+    def test_link_changes_restamp_recipe(self):
+        """Test adding a tag to a recipe includes the recipe again"""
+        recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                       time=5, price=3)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        seq = self.sync()['seq']
+
+        recipe.tags.add(tag)
+
+        recipes = self.sync(seq)['recipes']
+        self.assertEqual(len(recipes), 1)
+        self.assertEqual(recipes[0]['tags'], [tag.id])
+
+    def test_deletes_leave_tombstones(self):
+        """Test deleted rows are reported by id"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(user=self.user, name='Salad',
+                                       time=5, price=3)
+        seq = self.sync()['seq']
+        tag_id, recipe_id = tag.id, recipe.id
+
+        tag.delete()
+        recipe.delete()
+
+        self.assertEqual(self.sync(seq)['deleted'], {
+            'tags': [tag_id], 'ingredients': [], 'recipes': [recipe_id],
+        })
+
+    def test_paging(self):
+        """Test large deltas are split into pages"""
+        for index in range(5):
+            Tag.objects.create(user=self.user, name=f'tag-{index}')
+
+        first = self.sync(limit=3)
+        second = self.sync(first['seq'], limit=3)
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        self.assertEqual(len(first['tags']) + len(second['tags']), 5)
+
+    def test_only_own_changes(self):
+        """Test sync returns the requesting user's changes only"""
+        other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password')
+        Tag.objects.create(user=other, name='Vegan')
+
+        self.assertEqual(self.sync()['tags'], [])
+
+    def test_user_deletion_cleans_up(self):
+        """Test deleting a user removes its counter and tombstones"""
+        Recipe.objects.create(user=self.user, name='Salad', time=5,
+                              price=3).delete()
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertFalse(ChangeSequence.objects.exists())
+
+    def test_backfill(self):
+        """Test rows without a sequence number get one"""
+        Tag.objects.bulk_create([Tag(user=self.user, name='a'),
+                                 Tag(user=self.user, name='b')])
+        Tag.objects.create(user=self.user, name='c')
+
+        call_command('sync_backfill', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Tag.objects.values_list('seq', flat=True)), [1, 2, 3])
@@ -89,6 +89,22 @@ class PrivateTagsApiTests(TestCase):
         response = self.client.post(TAGS_URL, data=data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_order_by_recipe_count(self):
+        """Test ordering tags by how many recipes use them"""
+        rare = Tag.objects.create(name='rare', user=self.user)
+        common = Tag.objects.create(name='common', user=self.user)
+        for name in ('Salad', 'Soup'):
+            recipe = Recipe.objects.create(name=name, time=5, price=3,
+                                           user=self.user)
+            recipe.tags.add(common)
+        recipe.tags.add(rare)
+        unused = Tag.objects.create(name='unused', user=self.user)
+
+        response = self.client.get(TAGS_URL, {'ordering': '-recipe_count'})
+
+        self.assertEqual([tag['id'] for tag in response.data],
+                         [common.id, rare.id, unused.id])
+
     def test_retrieve_tags_assigned_to_recipes(self):
         """Test filtering tags by those assigned to recipes"""
         tag1 = Tag.objects.create(
@@ -0,0 +1,114 @@
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from recipe.models import Recipe, Tag, Ingredient, Term, Tombstone, \
+    RecipeIngredient
+from recipe.utils import terms
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class TestTerms(TestCase):
+
+    def setUp(self) -> None:
+        terms.cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test_user@y.com', password='test_password'
+        )
+        self.other = get_user_model().objects.create_user(
+            email='other@y.com', password='test_password'
+        )
+
+    def test_normalize(self):
+        """Test case, spacing and compatibility forms are ignored"""
+        self.assertEqual(terms.normalize('  Sea   SALT '), 'sea salt')
+        self.assertEqual(terms.normalize('ﬁg'), 'fig')
+
+    def test_names_shared_across_users(self):
+        """Test the same name is interned once for every user"""
+        mine = Tag.objects.create(user=self.user, name='Vegan')
+        theirs = Tag.objects.create(user=self.other, name=' vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Vegan')
+
+        self.assertEqual(mine.term_id, theirs.term_id)
+        self.assertNotEqual(mine.term_id, ingredient.term_id)
+        self.assertEqual(Term.objects.get(pk=mine.term_id).name, 'Vegan')
+        self.assertEqual(Term.objects.count(), 2)
+
+    def test_rename_reinterns(self):
+        """Test renaming points the row at the new name's term"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tag.name = 'Raw'
+        tag.save(update_fields=['name'])
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.term.name, 'Raw')
+
+    def test_lookup_by_name(self):
+        """Test ?name= finds the user's row whatever its spelling"""
+        tag = Tag.objects.create(user=self.user, name='Sea Salt')
+        Tag.objects.create(user=self.other, name='sea salt')
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        found = client.get(TAGS_URL, {'name': 'SEA  salt'})
+        missing = client.get(TAGS_URL, {'name': 'pepper'})
+
+        self.assertEqual([row['id'] for row in found.data], [tag.id])
+        self.assertEqual(missing.data, [])
+
+    def test_intern_and_merge_command(self):
+        """Test bulk-created rows get terms and duplicates are merged"""
+        Tag.objects.bulk_create([Tag(user=self.user, name='Salt'),
+                                 Tag(user=self.user, name='salt '),
+                                 Tag(user=self.other, name='SALT')])
+        keep, duplicate, theirs = Tag.objects.order_by('id')
+        both = Recipe.objects.create(user=self.user, name='Soup', time=5,
+                                     price=3)
+        both.tags.add(keep, duplicate)
+        only = Recipe.objects.create(user=self.user, name='Stew', time=5,
+                                     price=3)
+        only.tags.add(duplicate)
+
+        call_command('intern_vocabulary', '--merge', stdout=StringIO())
+
+        self.assertEqual(
+            set(Tag.objects.values_list('term_id', flat=True)),
+            {Term.objects.get(kind=Term.TAG, normalized='salt').pk})
+        self.assertEqual(list(Tag.objects.filter(user=self.user)), [keep])
+        self.assertEqual(list(both.tags.all()), [keep])
+        self.assertEqual(list(only.tags.all()), [keep])
+        keep.refresh_from_db()
+        self.assertEqual(keep.recipe_count, 2)
+        self.assertTrue(Tombstone.objects.filter(
+            model='tag', object_id=duplicate.id).exists())
+        self.assertTrue(Tag.objects.filter(pk=theirs.pk).exists())
+
+    def test_merge_keeps_amounts(self):
+        """Test merged links keep an amount, taking one when none is set"""
+        Ingredient.objects.bulk_create([
+            Ingredient(user=self.user, name=name)
+            for name in ('Salt', 'salt ', 'SALT')])
+        keep, first, second = Ingredient.objects.order_by('id')
+        soup, stew = [Recipe.objects.create(user=self.user, name=name,
+                                            time=5, price=3)
+                      for name in ('Soup', 'Stew')]
+        for recipe, ingredient, quantity, unit in (
+                (soup, keep, None, ''), (soup, first, 5, 'g'),
+                (soup, second, 1, 'tsp'), (stew, first, 2, 'g'),
+                (stew, second, 1, 'tsp')):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, quantity=quantity,
+                unit=unit)
+
+        call_command('intern_vocabulary', '--merge', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id', 'quantity', 'unit')),
+            [(soup.id, keep.id, Decimal(5), 'g'),
+             (stew.id, keep.id, Decimal(2), 'g')])
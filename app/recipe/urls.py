@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TagViewSet, IngredientViewSet, RecipeViewSet
+from .views import TagViewSet, IngredientViewSet, RecipeViewSet, \
+    EventStreamView, EventTicketView, SyncView, StatsView
 
 app_name = 'recipe'
 
@@ -10,5 +11,9 @@ router.register('ingredient', IngredientViewSet)
 router.register('recipe', RecipeViewSet)
 
 urlpatterns = [
+    path('events/', EventStreamView.as_view(), name='events'),
+    path('events/ticket/', EventTicketView.as_view(), name='events-ticket'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('stats/', StatsView.as_view(), name='stats'),
     path('', include(router.urls))
 ]
@@ -0,0 +1,170 @@
+import random
+from collections import Counter
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from recipe.counters import COUNTED, recount
+from recipe.models import Tag, Ingredient, Recipe, ChangeSequence, Term
+from recipe.utils.units import UNITS
+
+SEED_EMAIL = 'seed-user-{}@seed.local'
+SEED_PASSWORD = 'seed_password'
+BATCH_SIZE = 2000
+
+
+def zipf_weights(count, exponent):
+    """Weights proportional to 1 / rank ** exponent"""
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def zipf_counts(total, count, exponent):
+    """Split ``total`` over ``count`` buckets following Zipf's law"""
+    weights = zipf_weights(count, exponent)
+    scale = total / sum(weights)
+    return [max(1, round(weight * scale)) for weight in weights]
+
+
+def seed_email(rank):
+    return SEED_EMAIL.format(rank)
+
+
+@transaction.atomic
+def seed(users=100, recipes_per_user=20, tags_per_user=20,
+         ingredients_per_user=50, exponent=1.1, random_seed=None,
+         password=SEED_PASSWORD, stdout=None):
+    """
+    Bulk-create ``users`` users whose recipe counts follow a Zipf
+    distribution (the first user owns the most), each with their own tags
+    and ingredients, linked to recipes with Zipf popularity.
+
+    Returns the created users ordered by rank.
+    """
+    rng = random.Random(random_seed)
+    User = get_user_model()
+    # Hashing is the slowest part of creating users; every seeded user
+    # shares the same password, so hash it once
+    hashed = make_password(password)
+    start = User.objects.filter(email__startswith='seed-user-').count()
+    last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+    # bulk_create skips User.save, so key the emails here
+    User.objects.bulk_create([
+        User(email=seed_email(start + rank), name=f'Seed {start + rank}',
+             password=hashed,
+             email_key=User.objects.email_key(seed_email(start + rank)))
+        for rank in range(1, users + 1)
+    ])
+    created = list(User.objects.filter(
+        id__gt=last_id, email__startswith='seed-user-'
+    ).order_by('id'))
+    user_ids = [user.id for user in created]
+    # bulk_create skips SyncedModel.save, so number the changes here
+    seqs = Counter()
+
+    def next_seq(user_id):
+        seqs[user_id] += 1
+        return seqs[user_id]
+
+    # Every user shares the same vocabulary, interned once
+    tag_terms = [Term.objects.intern(Term.TAG, f'tag-{index}')
+                 for index in range(tags_per_user)]
+    ingredient_terms = [
+        Term.objects.intern(Term.INGREDIENT, f'ingredient-{index}')
+        for index in range(ingredients_per_user)
+    ]
+    _bulk(stdout, 'tags', Tag, (
+        Tag(user_id=user_id, name=f'tag-{index}', term_id=term_id,
+            seq=next_seq(user_id))
+        for user_id in user_ids
+        for index, term_id in enumerate(tag_terms)
+    ))
+    _bulk(stdout, 'ingredients', Ingredient, (
+        Ingredient(user_id=user_id, name=f'ingredient-{index}',
+                   term_id=term_id, seq=next_seq(user_id))
+        for user_id in user_ids
+        for index, term_id in enumerate(ingredient_terms)
+    ))
+    counts = zipf_counts(users * recipes_per_user, users, exponent)
+    _bulk(stdout, 'recipes', Recipe, (
+        Recipe(user_id=user_id, name=f'recipe-{index}',
+               time=rng.randint(5, 180),
+               price=Decimal(rng.randint(100, 50000)) / 100,
+               seq=next_seq(user_id))
+        for user_id, count in zip(user_ids, counts)
+        for index in range(count)
+    ))
+
+    ChangeSequence.objects.bulk_create([
+        ChangeSequence(user_id=user_id, last=last)
+        for user_id, last in seqs.items()
+    ])
+
+    tags = _ids_by_user(Tag, user_ids)
+    ingredients = _ids_by_user(Ingredient, user_ids)
+    recipes = _ids_by_user(Recipe, user_ids)
+    tag_weights = zipf_weights(tags_per_user, exponent)
+    ingredient_weights = zipf_weights(ingredients_per_user, exponent)
+
+    def links(vocabulary, weights, low, high, field):
+        for user_id in user_ids:
+            choices = vocabulary[user_id]
+            if not choices:
+                continue
+            for recipe_id in recipes[user_id]:
+                picked = set(rng.choices(choices, weights,
+                                         k=rng.randint(low, high)))
+                for target_id in picked:
+                    yield {'recipe_id': recipe_id, field: target_id}
+
+    _bulk(stdout, 'recipe tags', Recipe.tags.through, (
+        Recipe.tags.through(**row)
+        for row in links(tags, tag_weights, 1, 3, 'tag_id')
+    ))
+    units = list(UNITS)
+    _bulk(stdout, 'recipe ingredients', Recipe.ingredients.through, (
+        Recipe.ingredients.through(**row, quantity=rng.randint(1, 500),
+                                   unit=rng.choice(units))
+        for row in links(ingredients, ingredient_weights, 2, 8,
+                         'ingredient_id')
+    ))
+    # The links were bulk-created too, bypassing the counter signals
+    for model, relation, target_field in COUNTED:
+        recount(model, relation, target_field)
+    return created
+
+
+def _bulk(stdout, label, model, objects):
+    """
+    bulk_create a generator in chunks without materialising it; Django
+    splits each chunk further to respect the backend's parameter limit
+    """
+    total = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        total += len(batch)
+    if stdout is not None:
+        stdout.write(f'Created {total} {label}')
+    return total
+
+
+def _ids_by_user(model, user_ids):
+    """Map user id -> ids of the user's rows, in creation order"""
+    ids = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return ids
+    # A range rather than IN keeps SQLite under its parameter limit
+    rows = model.objects.filter(
+        user_id__gte=user_ids[0], user_id__lte=user_ids[-1]
+    ).order_by('id').values_list('user_id', 'id')
+    for user_id, pk in rows.iterator():
+        if user_id in ids:
+            ids[user_id].append(pk)
+    return ids
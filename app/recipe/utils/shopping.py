@@ -0,0 +1,57 @@
+from decimal import Decimal
+from django.db.models import Case, CharField, Count, DecimalField, \
+    ExpressionWrapper, F, Sum, Value, When
+from recipe.models import RecipeIngredient
+from .units import BARE_UNIT, UNITS, display_quantity
+
+AMOUNT = DecimalField(max_digits=24, decimal_places=6)
+
+
+def shopping_list(user, servings):
+    """
+    Merged ingredient totals for the recipes in ``servings`` (recipe id ->
+    multiplier), converted to one unit per dimension and summed in a
+    single grouped query. An ingredient measured in different dimensions,
+    e.g. grams and pieces, gets one line per dimension. A quantity without
+    a unit counts in ``BARE_UNIT``.
+    """
+    bare_dimension, bare_size = UNITS[BARE_UNIT]
+    dimension = Case(
+        When(unit='', quantity__isnull=False,
+             then=Value(bare_dimension)),
+        *(When(unit=unit, then=Value(dimension))
+          for unit, (dimension, _) in UNITS.items()),
+        default=Value(''), output_field=CharField(),
+    )
+    size = Case(
+        When(unit='', then=Value(bare_size)),
+        *(When(unit=unit, then=Value(size))
+          for unit, (_, size) in UNITS.items()),
+        output_field=AMOUNT,
+    )
+    multiplier = Case(
+        *(When(recipe_id=pk, then=Value(Decimal(factor)))
+          for pk, factor in servings.items()),
+        output_field=AMOUNT,
+    )
+    rows = RecipeIngredient.objects.filter(
+        recipe__user=user, recipe_id__in=list(servings)
+    ).annotate(dimension=dimension).values(
+        'ingredient_id', 'ingredient__name', 'dimension'
+    ).annotate(
+        total=Sum(ExpressionWrapper(F('quantity') * size * multiplier,
+                                    output_field=AMOUNT)),
+        recipes=Count('recipe_id'),
+    ).order_by('ingredient__name', 'ingredient_id', 'dimension')
+
+    items = []
+    for row in rows:
+        quantity, unit = display_quantity(row['dimension'], row['total'])
+        items.append({
+            'ingredient': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'quantity': quantity,
+            'unit': unit,
+            'recipes': row['recipes'],
+        })
+    return items
@@ -0,0 +1,91 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from recipe.models import Tag, Ingredient, Recipe
+
+STATS_KEY = 'recipe-stats:{}'
+# Upper bounds of the price histogram buckets; the last bucket is open
+PRICE_BUCKETS = (Decimal('5'), Decimal('10'), Decimal('20'), Decimal('50'))
+TOP = 10
+
+
+def _round(value):
+    return None if value is None else round(Decimal(value), 2)
+
+
+def compute_stats(user):
+    """Cookbook statistics of ``user`` from four aggregate queries"""
+    recipes = Recipe.objects.filter(user=user)
+    bounds = (Decimal(0),) + PRICE_BUCKETS + (None,)
+    buckets = {
+        f'bucket_{index}': Count('id', filter=Q(
+            price__gte=low, **({'price__lt': high} if high else {})))
+        for index, (low, high) in enumerate(zip(bounds, bounds[1:]))
+    }
+    totals = recipes.aggregate(
+        count=Count('id'), time_avg=Avg('time'), time_min=Min('time'),
+        time_max=Max('time'), price_avg=Avg('price'),
+        price_min=Min('price'), price_max=Max('price'), **buckets
+    )
+
+    # Median from the one or two middle rows of the (user, time) index
+    count = totals['count']
+    middle = list(recipes.order_by('time', 'id').values_list(
+        'time', flat=True)[(count - 1) // 2:count // 2 + 1]) if count else []
+
+    def top(model):
+        return [
+            {'id': pk, 'name': name, 'recipes': recipe_count}
+            for pk, name, recipe_count in model.objects.filter(
+                user=user, recipe_count__gt=0
+            ).order_by('-recipe_count', 'id').values_list(
+                'id', 'name', 'recipe_count')[:TOP]
+        ]
+
+    return {
+        'recipes': count,
+        'time': {
+            'average': _round(totals['time_avg']),
+            'median': _round(sum(middle) / len(middle)) if middle else None,
+            'min': totals['time_min'],
+            'max': totals['time_max'],
+        },
+        'price': {
+            'average': _round(totals['price_avg']),
+            'min': totals['price_min'],
+            'max': totals['price_max'],
+            'histogram': [
+                {'min': low, 'max': high, 'recipes': totals[key]}
+                for key, low, high in zip(buckets, bounds, bounds[1:])
+            ],
+        },
+        'top_tags': top(Tag),
+        'top_ingredients': top(Ingredient),
+    }
+
+
+def get_stats(user):
+    key = STATS_KEY.format(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats(user)
+        cache.set(key, stats, settings.STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate(user_id):
+    """Drop a user's cached stats once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(STATS_KEY.format(user_id)))
+
+
+def invalidate_saved(sender, instance, **kwargs):
+    """post_save/post_delete of recipes, tags and ingredients"""
+    invalidate(instance.user_id)
+
+
+def invalidate_links_changed(sender, instance, action, **kwargs):
+    """m2m_changed: the instance's owner also owns the other side"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate(instance.user_id)
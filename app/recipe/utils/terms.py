@@ -0,0 +1,46 @@
+import threading
+import unicodedata
+from collections import OrderedDict
+from django.conf import settings
+
+
+def normalize(name):
+    """The form names are interned under: NFKC, case folded, single spaced"""
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+class LRUCache:
+    """A small thread safe least-recently-used mapping"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# (kind, normalized name) -> Term id of the hot vocabulary. Terms are
+# never changed or deleted, so entries can't go stale
+cache = LRUCache(settings.TERM_CACHE_SIZE)
+
+
+def clear_cache(**kwargs):
+    """post_migrate: flush (tests included) may have removed the terms"""
+    cache.clear()
@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+# unit -> (dimension, size in the dimension's base unit)
+UNITS = {
+    'mg': ('mass', Decimal('0.001')),
+    'g': ('mass', Decimal('1')),
+    'kg': ('mass', Decimal('1000')),
+    'oz': ('mass', Decimal('28.349523')),
+    'lb': ('mass', Decimal('453.59237')),
+    'ml': ('volume', Decimal('1')),
+    'l': ('volume', Decimal('1000')),
+    'tsp': ('volume', Decimal('4.928922')),
+    'tbsp': ('volume', Decimal('14.786765')),
+    'cup': ('volume', Decimal('240')),
+    'piece': ('count', Decimal('1')),
+}
+UNIT_CHOICES = [(unit, unit) for unit in UNITS]
+# What a quantity without a unit counts, e.g. "3 eggs"
+BARE_UNIT = 'piece'
+
+# dimension -> base unit, then larger units worth switching to
+DISPLAY_UNITS = {
+    'mass': ('g', [('kg', Decimal('1000'))]),
+    'volume': ('ml', [('l', Decimal('1000'))]),
+    'count': ('piece', []),
+}
+
+
+def display_quantity(dimension, total):
+    """Express a total in base units in the most readable unit"""
+    if total is None or dimension not in DISPLAY_UNITS:
+        return None, ''
+    unit, larger = DISPLAY_UNITS[dimension]
+    for candidate, size in larger:
+        if total >= size:
+            unit, total = candidate, total / size
+    return Decimal(total).quantize(Decimal('0.01')), unit
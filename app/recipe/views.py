@@ -1,11 +1,138 @@
 from .serializers import TagSerializer, IngredientSerializer, \
     RecipeSerializer, RecipeDetailSerializer, RecipeImageSerializer
-from rest_framework import viewsets, mixins, status
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import viewsets, mixins, status, serializers
+from rest_framework.views import APIView
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ParseError, NotFound
 from rest_framework.permissions import IsAuthenticated
-from .models import Tag, Ingredient, Recipe
+from rest_framework.renderers import JSONRenderer
+from .models import Tag, Ingredient, Recipe, Term
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from core.idempotency import idempotent
+from core.utils import media
+from . import documents, events, sync
+from .utils.shopping import shopping_list
+from .utils.stats import get_stats
+
+
+def _parameters_to_integers(params: str):
+    """Converting parameter string to a list of integers"""
+    return [int(param) for param in params.split(',')]
+
+
+# ?ordering= values for tags and ingredients; the recipe_count ones walk
+# the popularity index instead of counting links
+ATTR_ORDERINGS = {
+    'name': ('name',),
+    '-name': ('-name',),
+    'recipe_count': ('recipe_count', '-id'),
+    '-recipe_count': ('-recipe_count', 'id'),
+}
+
+
+def filter_recipe_attrs(queryset, user, query_params):
+    """
+    Tags or ingredients of ``user``, optionally only assigned ones or
+    those spelled like ``?name=`` give or take case and spacing
+    """
+    assigned_only = bool(int(query_params.get('assigned_only', 0)))
+    if assigned_only:
+        queryset = queryset.filter(recipe_count__gt=0)
+
+    name = query_params.get('name')
+    if name is not None:
+        term = Term.objects.lookup(queryset.model.TERM_KIND, name)
+        queryset = queryset.filter(term_id=term) if term is not None \
+            else queryset.none()
+
+    ordering = ATTR_ORDERINGS.get(query_params.get('ordering'),
+                                  ATTR_ORDERINGS['-name'])
+    return queryset.filter(user=user).order_by(*ordering)
+
+
+# ?ordering= values for recipes. id breaks ties so pages stay stable while
+# rows are added, and matches the (user, time|price, id) indexes
+RECIPE_ORDERINGS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'time': ('time', 'id'),
+    '-time': ('-time', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+
+
+def _to_decimal(param: str):
+    """Converting a parameter to a finite Decimal"""
+    number = Decimal(param)
+    if not number.is_finite():
+        raise ValueError(param)
+    return number
+
+
+def _parse_servings(param: str):
+    """``12:2,15,18:0.5`` -> {12: 2, 15: 1, 18: 0.5} as Decimals"""
+    servings = {}
+    for item in param.replace(' ', '').split(','):
+        if not item:
+            continue
+        pk, _, factor = item.partition(':')
+        factor = _to_decimal(factor or '1')
+        if factor <= 0:
+            raise ValueError(item)
+        servings[int(pk)] = servings.get(int(pk), 0) + factor
+    return servings
+
+
+SHOPPING_LIST_MAX_RECIPES = 100
+
+# Largest values the time and price columns hold
+MAX_TIME = 2 ** 31 - 1
+MAX_PRICE = Decimal('99999999.99')
+
+# ?<parameter>= bounds: (lookup, parser, limit); values beyond the limit
+# are clamped to it, the database would overflow on them
+RECIPE_RANGES = {
+    'time_min': ('time__gte', int, MAX_TIME),
+    'time_max': ('time__lte', int, MAX_TIME),
+    'price_min': ('price__gte', _to_decimal, MAX_PRICE),
+    'price_max': ('price__lte', _to_decimal, MAX_PRICE),
+}
+
+
+def filter_recipes(queryset, user, query_params):
+    """
+    Recipes of ``user`` filtered by the tags/ingredients and range
+    parameters, in the requested ordering
+    """
+    tags = query_params.get('tags')
+    ingredients = query_params.get('ingredients')
+    if tags:
+        tag_ids = _parameters_to_integers(tags)
+        queryset = queryset.filter(tags__id__in=tag_ids)
+
+    if ingredients:
+        ingredient_ids = _parameters_to_integers(ingredients)
+        queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+
+    for parameter, (lookup, parse, limit) in RECIPE_RANGES.items():
+        value = query_params.get(parameter)
+        if value is None:
+            continue
+        try:
+            value = max(-limit, min(parse(value), limit))
+        except (ValueError, ArithmeticError):
+            raise ParseError(f'{parameter} must be a number')
+        queryset = queryset.filter(**{lookup: value})
+
+    ordering = query_params.get('ordering', 'id')
+    if ordering not in RECIPE_ORDERINGS:
+        raise ParseError('ordering must be one of '
+                         + ', '.join(RECIPE_ORDERINGS))
+    return queryset.filter(user=user).order_by(*RECIPE_ORDERINGS[ordering])
 
 
 class BaseRecipeAttrViewset(viewsets.GenericViewSet,
@@ -17,16 +144,9 @@ class BaseRecipeAttrViewset(viewsets.GenericViewSet,
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
+        return filter_recipe_attrs(
+            self.queryset, self.request.user, self.request.query_params
         )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
 
     def perform_create(self, serializer):
         """Create a new object"""
@@ -52,24 +172,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
-    def _parameters_to_integers(self, params: str):
-        """Converting parameter string to a list of integers"""
-        return [int(param) for param in params.split(',')]
-
     def get_queryset(self):
         """Return queryset containing recipes"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._parameters_to_integers(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-
-        if ingredients:
-            ingredient_ids = self._parameters_to_integers(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(user=self.request.user)
+        return filter_recipes(
+            self.queryset, self.request.user, self.request.query_params
+        )
 
     def get_serializer_class(self):
         """Return the appropriate serializer class"""
@@ -79,11 +186,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeImageSerializer
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """The stored list document when nothing is filtered"""
+        if documents.usable(request):
+            return documents.DocumentResponse(
+                documents.summaries(request.user))
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """The stored detail document while it is current"""
+        if documents.usable(request):
+            try:
+                document = documents.detail(request.user, kwargs['pk'])
+            except ValueError:
+                raise NotFound()
+            if document is not None:
+                return documents.DocumentResponse(document)
+            response = super().retrieve(request, *args, **kwargs)
+            documents.schedule([response.data['id']])
+            return response
+        return super().retrieve(request, *args, **kwargs)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Save a recipe in db"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Merged ingredient amounts of ?recipes=<id>[:<servings>],..."""
+        try:
+            servings = _parse_servings(request.query_params.get('recipes',
+                                                                ''))
+        except (ValueError, ArithmeticError):
+            raise ParseError('recipes must look like 12:2,15,18:0.5')
+        if not servings:
+            raise ParseError('recipes is required')
+        if len(servings) > SHOPPING_LIST_MAX_RECIPES:
+            raise ParseError(f'At most {SHOPPING_LIST_MAX_RECIPES} recipes')
+
+        owned = Recipe.objects.filter(user=request.user, id__in=servings) \
+            .values_list('id', flat=True)
+        missing = set(servings) - set(owned)
+        if missing:
+            raise NotFound(f'No recipes {sorted(missing)}')
+        return Response(data=shopping_list(request.user, servings))
+
+    @action(methods=['GET'], detail=True, url_path='image',
+            renderer_classes=[JSONRenderer, media.FileRenderer])
+    def image(self, request, pk=None):
+        """
+        The recipe's image, to its owner only; ``?v=`` of another version
+        is a 404
+        """
+        recipe = self.get_object()
+        if not recipe.image:
+            raise NotFound('This recipe has no image')
+        requested = request.query_params.get(media.VERSION_PARAM)
+        if requested is not None \
+                and requested != media.version(recipe.image):
+            raise NotFound('This image was replaced')
+        return media.serve(request, recipe.image,
+                           immutable=requested is not None)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
+    @idempotent
     def upload_image(self, request, pk=None):
         """upload images for recipe"""
         recipe = self.get_object()
@@ -102,3 +276,81 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class EventStreamView(APIView):
+    """
+    Change feed as server-sent events. app/asgi.py keeps the stream open;
+    this WSGI fallback answers with the missed events and closes, so
+    EventSource clients reconnect after ``retry`` like a long poll
+    """
+    authentication_classes = (TokenAuthentication,
+                              events.TicketAuthentication)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (events.EventStreamRenderer,)
+
+    def get(self, request):
+        content, _ = events.replay(
+            events.get_broker(), request.user.id,
+            request.META.get('HTTP_LAST_EVENT_ID')
+        )
+        response = Response(content)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class EventTicketView(APIView):
+    """Short-lived ``?ticket=`` for opening the change feed"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        return Response(data={
+            'ticket': events.issue_ticket(request.user),
+            'expires_in': settings.EVENTS_TICKET_SECONDS,
+        })
+
+
+class SyncView(APIView):
+    """
+    Everything that changed after ``?since=<seq>`` (0 for a full sync), in
+    pages of at most ``SYNC_PAGE_SIZE`` changes. Request the next page
+    with ``since`` set to the returned ``seq`` while ``more`` is true.
+    Deleted tags and ingredients are not removed from the ``tags`` and
+    ``ingredients`` of recipes sent earlier; clients drop them locally
+    """
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit',
+                                                 settings.SYNC_PAGE_SIZE))
+        except ValueError:
+            raise serializers.ValidationError(
+                'since and limit must be integers')
+        limit = max(1, min(limit, settings.SYNC_PAGE_SIZE))
+
+        changes, seq, more = sync.changes_since(request.user, since, limit)
+        deleted = {name + 's': [] for name in sync.SYNCED_MODELS}
+        for tombstone in changes['deleted']:
+            deleted[tombstone.model + 's'].append(tombstone.object_id)
+        return Response(data={
+            'seq': seq,
+            'more': more,
+            'tags': TagSerializer(changes['tags'], many=True).data,
+            'ingredients': IngredientSerializer(
+                changes['ingredients'], many=True).data,
+            'recipes': RecipeSerializer(changes['recipes'], many=True).data,
+            'deleted': deleted,
+        })
+
+
+class StatsView(APIView):
+    """Cookbook statistics for the dashboard, cached per user"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response(data=get_stats(request.user))
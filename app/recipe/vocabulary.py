@@ -0,0 +1,97 @@
+"""
+Moving existing tags and ingredients onto the shared Term dictionary.
+
+Rows created before terms existed, or with bulk_create(), have no term
+yet; ``intern`` fills it in, one UPDATE per distinct name. A user's rows
+that turn out to share a term ("Salt" and "salt ") are then duplicates:
+``merge_duplicates`` moves their recipes onto the oldest row and deletes
+the rest, which leaves tombstones for sync like any other delete. A
+recipe linked to several of them keeps one link, with the amount of the
+oldest row's link, or of another one when that has none.
+"""
+from django.db import router, transaction
+from django.db.models import Count, Min
+from . import documents, sync
+from .counters import recount
+from .models import Recipe, Term
+
+
+def intern(model):
+    """Give rows of ``model`` without a term theirs, return how many"""
+    updated = 0
+    names = model.objects.filter(term__isnull=True).order_by() \
+        .values_list('name', flat=True).distinct()
+    for name in list(names):
+        term_id = Term.objects.intern(model.TERM_KIND, name)
+        updated += model.objects.filter(term__isnull=True, name=name) \
+            .update(term_id=term_id)
+    return updated
+
+
+# Link fields describing how much a recipe needs (RecipeIngredient)
+AMOUNT_FIELDS = ('quantity', 'unit')
+
+
+def _fold_links(through, target_field, keep, duplicates):
+    """
+    Move the links of ``duplicates`` onto ``keep``, one per recipe, and
+    return the ids of the recipes concerned
+    """
+    names = {field.name for field in through._meta.fields}
+    amounts = [name for name in AMOUNT_FIELDS if name in names]
+    links = list(through.objects.filter(
+        **{f'{target_field}__in': duplicates}).order_by('pk'))
+    recipe_ids = {link.recipe_id for link in links}
+    survivors = {link.recipe_id: link for link in through.objects.filter(
+        recipe_id__in=recipe_ids, **{target_field: keep})}
+
+    moved, folded, filled = [], [], {}
+    for link in links:
+        survivor = survivors.get(link.recipe_id)
+        if survivor is None:
+            survivors[link.recipe_id] = link
+            moved.append(link.pk)
+            continue
+        folded.append(link.pk)
+        if amounts and survivor.quantity is None \
+                and link.quantity is not None:
+            survivor.quantity = link.quantity
+            filled[survivor.pk] = {name: getattr(link, name)
+                                   for name in amounts}
+
+    through.objects.filter(pk__in=folded).delete()
+    through.objects.filter(pk__in=moved).update(**{target_field: keep})
+    for pk, values in filled.items():
+        through.objects.filter(pk=pk).update(**values)
+    return recipe_ids
+
+
+def merge_duplicates(model, relation, target_field):
+    """
+    Fold each user's rows sharing a term into the oldest one and return
+    how many rows were removed
+    """
+    through = getattr(Recipe, relation).through
+    groups = model.objects.filter(term__isnull=False).order_by() \
+        .values('user_id', 'term_id') \
+        .annotate(rows=Count('id'), keep=Min('id')).filter(rows__gt=1)
+
+    removed = 0
+    for group in list(groups):
+        keep = group['keep']
+        with transaction.atomic(using=router.db_for_write(model)):
+            duplicates = list(model.objects.filter(
+                user_id=group['user_id'], term_id=group['term_id']
+            ).exclude(pk=keep).values_list('pk', flat=True))
+            recipe_ids = _fold_links(through, target_field, keep,
+                                     duplicates)
+
+            sync.restamp(Recipe.objects.filter(pk__in=recipe_ids)
+                         .values_list('pk', 'user_id'))
+            documents.schedule(recipe_ids)
+            for duplicate in model.objects.filter(pk__in=duplicates):
+                duplicate.delete()
+            removed += len(duplicates)
+    if removed:
+        recount(model, relation, target_field)
+    return removed